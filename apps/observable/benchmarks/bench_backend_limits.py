@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Overload benchmark for the backend limiter
+Runs a local stand-in backend with few slots, load-dependent latency and 503s past an in-flight cap, and sends it the same burst with plain urllib3 retries and through backend_limits.py
+
+Usage: python benchmarks/bench_backend_limits.py [--threads 32] [--processes 1,4] [--requests 800]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import argparse
+import threading
+import multiprocessing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data'))
+
+# The limiter shares its state through LOADER_STATE_DIR; keep the benchmark's apart
+os.environ.setdefault('LOADER_STATE_DIR', tempfile.mkdtemp(prefix='bench-limits-'))
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import backend_limits
+
+
+BACKEND = 'bench'
+
+
+class StandIn:
+    """Backend with slots worth of parallel capacity that rejects requests past reject_above in flight"""
+    
+    def __init__(self, slots: int, service_seconds: float, reject_above: int):
+        self.slots = slots
+        self.service_seconds = service_seconds
+        self.reject_above = reject_above
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.counters = {'served': 0, 'rejected': 0}
+        
+        stand_in = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                with stand_in.lock:
+                    stand_in.in_flight += 1
+                    load = stand_in.in_flight
+                try:
+                    if load > stand_in.reject_above:
+                        status = 503
+                    else:
+                        # Requests beyond the slots queue up, so latency grows with load
+                        time.sleep(stand_in.service_seconds * max(1.0, load / stand_in.slots))
+                        status = 200
+                    with stand_in.lock:
+                        stand_in.counters['served' if status == 200 else 'rejected'] += 1
+                    self.send_response(status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                finally:
+                    with stand_in.lock:
+                        stand_in.in_flight -= 1
+            
+            def log_message(self, format, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/query"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def reset(self) -> None:
+        with self.lock:
+            self.counters = {'served': 0, 'rejected': 0}
+
+
+def session(limited: bool) -> requests.Session:
+    """A loader-style session with urllib3 status retries or the limiter adapter"""
+    s = requests.Session()
+    if limited:
+        adapter = backend_limits.LimitedAdapter(BACKEND, max_retries=Retry(total=3, backoff_factor=0.5))
+    else:
+        adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[503],
+                                                raise_on_status=False))
+    s.mount('http://', adapter)
+    return s
+
+
+def client(url: str, limited: bool, threads: int, requests_total: int) -> int:
+    """Send requests_total GETs from threads threads sharing one session; returns the successes"""
+    s = session(limited)
+    successes = [0] * threads
+    
+    def worker(i: int) -> None:
+        for _ in range(i, requests_total, threads):
+            try:
+                if s.get(url, timeout=30).status_code == 200:
+                    successes[i] += 1
+            except requests.exceptions.RequestException:
+                pass
+    
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return sum(successes)
+
+
+def _client(args) -> int:
+    return client(*args)
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32, help='client threads in total, split over the processes')
+    parser.add_argument('--processes', default='1,4', help='comma-separated client process counts, like separate loaders')
+    parser.add_argument('--requests', type=int, default=800, help='requests per run')
+    parser.add_argument('--slots', type=int, default=4, help='requests the stand-in serves in parallel at base latency')
+    parser.add_argument('--service-ms', type=float, default=20.0, help='stand-in base latency')
+    parser.add_argument('--reject-above', type=int, default=12, help='in-flight requests past which the stand-in returns 503')
+    args = parser.parse_args()
+    
+    # Generous rate so the benchmark exercises the concurrency limit
+    os.environ.setdefault(f'{BACKEND.upper()}_MAX_RPS', '1000')
+    os.environ.setdefault(f'{BACKEND.upper()}_BURST', '50')
+    os.environ.setdefault(f'{BACKEND.upper()}_MAX_CONCURRENCY', '16')
+    
+    stand_in = StandIn(args.slots, args.service_ms / 1000, args.reject_above)
+    print(f"stand-in: {args.slots} slots, {args.service_ms:.0f} ms base latency, 503 past {args.reject_above} in flight")
+    context = multiprocessing.get_context('spawn')
+    
+    for processes in [int(count) for count in args.processes.split(',')]:
+        for limited in (False, True):
+            stand_in.reset()
+            per_process = max(1, args.threads // processes)
+            jobs = [(stand_in.url, limited, per_process, args.requests // processes) for _ in range(processes)]
+            started = time.perf_counter()
+            if processes == 1:
+                successes = _client(jobs[0])
+            else:
+                with context.Pool(processes) as pool:
+                    successes = sum(pool.map(_client, jobs))
+            seconds = time.perf_counter() - started
+            label = 'limiter' if limited else 'urllib3 retries'
+            print(f"{processes:>2} processes x {per_process:>2} threads  {label:16} {successes:>5} ok of "
+                  f"{args.requests}  {successes / seconds:7.1f} ok/s  {stand_in.counters['rejected']:>5} rejected")
+
+
+if __name__ == "__main__":
+    main()
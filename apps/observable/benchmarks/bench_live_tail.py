@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark for the live tail's Loki websocket path
+Runs a local stand-in for Loki's tail websocket that fragments messages, splits frames across reads, pings and drops the connection midway, and measures what LokiTailSource publishes
+
+Usage: python benchmarks/bench_live_tail.py [--entries 20000] [--rate 5000] [--per-message 50] [--chunk-bytes 700]
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import socket
+import hashlib
+import tempfile
+import argparse
+import threading
+import socketserver
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data'))
+
+# Flushes assign templates from LOADER_STATE_DIR; keep the benchmark's apart
+os.environ.setdefault('LOADER_STATE_DIR', tempfile.mkdtemp(prefix='bench-live-tail-'))
+
+import live_tail
+
+
+SERVICES = ['api-gateway', 'auth-service', 'payment-service', 'user-service']
+LEVELS = ['info', 'info', 'info', 'warning', 'error']
+
+
+def frame(opcode: int, payload: bytes, fin: bool = True) -> bytes:
+    """Unmasked server frame, with the 16- or 64-bit length forms when needed"""
+    header = bytearray([(0x80 if fin else 0) | opcode])
+    if len(payload) < 126:
+        header.append(len(payload))
+    elif len(payload) < 1 << 16:
+        header.append(126)
+        header.extend(len(payload).to_bytes(2, 'big'))
+    else:
+        header.append(127)
+        header.extend(len(payload).to_bytes(8, 'big'))
+    return bytes(header) + payload
+
+
+def read_frame(rfile) -> Dict[str, Any]:
+    """Next masked client frame as opcode and unmasked payload"""
+    head = rfile.read(2)
+    if len(head) < 2:
+        raise ConnectionError("client closed")
+    length = head[1] & 0x7F
+    if length >= 126:
+        length = int.from_bytes(rfile.read(2 if length == 126 else 8), 'big')
+    mask = rfile.read(4) if head[1] & 0x80 else b'\0\0\0\0'
+    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(rfile.read(length)))
+    return {'opcode': head[0] & 0x0F, 'payload': payload, 'masked': bool(head[1] & 0x80)}
+
+
+class StandIn:
+    """Loki tail stand-in streaming a fixed sequence of entries over one or more connections
+    
+    Each tail message is cut into fragment_bytes continuation frames, the
+    frames of a message are written chunk_bytes at a time with Nagle disabled
+    so the client sees frames split across reads, and every ping_every
+    messages a ping is sent whose pong must echo it. The first connection is
+    dropped after drop_after entries; the reconnect resends overlap entries
+    from before the drop, as Loki does when a tail resumes from its start
+    timestamp.
+    """
+    
+    def __init__(self, entries: int, rate: float, per_message: int, fragment_bytes: int,
+                 chunk_bytes: int, ping_every: int, drop_after: int, overlap: int):
+        self.entries = entries
+        self.rate = rate
+        self.per_message = per_message
+        self.fragment_bytes = fragment_bytes
+        self.chunk_bytes = chunk_bytes
+        self.ping_every = ping_every
+        self.drop_after = drop_after
+        self.overlap = overlap
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.connections = 0
+        self.pings = 0
+        self.pongs = 0
+        self.bad_pongs = 0
+        self.sent_ns: List[int] = []
+        self.done = threading.Event()
+        
+        stand_in = self
+        
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                stand_in.serve(self)
+        
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def _handshake(self, handler) -> bool:
+        request = handler.rfile.readline().decode('latin-1')
+        headers = {}
+        for line in iter(handler.rfile.readline, b'\r\n'):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        if not request.startswith('GET /loki/api/v1/tail?') or 'sec-websocket-key' not in headers:
+            handler.wfile.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(
+            (headers['sec-websocket-key'] + live_tail.WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        handler.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode('ascii'))
+        return True
+    
+    def _read_pongs(self, handler) -> None:
+        while True:
+            try:
+                received = read_frame(handler.rfile)
+            except (OSError, ConnectionError):
+                return
+            if received['opcode'] == 0x8:
+                return
+            with self.lock:
+                if received['opcode'] == 0xA and received['masked'] and received['payload'].startswith(b'ping-'):
+                    self.pongs += 1
+                else:
+                    self.bad_pongs += 1
+    
+    def _message(self, first: int, count: int) -> bytes:
+        """Tail message holding entries first..first+count, stamped now"""
+        now_ns = time.time_ns()
+        streams: Dict[str, Dict[str, Any]] = {}
+        for index in range(first, first + count):
+            if index >= len(self.sent_ns):
+                self.sent_ns.append(now_ns + index % count)
+            service = SERVICES[index % len(SERVICES)]
+            level = LEVELS[index % len(LEVELS)]
+            stream = streams.setdefault(service, {'stream': {'service_name': service, 'job': 'bench'}, 'values': []})
+            stream['values'].append([str(self.sent_ns[index]), json.dumps({
+                'level': level, 'message': f"request {index} to /api/v1/orders finished with {level}"})])
+        return json.dumps({'streams': list(streams.values())}).encode('utf-8')
+    
+    def _write(self, sock: socket.socket, data: bytes) -> None:
+        for offset in range(0, len(data), self.chunk_bytes):
+            sock.sendall(data[offset:offset + self.chunk_bytes])
+    
+    def serve(self, handler) -> None:
+        if not self._handshake(handler):
+            return
+        sock = handler.connection
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=self._read_pongs, args=(handler,), daemon=True).start()
+        with self.lock:
+            self.connections += 1
+            first_connection = self.connections == 1
+            position = 0 if first_connection else max(0, self.sent - self.overlap)
+        last = self.drop_after if first_connection else self.entries
+        
+        started, resumed = time.monotonic(), position
+        messages = 0
+        try:
+            while position < last:
+                count = min(self.per_message, last - position)
+                payload = self._message(position, count)
+                fragments = [payload[i:i + self.fragment_bytes] for i in range(0, len(payload), self.fragment_bytes)]
+                data = b''.join(frame(0x1 if i == 0 else 0x0, fragment, fin=i == len(fragments) - 1)
+                                for i, fragment in enumerate(fragments))
+                messages += 1
+                # No ping rides on the last write before a drop, where its pong could be lost
+                final = first_connection and position + count >= last
+                if self.ping_every and messages % self.ping_every == 0 and not final:
+                    data += frame(0x9, f"ping-{messages}".encode('ascii'))
+                    with self.lock:
+                        self.pings += 1
+                self._write(sock, data)
+                position += count
+                with self.lock:
+                    self.sent = max(self.sent, position)
+                # Pace to the configured entry rate
+                ahead = (position - resumed) / self.rate - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            if first_connection:
+                # Let the client answer the pings it has not read yet, then drop without a close
+                # frame, like a proxy timing the tail out
+                settle = time.monotonic() + 2
+                while self.pongs < self.pings and time.monotonic() < settle:
+                    time.sleep(0.05)
+                sock.shutdown(socket.SHUT_RDWR)
+                return
+            self.done.set()
+            # Keep the tail open and idle, as Loki does when no new entries arrive
+            while True:
+                time.sleep(1)
+        except OSError:
+            pass
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float('nan')
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=20_000, help='distinct entries the stand-in sends')
+    parser.add_argument('--rate', type=float, default=5_000, help='entries per second')
+    parser.add_argument('--per-message', type=int, default=50, help='entries per tail message')
+    parser.add_argument('--fragment-bytes', type=int, default=4096, help='payload bytes per websocket frame')
+    parser.add_argument('--chunk-bytes', type=int, default=700, help='bytes per socket write, so frames straddle reads')
+    parser.add_argument('--ping-every', type=int, default=10, help='messages between server pings')
+    parser.add_argument('--overlap', type=int, default=200, help='entries resent after the dropped connection')
+    parser.add_argument('--batch-seconds', type=float, default=live_tail.BATCH_INTERVAL_SECONDS)
+    args = parser.parse_args()
+    
+    stand_in = StandIn(args.entries, args.rate, args.per_message, args.fragment_bytes, args.chunk_bytes,
+                       args.ping_every, drop_after=args.entries // 2, overlap=args.overlap)
+    os.environ['LOKI_ENDPOINT'] = stand_in.url
+    print(f"stand-in: {args.entries} entries at {args.rate:.0f}/s, {args.per_message} per message, "
+          f"{args.fragment_bytes} byte frames written {args.chunk_bytes} bytes at a time, "
+          f"dropped after {args.entries // 2} and {args.overlap} resent")
+    
+    broadcaster = live_tail.Broadcaster()
+    subscriber = broadcaster.subscribe({live_tail.LokiTailSource.name})
+    source = live_tail.LokiTailSource(broadcaster, interval=args.batch_seconds)
+    # Start before the first entry so nothing is filtered as old
+    source.last_ns = time.time_ns() - 1
+    stop = threading.Event()
+    started = time.monotonic()
+    threading.Thread(target=source.run, args=(stop,), daemon=True).start()
+    
+    batches = published = largest = 0
+    latencies: List[float] = []
+    # Allow for the reconnect backoff and a final flush after the stand-in finishes
+    deadline = started + args.entries / args.rate + 30
+    while time.monotonic() < deadline and published < args.entries:
+        message = subscriber.get(timeout=0.5)
+        if message is None:
+            if stand_in.done.is_set() and time.monotonic() - started > args.entries / args.rate + 5:
+                break
+            continue
+        batch = json.loads(message.split('data: ', 1)[1])
+        batches += 1
+        published += batch['total']
+        largest = max(largest, len(batch['rows']))
+        latencies.extend(batch['published_at'] - row['timestamp_ns'] / 1e9 for row in batch['rows'])
+    seconds = time.monotonic() - started
+    # The pong to the last ping may still be on its way
+    settle = time.monotonic() + 2
+    while stand_in.pongs < stand_in.pings and time.monotonic() < settle:
+        time.sleep(0.05)
+    stop.set()
+    
+    print(f"connections {stand_in.connections}  pings {stand_in.pings}  pongs {stand_in.pongs}  bad frames {stand_in.bad_pongs}")
+    print(f"published {published} of {args.entries} distinct entries ({stand_in.sent + args.overlap} sent) "
+          f"in {batches} batches over {seconds:.1f} s")
+    print(f"largest batch {largest} rows (cap {live_tail.MAX_BATCH_ROWS})  "
+          f"latency p50 {percentile(latencies, 0.5) * 1000:.0f} ms  p99 {percentile(latencies, 0.99) * 1000:.0f} ms")
+    ok = published == args.entries and largest <= live_tail.MAX_BATCH_ROWS and stand_in.pongs == stand_in.pings
+    print('ok' if ok else 'MISMATCH')
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Build and query benchmark for the loader search index
+Builds search_index.py indexes over growing windows of synthetic security rows and times boolean queries against them
+
+Usage: python benchmarks/bench_search_index.py [--rows 10000,100000,1000000] [--repeat 200]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data'))
+
+import polars as pl
+
+import search_index
+from bench_security_fields import generate
+
+
+SERVICES = ['auth-service', 'api-gateway', 'payment-service', 'user-service', 'firewall']
+CATEGORIES = ['auth', 'access', 'security', 'network', 'general']
+
+QUERIES = [
+    'failed',
+    'failed admin',
+    'service:auth-service -failed',
+    'invalid OR accepted',
+    'NOT firewall category:security',
+    '"connection refused"',
+]
+
+
+def window(rows: int, seed: int = 5) -> pl.DataFrame:
+    """Message, service and category columns of a synthetic window"""
+    rng = random.Random(seed)
+    return pl.DataFrame({
+        'message': generate(rows, attributed=0.0, seed=seed)['message'],
+        'service_name': [rng.choice(SERVICES) for _ in range(rows)],
+        'category': [rng.choice(CATEGORIES) for _ in range(rows)],
+    })
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', default='10000,100000,1000000', help='comma-separated window sizes')
+    parser.add_argument('--repeat', type=int, default=200, help='runs per query, mean is reported')
+    args = parser.parse_args()
+    
+    print(f"polars {pl.__version__}")
+    for rows in [int(size) for size in args.rows.split(',')]:
+        df = window(rows)
+        megabytes = df['message'].str.len_bytes().sum() / 1e6
+        
+        started = time.perf_counter()
+        index = search_index.SearchIndex.build(df)
+        seconds = time.perf_counter() - started
+        print(f"{rows:>10,} rows {megabytes:7.1f} MB  build {seconds:7.3f} s {rows / seconds:11,.0f} rows/s  "
+              f"{len(index.terms):,} terms  postings {index.data.nbytes / 1e6:.2f} MB "
+              f"({index.data.nbytes * 8 / max(1, int(index.counts.sum())):.1f} bits/posting)")
+        
+        for query in QUERIES:
+            # The first run decodes the postings, later runs reuse them
+            started = time.perf_counter()
+            matched = len(index.search(query))
+            first = time.perf_counter() - started
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                index.search(query)
+            mean = (time.perf_counter() - started) / args.repeat
+            print(f"    {query!r:36} {matched:>9,} rows  {mean * 1e3:8.3f} ms (first {first * 1e3:.3f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for security field extraction from message text
+Compares the vectorized Polars stage in security_fields.py with per-row Python regex matching
+
+Usage: python benchmarks/bench_security_fields.py [--rows 1000000] [--attributed 0.5]
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'data'))
+
+import polars as pl
+
+import security_fields
+
+
+TEMPLATES = [
+    "Failed SSH login attempt for user {user} from {ip}",
+    "Accepted publickey for {user} from {ip} port {port} ssh2",
+    "Privilege escalation: user {user} executed sudo command",
+    '{ip} - - [19/Oct/2026:10:00:00 +0000] "{method} {path} HTTP/1.1" {status} 512',
+    "{method} https://api.example.com{path} status={status} user_id={user}",
+    "{method} {path} {status} 1234",
+    '"{method} {path}" {status}',
+    "Firewall blocked suspicious connection attempt - potential port scan detected",
+    "connection from {ip6} refused",
+    "Invalid user {user} from {ip} port {port}",
+    "Database connection pool exhausted after 30s",
+]
+USERS = ['admin', 'root', 'john', 'svc-backup', 'guest', 'alice@example.com']
+METHODS = ['GET', 'POST', 'PUT', 'DELETE']
+PATHS = ['/login', '/admin/users?id=7', '/api/v1/orders', '/static/app.js']
+
+# Messages with the fields both extractors must find; fields left out must stay empty
+EXPECTED = [
+    ('10.0.0.5 - - [19/Oct/2026:10:00:00 +0000] "GET /login HTTP/1.1" 404 512',
+     {'source_ip': '10.0.0.5', 'http_method': 'GET', 'http_status': '404', 'url': '/login'}),
+    ('GET /index.html 200 1234', {'http_method': 'GET', 'http_status': '200', 'url': '/index.html'}),
+    ('"POST /login" 401', {'http_method': 'POST', 'http_status': '401', 'url': '/login'}),
+    ('GET /api/v1/orders 250ms', {'http_method': 'GET', 'url': '/api/v1/orders'}),
+    ('Failed SSH login attempt for user admin from 192.168.1.7',
+     {'source_ip': '192.168.1.7', 'user_id': 'admin'}),
+    ('PUT https://api.example.com/api/v1/orders status=500 user_id=john',
+     {'user_id': 'john', 'http_method': 'PUT', 'http_status': '500', 'url': 'https://api.example.com/api/v1/orders'}),
+]
+
+
+def generate(rows: int, attributed: float, seed: int = 7) -> pl.DataFrame:
+    """Synthetic security messages; a share of rows already carries attribute fields"""
+    rng = random.Random(seed)
+    messages, source_ips, user_ids = [], [], []
+    for _ in range(rows):
+        ip = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+        user = rng.choice(USERS)
+        messages.append(rng.choice(TEMPLATES).format(
+            user=user, ip=ip, ip6=f"2001:db8::{rng.randint(1, 65535):x}", port=rng.randint(1024, 65535),
+            method=rng.choice(METHODS), path=rng.choice(PATHS), status=rng.choice([200, 302, 401, 403, 404, 500])
+        ))
+        has_attributes = rng.random() < attributed
+        source_ips.append(ip if has_attributes else '')
+        user_ids.append(user if has_attributes else '')
+    blanks = [''] * rows
+    return pl.DataFrame({
+        'message': messages, 'source_ip': source_ips, 'user_id': user_ids,
+        'http_method': blanks, 'http_status': blanks, 'url': blanks,
+    })
+
+
+def python_baseline(messages: list) -> list:
+    """Per-row extraction with the same patterns compiled by the re module"""
+    patterns = {
+        'source_ip': [security_fields.SOURCE_IPV4, security_fields.SOURCE_IPV6,
+                      security_fields.ANY_IPV4, security_fields.ANY_IPV6],
+        'user_id': security_fields.USER_PATTERNS,
+        'http_method': [security_fields.HTTP_REQUEST],
+        'http_status': security_fields.HTTP_STATUS_PATTERNS,
+        'url': [security_fields.URL],
+    }
+    compiled = {field: [re.compile(pattern) for pattern in group] for field, group in patterns.items()}
+    rows = []
+    for message in messages:
+        row = {}
+        for field, group in compiled.items():
+            for pattern in group:
+                match = pattern.search(message)
+                if match:
+                    row[field] = match.group(1)
+                    break
+        rows.append(row)
+    return rows
+
+
+def check_expected() -> bool:
+    """Compare both extractors with the EXPECTED fields, printing any mismatch"""
+    messages = [message for message, _ in EXPECTED]
+    vectorized = pl.DataFrame({'message': messages}).select(**security_fields.message_fields()).to_dicts()
+    ok = True
+    for (message, expected), polars_row, python_row in zip(EXPECTED, vectorized, python_baseline(messages)):
+        for field in ('source_ip', 'user_id', 'http_method', 'http_status'):
+            want = expected.get(field)
+            if polars_row[field] != want or python_row.get(field) != want:
+                print(f"MISMATCH {field} in {message!r}: expected {want}, polars {polars_row[field]}, "
+                      f"python {python_row.get(field)}")
+                ok = False
+        if polars_row['url'] != expected.get('url'):
+            print(f"MISMATCH url in {message!r}: expected {expected.get('url')}, polars {polars_row['url']}")
+            ok = False
+    return ok
+
+
+def report(label: str, rows: int, megabytes: float, seconds: float) -> None:
+    """Print one throughput line"""
+    print(f"{label:<40} {seconds:8.3f} s {rows / seconds:14,.0f} rows/s {megabytes / seconds:9.1f} MB/s")
+
+
+def main():
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--attributed', type=float, default=0.5, help='share of rows whose attributes are already set')
+    parser.add_argument('--baseline-rows', type=int, default=100_000, help='rows for the per-row Python baseline')
+    args = parser.parse_args()
+    
+    if not check_expected():
+        sys.exit(1)
+    
+    df = generate(args.rows, args.attributed)
+    megabytes = df['message'].str.len_bytes().sum() / 1e6
+    print(f"{args.rows:,} messages, {megabytes:.1f} MB, {args.attributed:.0%} with attributes, polars {pl.__version__}")
+    
+    started = time.perf_counter()
+    df.select(**security_fields.message_fields())
+    report('message_fields, every row', args.rows, megabytes, time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    filled = security_fields.fill_from_message(df)
+    report('fill_from_message, missing rows only', args.rows, megabytes, time.perf_counter() - started)
+    
+    subset = df['message'].head(args.baseline_rows).to_list()
+    subset_megabytes = sum(len(message.encode()) for message in subset) / 1e6
+    started = time.perf_counter()
+    python_baseline(subset)
+    report('python re, per row', len(subset), subset_megabytes, time.perf_counter() - started)
+    
+    coverage = {column: round(1 - (filled[column] == '').mean(), 3) for column in ('source_ip', 'user_id', 'http_status', 'url')}
+    print(f"filled share: {coverage}")
+    print('ok')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+// Reader for the inverted indexes written by src/data/search_index.py
+// Answers the same boolean term queries in the browser without scanning rows
+
+const FIELD_ALIASES = {service: "service_name", category: "category"};
+
+const QUERY_ITEM = /-?"[^"]*"|\S+/g;
+
+export class SearchIndex {
+  constructor(data) {
+    if (data.version !== 1) throw new Error(`Unsupported search index version: ${data.version}`);
+    this.rows = data.rows;
+    this.terms = data.terms;
+    this.offsets = data.offsets;
+    this.fields = data.fields;
+    this.tokenPattern = new RegExp(data.token_pattern, "g");
+    this.maxTokenLength = data.max_token_length;
+    this.data = Uint8Array.from(atob(data.postings), (c) => c.charCodeAt(0));
+    this.decoded = new Map();
+  }
+
+  // Index terms a free-text query word must all match
+  queryTerms(text) {
+    return (text.toLowerCase().match(this.tokenPattern) ?? []).filter((t) => t.length <= this.maxTokenLength);
+  }
+
+  // Sorted row IDs containing a term; terms are in code point order, which string comparison matches for ASCII
+  postings(term) {
+    let lo = 0;
+    let hi = this.terms.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (this.terms[mid] < term) lo = mid + 1;
+      else hi = mid;
+    }
+    if (this.terms[lo] !== term) return new Uint32Array(0);
+    if (!this.decoded.has(lo)) {
+      const rows = [];
+      let row = 0;
+      let value = 0;
+      let shift = 0;
+      for (let i = this.offsets[lo]; i < this.offsets[lo + 1]; ++i) {
+        const byte = this.data[i];
+        value += (byte & 0x7f) * 2 ** shift;
+        shift += 7;
+        if (byte < 0x80) {
+          row += value;
+          rows.push(row);
+          value = 0;
+          shift = 0;
+        }
+      }
+      this.decoded.set(lo, Uint32Array.from(rows));
+    }
+    return this.decoded.get(lo);
+  }
+
+  item(item) {
+    const colon = item.indexOf(":");
+    const field = FIELD_ALIASES[item.slice(0, colon).toLowerCase()];
+    if (colon > 0 && field && colon < item.length - 1) {
+      return [this.postings(this.fields[field] + item.slice(colon + 1).replace(/^"+|"+$/g, "").toLowerCase())];
+    }
+    const terms = this.queryTerms(item);
+    return terms.length ? terms.map((term) => this.postings(term)) : null;
+  }
+
+  intersect(postings) {
+    postings = [...postings].sort((a, b) => a.length - b.length);
+    let result = postings[0];
+    for (const other of postings.slice(1)) {
+      if (!result.length) break;
+      const mask = new Uint8Array(this.rows);
+      for (const row of other) mask[row] = 1;
+      result = result.filter((row) => mask[row]);
+    }
+    return result;
+  }
+
+  // Sorted row IDs matching a query: words AND, OR between alternatives,
+  // -word or NOT word to exclude, service:<name> and category:<name>
+  search(query) {
+    const clauses = [[]];
+    let negate = false;
+    for (const item of query.match(QUERY_ITEM) ?? []) {
+      if (item === "OR") clauses.push([]);
+      else if (item === "NOT") negate = true;
+      else if (item !== "AND") {
+        clauses[clauses.length - 1].push(negate ? `-${item}` : item);
+        negate = false;
+      }
+    }
+
+    const selected = new Uint8Array(this.rows);
+    for (const clause of clauses) {
+      const include = [];
+      const exclude = [];
+      for (const item of clause) {
+        const negated = item.startsWith("-");
+        const postings = this.item(negated ? item.slice(1) : item);
+        if (postings === null) continue;
+        if (negated) exclude.push(postings);
+        else include.push(...postings);
+      }
+      if (!include.length && !exclude.length) continue;
+
+      let matched = include.length ? this.intersect(include) : Uint32Array.from({length: this.rows}, (_, i) => i);
+      for (const postings of exclude) {
+        const excluded = new Uint8Array(this.rows);
+        for (const row of this.intersect(postings)) excluded[row] = 1;
+        matched = matched.filter((row) => !excluded[row]);
+      }
+      for (const row of matched) selected[row] = 1;
+    }
+
+    const result = [];
+    for (let row = 0; row < this.rows; ++row) if (selected[row]) result.push(row);
+    return result;
+  }
+
+  // The rows of the loader output a query matches, in order
+  filter(rows, query) {
+    return query.trim() ? this.search(query).map((row) => rows[row]) : rows;
+  }
+}
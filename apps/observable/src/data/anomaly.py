@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Streaming statistical anomaly detection for log frames
+Keeps per-service baselines between loader runs and scores rows against them in vectorized batches
+"""
+
+from typing import Any, Dict, Optional
+import numpy as np
+import polars as pl
+
+import sketches
+import state_store
+
+
+DEFAULT_STATE_NAME = 'anomaly-baselines.json'
+
+# Services need this many baseline events before their rows are scored
+WARMUP_EVENTS = 200
+
+# Smoothing factor of the per-minute event rate EWMA
+RATE_ALPHA = 0.1
+
+# Empty minutes decayed into the rate EWMA at most (one day)
+MAX_GAP_MINUTES = 1440
+
+# Histograms and sketches are halved once they hold this many events
+AGING_LIMIT = 100_000
+
+# Message length histogram: quarter-octave bins of log2(length + 1)
+LENGTH_BINS = 64
+
+# Two-sided tail probability below which a message length counts as unusual
+LENGTH_TAIL = 0.02
+
+# Hours with less than this fraction of a uniform hourly share count as unusual
+HOUR_RARITY = 0.25
+
+# A source IP seen this many times for a service is no longer unusual
+IP_COMMON_COUNT = 20
+
+# Contribution of each signal to the combined score
+WEIGHTS = {
+    'rate': 0.3,
+    'length': 0.2,
+    'source_ip': 0.3,
+    'hour': 0.2,
+}
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+
+def _length_bins(lengths: np.ndarray) -> np.ndarray:
+    """Map message lengths onto histogram bins"""
+    return np.minimum((np.log2(lengths + 1.0) * 4).astype(np.intp), LENGTH_BINS - 1)
+
+
+class ServiceBaseline:
+    """Rolling baseline for one service"""
+    
+    def __init__(self):
+        self.events = 0
+        self.last_minute: Optional[int] = None
+        self.rate_mean = 0.0
+        self.rate_var = 0.0
+        self.length_hist = np.zeros(LENGTH_BINS, dtype=np.float64)
+        self.hour_hist = np.zeros(24, dtype=np.float64)
+        self.source_ips = sketches.CountMinSketch(width=1024, depth=4)
+    
+    def score(self, minutes: np.ndarray, lengths: np.ndarray, hours: np.ndarray,
+              ip_hashes: np.ndarray, has_ip: np.ndarray) -> np.ndarray:
+        """Score a batch of rows against this baseline, 0 (normal) to 1 (anomalous)"""
+        # Event rate: z-score of each row's minute count against the EWMA
+        _, inverse, counts = np.unique(minutes, return_inverse=True, return_counts=True)
+        z = (counts[inverse] - self.rate_mean) / np.sqrt(self.rate_var + 1.0)
+        rate = np.clip((z - 2.0) / 3.0, 0.0, 1.0)
+        
+        # Message length: two-sided tail probability from the length histogram
+        cdf = np.cumsum(self.length_hist) / max(self.length_hist.sum(), 1.0)
+        bins = _length_bins(lengths)
+        below = np.where(bins > 0, cdf[bins - 1], 0.0)
+        tail = np.minimum(cdf[bins], 1.0 - below)
+        length = np.clip(1.0 - tail / LENGTH_TAIL, 0.0, 1.0)
+        
+        # Hour of day: share of traffic this service normally sees in that hour
+        share = self.hour_hist[hours] / max(self.hour_hist.sum(), 1.0)
+        hour = np.clip(1.0 - share * 24 / HOUR_RARITY, 0.0, 1.0)
+        
+        # Source IP: rarity of the address for this service
+        seen = self.source_ips.estimate(ip_hashes).astype(np.float64)
+        source_ip = np.where(has_ip, np.clip(1.0 - np.log1p(seen) / np.log1p(IP_COMMON_COUNT), 0.0, 1.0), 0.0)
+        
+        return (WEIGHTS['rate'] * rate + WEIGHTS['length'] * length
+                + WEIGHTS['source_ip'] * source_ip + WEIGHTS['hour'] * hour)
+    
+    def update(self, minutes: np.ndarray, lengths: np.ndarray, hours: np.ndarray,
+               ip_hashes: np.ndarray, first_covered_minute: Optional[int] = None) -> None:
+        """Fold a batch of rows from closed, previously unseen minutes into the baseline
+        
+        Only minutes from first_covered_minute on were fetched in full, so
+        only empty minutes from there on count as quiet ones; earlier gaps
+        were simply not fetched.
+        """
+        if len(minutes) == 0:
+            return
+        
+        unique_minutes, counts = np.unique(minutes, return_counts=True)
+        for minute, count in zip(unique_minutes.tolist(), counts.tolist()):
+            if self.last_minute is None:
+                self.rate_mean = float(count)
+            else:
+                # Fetched minutes without events pull the rate towards zero
+                gap_start = self.last_minute
+                if first_covered_minute is not None:
+                    gap_start = max(gap_start, first_covered_minute - 1)
+                for _ in range(min(minute - gap_start - 1, MAX_GAP_MINUTES)):
+                    self._update_rate(0.0)
+                self._update_rate(float(count))
+            self.last_minute = minute
+        
+        self.length_hist += np.bincount(_length_bins(lengths), minlength=LENGTH_BINS)
+        self.hour_hist += np.bincount(hours, minlength=24)
+        self.source_ips.add(ip_hashes)
+        self.events += len(minutes)
+        
+        if self.length_hist.sum() > AGING_LIMIT:
+            self.length_hist /= 2
+            self.hour_hist /= 2
+            self.source_ips.halve()
+    
+    def _update_rate(self, value: float) -> None:
+        """Exponentially weighted mean and variance update"""
+        diff = value - self.rate_mean
+        increment = RATE_ALPHA * diff
+        self.rate_mean += increment
+        self.rate_var = (1 - RATE_ALPHA) * (self.rate_var + diff * increment)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {
+            'events': self.events,
+            'last_minute': self.last_minute,
+            'rate_mean': self.rate_mean,
+            'rate_var': self.rate_var,
+            'length_hist': self.length_hist.tolist(),
+            'hour_hist': self.hour_hist.tolist(),
+            'source_ips': self.source_ips.to_dict(),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ServiceBaseline':
+        """Deserialize a baseline written by to_dict"""
+        baseline = cls()
+        baseline.events = data['events']
+        baseline.last_minute = data['last_minute']
+        baseline.rate_mean = data['rate_mean']
+        baseline.rate_var = data['rate_var']
+        baseline.length_hist = np.array(data['length_hist'], dtype=np.float64)
+        baseline.hour_hist = np.array(data['hour_hist'], dtype=np.float64)
+        baseline.source_ips = sketches.CountMinSketch.from_dict(data['source_ips'])
+        return baseline
+
+
+class AnomalyDetector:
+    """Per-service streaming anomaly detector persisted between loader runs
+    
+    Rows are scored against the baseline as it stood before the batch, then
+    rows from minutes the baseline has not seen yet are folded in. The newest
+    minute of a batch is still filling up and is left for the next run, so
+    overlapping fetch windows never count an event twice and each run costs
+    O(new rows). Fetches are truncated to their newest rows, so only minutes
+    from the start of what was fetched in full are folded in.
+    """
+    
+    def __init__(self, state_name: str = DEFAULT_STATE_NAME):
+        self.state_name = state_name
+        self._load()
+    
+    def _load(self) -> None:
+        """Replace the baselines with the persisted state"""
+        state = state_store.load_json(self.state_name, default={})
+        self.baselines: Dict[str, ServiceBaseline] = {
+            service: ServiceBaseline.from_dict(data) for service, data in state.items()
+        }
+    
+    def score_and_update(self, df: pl.DataFrame, covered_start_ns: Optional[int] = None) -> pl.Series:
+        """Score a normalized log frame, update the baselines, return scores in row order
+        
+        covered_start_ns is where the fetch stopped being truncated; rows
+        before it are scored but not learned from. Without it only the
+        minutes after the oldest row's count as covered.
+        """
+        scores = np.zeros(df.height, dtype=np.float64)
+        if df.is_empty():
+            return pl.Series('anomaly_score', scores)
+        
+        source_ip = df['source_ip'] if 'source_ip' in df.columns else pl.Series([''] * df.height)
+        ips = source_ip.cast(pl.String).fill_null('')
+        
+        # Hash each distinct address once and broadcast back to rows
+        distinct = ips.unique()
+        lookup = pl.DataFrame({'_ip': distinct, '_hash': sketches.hash64(distinct.to_list())})
+        
+        batch = pl.DataFrame({
+            '_ip': ips,
+            'service': df['service_name'].cast(pl.String).fill_null('unknown'),
+            'minute': df['timestamp_ns'] // NS_PER_MINUTE,
+            'length': df['message'].str.len_chars().fill_null(0),
+            'hour': pl.from_epoch(df['timestamp_ns'], time_unit='ns').dt.hour(),
+        }).with_row_index('_row').join(lookup, on='_ip', how='left').sort('_row')
+        
+        open_minute = batch['minute'].max()
+        # The first minute fetched in full
+        if covered_start_ns is None:
+            first_covered = batch['minute'].min() + 1
+        else:
+            first_covered = -(-covered_start_ns // NS_PER_MINUTE)
+        
+        for service, group in batch.partition_by('service', as_dict=True).items():
+            service = service[0] if isinstance(service, tuple) else service
+            baseline = self.baselines.setdefault(service, ServiceBaseline())
+            
+            rows = group['_row'].to_numpy()
+            minutes = group['minute'].to_numpy()
+            lengths = group['length'].to_numpy()
+            hours = group['hour'].to_numpy().astype(np.intp)
+            ip_hashes = group['_hash'].to_numpy()
+            has_ip = (group['_ip'] != '').to_numpy()
+            
+            if baseline.events >= WARMUP_EVENTS:
+                scores[rows] = baseline.score(minutes, lengths, hours, ip_hashes, has_ip)
+            
+            last_minute = baseline.last_minute if baseline.last_minute is not None else -1
+            new = (minutes > last_minute) & (minutes >= first_covered) & (minutes < open_minute)
+            baseline.update(minutes[new], lengths[new], hours[new], ip_hashes[new & has_ip], first_covered)
+        
+        return pl.Series('anomaly_score', np.round(np.minimum(scores, 1.0), 3))
+    
+    def score_and_save(self, df: pl.DataFrame, covered_start_ns: Optional[int] = None) -> pl.Series:
+        """Score a live fetch against the latest persisted baselines, update and save them
+        
+        Loaders run as separate processes; reloading under the state lock
+        keeps one process from overwriting another's updates.
+        """
+        with state_store.locked(self.state_name):
+            self._load()
+            scores = self.score_and_update(df, covered_start_ns)
+            self.save()
+        return scores
+    
+    def save(self) -> None:
+        """Persist the baselines for the next run"""
+        state_store.save_json(self.state_name, {
+            service: baseline.to_dict() for service, baseline in self.baselines.items()
+        })
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Client-side load limiting for the Loki, Quickwit and Prometheus backends
+Shares an adaptive concurrency limit and a token bucket per backend between every loader process through a locked state file
+"""
+
+import os
+import sys
+import time
+import zlib
+import fcntl
+import random
+import struct
+import itertools
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+import state_store
+
+
+# Responses that mean the backend is overloaded; they shrink the limit and are retried
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Attempts per request beyond the first for the statuses above
+STATUS_RETRIES = 3
+
+# Backoff before a status retry without Retry-After: base * 2^attempt seconds, jittered
+BACKOFF_SECONDS = 0.5
+
+# Latency is tracked per request class (URL path), since a label lookup and a range query differ by
+# orders of magnitude; a short-window average above this multiple of the long-window one counts as congestion
+LATENCY_TOLERANCE = 2.0
+
+# Weights of each new latency in the short- and long-window moving averages of its request class
+SHORT_LATENCY_WEIGHT = 0.3
+LONG_LATENCY_WEIGHT = 0.02
+
+# Latencies a request class needs before its short/long gradient is trusted
+MIN_LATENCY_SAMPLES = 5
+
+# Shared state idle this long is reset, so a limit lowered by one bad build does not hold back later ones
+IDLE_RESET_SECONDS = 600
+
+# Default requests per second, burst and maximum concurrency per backend,
+# overridable with <BACKEND>_MAX_RPS, <BACKEND>_BURST and <BACKEND>_MAX_CONCURRENCY
+DEFAULT_LIMITS = {
+    'loki': {'rate': 20.0, 'burst': 10, 'concurrency': 8},
+    'quickwit': {'rate': 20.0, 'burst': 10, 'concurrency': 8},
+    'prometheus': {'rate': 50.0, 'burst': 25, 'concurrency': 16},
+}
+
+# Seconds between checks for a free concurrency slot held by another process
+SLOT_POLL_SECONDS = 0.01
+
+# Slots are leased to a process; leases of dead processes or older than this are reclaimed
+LEASE_TIMEOUT_SECONDS = 300
+
+# Shared state: tokens, last refill, pause end, concurrency limit, last decrease, last release and the
+# lease and request class counts, then (pid, token, start) per lease and (path crc32, samples, short
+# and long average latency) per request class
+STATE_HEADER = struct.Struct('<6d2I')
+LEASE = struct.Struct('<iQd')
+LATENCY = struct.Struct('<2I2d')
+
+
+def _alive(pid: int) -> bool:
+    """Whether a process exists"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedState:
+    """Limiter state of one backend, shared by the loader processes of a build
+    
+    Observable runs every data loader as its own process, so the state lives
+    in a small file under LOADER_STATE_DIR that each transaction reads and
+    rewrites under flock. Times are wall-clock seconds. State left idle for
+    IDLE_RESET_SECONDS starts over from the initial limit. When the file
+    cannot be used the state is kept per process instead.
+    """
+    
+    def __init__(self, name: str, burst: int, initial_limit: float):
+        self.burst = burst
+        self.initial_limit = initial_limit
+        self.lock = threading.Lock()
+        self.local: Optional[Dict[str, Any]] = None
+        try:
+            self.path: Optional[str] = state_store.state_path(f"limiter-{name}.bin")
+            os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644))
+        except OSError as e:
+            print(f"Limiting {name} per process, state file unavailable: {e}", file=sys.stderr)
+            self.path = None
+    
+    def _initial(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            'tokens': float(self.burst), 'updated': now, 'paused_until': 0.0, 'limit': float(self.initial_limit),
+            'last_decrease': 0.0, 'last_release': now, 'leases': [], 'latencies': {},
+        }
+    
+    @staticmethod
+    def _decode(data: bytes) -> Optional[Dict[str, Any]]:
+        if len(data) < STATE_HEADER.size:
+            return None
+        (tokens, updated, paused_until, limit, last_decrease, last_release,
+         leases, classes) = STATE_HEADER.unpack_from(data)
+        if len(data) != STATE_HEADER.size + leases * LEASE.size + classes * LATENCY.size:
+            return None
+        offset = STATE_HEADER.size + leases * LEASE.size
+        latencies = [LATENCY.unpack_from(data, offset + i * LATENCY.size) for i in range(classes)]
+        return {
+            'tokens': tokens, 'updated': updated, 'paused_until': paused_until, 'limit': limit,
+            'last_decrease': last_decrease, 'last_release': last_release,
+            'leases': [LEASE.unpack_from(data, STATE_HEADER.size + i * LEASE.size) for i in range(leases)],
+            'latencies': {key: (samples, short, long) for key, samples, short, long in latencies},
+        }
+    
+    @staticmethod
+    def _encode(state: Dict[str, Any]) -> bytes:
+        header = STATE_HEADER.pack(
+            state['tokens'], state['updated'], state['paused_until'], state['limit'],
+            state['last_decrease'], state['last_release'], len(state['leases']), len(state['latencies'])
+        )
+        return (
+            header + b''.join(LEASE.pack(*lease) for lease in state['leases'])
+            + b''.join(LATENCY.pack(key, *latency) for key, latency in state['latencies'].items())
+        )
+    
+    def _current(self, state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """A decoded state, or a fresh one when unreadable or idle past IDLE_RESET_SECONDS"""
+        if state is None or (not state['leases'] and time.time() - state['last_release'] > IDLE_RESET_SECONDS):
+            return self._initial()
+        return state
+    
+    @contextmanager
+    def transaction(self) -> Iterator[Dict[str, Any]]:
+        """The current state, written back when the block completes"""
+        with self.lock:
+            if self.path is None:
+                self.local = self._current(self.local)
+                yield self.local
+                return
+            
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                state = self._current(self._decode(os.pread(fd, 1 << 16, 0)))
+                yield state
+                data = self._encode(state)
+                os.pwrite(fd, data, 0)
+                os.ftruncate(fd, len(data))
+            finally:
+                os.close(fd)
+
+
+class TokenBucket:
+    """Token bucket refilled at rate tokens per second up to burst, shared through a SharedState"""
+    
+    def __init__(self, rate: float, burst: int, state: SharedState):
+        self.rate = rate
+        self.burst = burst
+        self.state = state
+    
+    def pause(self, seconds: float) -> None:
+        """Hold all tokens back for a while, e.g. for a Retry-After header"""
+        with self.state.transaction() as state:
+            state['paused_until'] = max(state['paused_until'], time.time() + seconds)
+    
+    def acquire(self) -> float:
+        """Take one token, sleeping until one is available; returns the time waited"""
+        waited = 0.0
+        while True:
+            with self.state.transaction() as state:
+                now = time.time()
+                state['tokens'] = min(self.burst, state['tokens'] + max(0.0, now - state['updated']) * self.rate)
+                state['updated'] = now
+                if now >= state['paused_until'] and state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    return waited
+                delay = max(state['paused_until'] - now, (1 - state['tokens']) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit, shared through a SharedState
+    
+    Each successful request within the latency tolerance raises the limit by
+    1 / limit, about one slot per round of requests. An overload status, an
+    error or congestion halves it, at most once per round trip so one burst
+    of failures does not collapse the limit. Congestion is a latency gradient
+    within one request class: its short-window average latency rising above
+    tolerance times its long-window average, so cheap and expensive endpoints
+    of a backend are never compared with each other. In-flight requests hold
+    leases identified by a token, so a killed loader does not keep its slots
+    and a thread only ever frees its own.
+    """
+    
+    def __init__(self, state: SharedState, minimum: float = 1, maximum: float = 16,
+                 backoff: float = 0.5, tolerance: float = LATENCY_TOLERANCE):
+        self.state = state
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.tokens = itertools.count(1)
+    
+    def acquire(self) -> int:
+        """Wait for a free slot under the current limit; returns the lease token to release"""
+        pid = os.getpid()
+        token = next(self.tokens)
+        while True:
+            with self.state.transaction() as state:
+                now = time.time()
+                state['leases'] = [
+                    (owner, lease, started) for owner, lease, started in state['leases']
+                    if now - started < LEASE_TIMEOUT_SECONDS and (owner == pid or _alive(owner))
+                ]
+                if len(state['leases']) < int(min(self.maximum, state['limit'])):
+                    state['leases'].append((pid, token, now))
+                    return token
+            time.sleep(SLOT_POLL_SECONDS)
+    
+    def release(self, token: int, request_class: str, latency: float, overloaded: bool) -> None:
+        """Free the slot leased under token and adjust the limit from the request's outcome"""
+        pid = os.getpid()
+        with self.state.transaction() as state:
+            state['leases'] = [lease for lease in state['leases'] if lease[:2] != (pid, token)]
+            now = time.time()
+            state['last_release'] = now
+            
+            if not overloaded:
+                key = zlib.crc32(request_class.encode('utf-8'))
+                samples, short, long = state['latencies'].get(key, (0, latency, latency))
+                short += (latency - short) * SHORT_LATENCY_WEIGHT
+                long += (latency - long) * LONG_LATENCY_WEIGHT
+                state['latencies'][key] = (samples + 1, short, long)
+                overloaded = samples >= MIN_LATENCY_SAMPLES and short > long * self.tolerance
+            
+            if overloaded:
+                if now - state['last_decrease'] > latency:
+                    state['limit'] = max(self.minimum, state['limit'] * self.backoff)
+                    state['last_decrease'] = now
+            else:
+                state['limit'] = min(self.maximum, state['limit'] + 1 / state['limit'])
+
+
+class BackendLimiter:
+    """Token bucket plus adaptive concurrency for one backend, shared across loader processes"""
+    
+    def __init__(self, name: str, rate: float, burst: int, concurrency: int, initial_limit: float = 2):
+        self.name = name
+        self.state = SharedState(name, burst, initial_limit)
+        self.bucket = TokenBucket(rate, burst, self.state)
+        self.concurrency = AdaptiveLimiter(self.state, maximum=concurrency)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'overloaded': 0, 'errors': 0, 'wait_seconds': 0.0}
+    
+    def acquire(self) -> int:
+        """Wait for a token and a concurrency slot; returns the lease token to release"""
+        waited = self.bucket.acquire()
+        started = time.monotonic()
+        lease = self.concurrency.acquire()
+        with self.lock:
+            self.counters['wait_seconds'] += waited + time.monotonic() - started
+        return lease
+    
+    def release(self, lease: int, request_class: str, latency: float, status: Optional[int]) -> None:
+        """Record a finished attempt; status None means a connection error or timeout"""
+        overloaded = status is None or status in RETRY_STATUSES
+        self.concurrency.release(lease, request_class, latency, overloaded)
+        with self.lock:
+            self.counters['requests'] += 1
+            if status is None:
+                self.counters['errors'] += 1
+            elif overloaded:
+                self.counters['overloaded'] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Shared limit and this process's request counters"""
+        with self.state.transaction() as state:
+            shared = {
+                'concurrency_limit': round(state['limit'], 2),
+                'in_flight': len(state['leases']),
+                'latency_classes': len(state['latencies']),
+            }
+        with self.lock:
+            return {
+                'backend': self.name,
+                **shared,
+                **{key: round(value, 3) for key, value in self.counters.items()}
+            }
+
+
+_limiters: Dict[str, BackendLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(backend: str) -> BackendLimiter:
+    """The limiter of a backend; its state is shared with the other loader processes"""
+    with _limiters_lock:
+        if backend not in _limiters:
+            defaults = DEFAULT_LIMITS.get(backend, DEFAULT_LIMITS['loki'])
+            prefix = backend.upper()
+            _limiters[backend] = BackendLimiter(
+                backend,
+                rate=float(os.getenv(f'{prefix}_MAX_RPS', defaults['rate'])),
+                burst=int(os.getenv(f'{prefix}_BURST', defaults['burst'])),
+                concurrency=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', defaults['concurrency']))
+            )
+        return _limiters[backend]
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds from a Retry-After header in delta-seconds form"""
+    try:
+        return float(response.headers['Retry-After'])
+    except (KeyError, ValueError):
+        return None
+
+
+class LimitedAdapter(HTTPAdapter):
+    """HTTP adapter that sends every attempt through a backend limiter
+    
+    Overload statuses are retried here rather than by urllib3, so each attempt
+    feeds the limiter and waits for a token instead of hitting the backend
+    again immediately.
+    """
+    
+    def __init__(self, backend: str, **kwargs: Any):
+        self.limiter = limiter(backend)
+        super().__init__(**kwargs)
+    
+    def send(self, request: requests.PreparedRequest, **kwargs: Any) -> requests.Response:
+        """Send a request, retrying overload statuses after a backoff"""
+        request_class = urllib.parse.urlsplit(request.url).path
+        for attempt in range(STATUS_RETRIES + 1):
+            lease = self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = super().send(request, **kwargs)
+            except requests.exceptions.RequestException:
+                self.limiter.release(lease, request_class, time.monotonic() - started, None)
+                raise
+            self.limiter.release(lease, request_class, time.monotonic() - started, response.status_code)
+            
+            if response.status_code not in RETRY_STATUSES or attempt == STATUS_RETRIES:
+                return response
+            
+            delay = _retry_after(response)
+            if delay is not None:
+                self.limiter.bucket.pause(delay)
+            else:
+                time.sleep(BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+            response.close()
+        return response
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for correlated incidents
+Joins Loki operational errors with Quickwit security events on trace, source IP and service within a time window
+"""
+
+import sys
+import json
+from datetime import datetime
+
+import correlation
+import loaders
+
+
+def main():
+    """Main function to run the data loader"""
+    loki = loaders.load('loki-logs.py').LokiDataLoader()
+    quickwit = loaders.load('quickwit-logs.py').QuickwitDataLoader()
+    
+    # Same time range and limits as the individual loaders
+    operational = loki.fetch_frame(hours_back=2, limit=1000)
+    security = quickwit.fetch_frame(hours_back=2, max_hits=1000)
+    
+    window_seconds = correlation.DEFAULT_WINDOW_SECONDS
+    incidents = correlation.correlate(operational, security, window_seconds=window_seconds)
+    
+    print(f"Correlated {incidents.height} of {security.height} security events", file=sys.stderr)
+    
+    # Output as JSON for Observable Framework
+    print(json.dumps({
+        'incidents': correlation.to_records(incidents),
+        'summary': correlation.summarize(incidents, operational, security, window_seconds),
+        'last_updated': datetime.now().isoformat()
+    }, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Cross-source correlation between Loki operational logs and Quickwit security events
+Finds operational errors around each security event with sorted as-of joins on the unified log schema
+"""
+
+import os
+import warnings
+from typing import Any, Dict, List
+import polars as pl
+
+import log_schema
+
+
+DEFAULT_WINDOW_SECONDS = int(os.getenv('CORRELATION_WINDOW_SECONDS', '300'))
+
+# Join keys in priority order: the most specific match wins for an event
+CORRELATION_KEYS = ['trace_id', 'source_ip', 'service_name']
+
+# Operational rows at or above this severity count as errors
+DEFAULT_MIN_SEVERITY = 'error'
+
+# Both sides are sorted on the join key before every as-of join; Polars cannot
+# verify that per 'by' group and warns on each call
+warnings.filterwarnings('ignore', message='Sortedness of columns cannot be checked')
+
+
+def _prepare(df: pl.DataFrame) -> pl.DataFrame:
+    """Project a normalized frame onto the correlation keys as plain strings"""
+    source_ip = (
+        pl.col('source_ip').cast(pl.String).fill_null('') if 'source_ip' in df.columns
+        else log_schema.attribute(df, 'source_ip', 'client_ip', 'remote_addr')
+    )
+    trace_id = pl.coalesce([
+        pl.when(pl.col('trace_id') != '').then(pl.col('trace_id')),
+        log_schema.attribute(df, 'trace_id', 'traceid', 'trace.id')
+    ])
+    return df.with_columns([
+        trace_id.alias('trace_id'),
+        source_ip.alias('source_ip'),
+        pl.col('service_name').cast(pl.String).fill_null('').alias('service_name'),
+    ])
+
+
+def _match_on_key(events: pl.DataFrame, errors: pl.DataFrame, key: str, window_ns: int) -> pl.DataFrame:
+    """Match events to errors sharing key within +/- window_ns
+    
+    Both sides are sorted by time once; window counts come from two as-of
+    joins against each error's position within its key group, and the
+    nearest error from a third, so no pair of rows is ever compared directly.
+    """
+    left = events.filter(pl.col(key) != '').select(['_event_id', 'timestamp_ns', key]).sort('timestamp_ns')
+    right = errors.filter(pl.col(key) != '').sort('timestamp_ns')
+    if left.is_empty() or right.is_empty():
+        return pl.DataFrame()
+    
+    right = right.with_columns(pl.int_range(pl.len()).over(key).alias('_rank'))
+    ranks = right.select(['timestamp_ns', key, '_rank'])
+    
+    # Position of the last error at or before t + window
+    upper = left.with_columns((pl.col('timestamp_ns') + window_ns).alias('_bound')).join_asof(
+        ranks.rename({'timestamp_ns': '_bound'}), on='_bound', by=key, strategy='backward'
+    ).select(['_event_id', pl.col('_rank').alias('_upper')])
+    
+    # Position of the first error at or after t - window
+    lower = left.with_columns((pl.col('timestamp_ns') - window_ns).alias('_bound')).join_asof(
+        ranks.rename({'timestamp_ns': '_bound'}), on='_bound', by=key, strategy='forward'
+    ).select(['_event_id', pl.col('_rank').alias('_lower')])
+    
+    nearest = left.join_asof(
+        right.select([
+            pl.col('timestamp_ns').alias('error_timestamp_ns'),
+            pl.col('timestamp_ns').alias('_error_ts'),
+            key,
+            pl.col('service_name').alias('error_service'),
+            pl.col('severity').cast(pl.String).alias('error_severity'),
+            pl.col('message').alias('error_message'),
+        ]),
+        left_on='timestamp_ns', right_on='_error_ts', by=key,
+        strategy='nearest', tolerance=window_ns
+    )
+    
+    return (
+        nearest.join(upper, on='_event_id').join(lower, on='_event_id')
+        .with_columns(
+            pl.when(pl.col('_upper') >= pl.col('_lower'))
+            .then(pl.col('_upper') - pl.col('_lower') + 1)
+            .otherwise(0)
+            .cast(pl.Int64)
+            .alias('errors_in_window')
+        )
+        .filter(pl.col('errors_in_window') > 0)
+        .select([
+            '_event_id',
+            pl.lit(key).alias('match_key'),
+            'errors_in_window',
+            'error_timestamp_ns',
+            'error_service',
+            'error_severity',
+            'error_message',
+        ])
+    )
+
+
+def correlate(operational: pl.DataFrame, security: pl.DataFrame,
+              window_seconds: int = DEFAULT_WINDOW_SECONDS,
+              min_severity: str = DEFAULT_MIN_SEVERITY) -> pl.DataFrame:
+    """Correlate security events with operational errors around them
+    
+    Each security event is matched on trace_id, then source_ip, then
+    service_name; the first key with at least one operational error within
+    window_seconds wins. Returns one compact row per correlated event.
+    """
+    if operational.is_empty() or security.is_empty():
+        return pl.DataFrame()
+    
+    window_ns = int(window_seconds * 1_000_000_000)
+    threshold = log_schema.SEVERITY_LEVELS.index(min_severity)
+    
+    errors = _prepare(operational).filter(
+        pl.col('severity').cast(pl.String).is_in(log_schema.SEVERITY_LEVELS[threshold:])
+    )
+    events = _prepare(security).with_row_index('_event_id')
+    
+    # Lower-priority keys only need to look at events still unmatched
+    matches = []
+    remaining = events
+    for key in CORRELATION_KEYS:
+        matched = _match_on_key(remaining, errors, key, window_ns)
+        if matched.is_empty():
+            continue
+        matches.append(matched)
+        remaining = remaining.join(matched.select('_event_id'), on='_event_id', how='anti')
+    if not matches:
+        return pl.DataFrame()
+    
+    best = pl.concat(matches, how='vertical_relaxed')
+    
+    event_columns = [
+        c for c in ['timestamp_ns', 'service_name', 'severity', 'category', 'source_ip',
+                    'trace_id', 'user_id', 'risk_score', 'message']
+        if c in events.columns
+    ]
+    
+    return (
+        events.select(['_event_id'] + event_columns)
+        .join(best, on='_event_id')
+        .with_columns([
+            (pl.col('timestamp_ns') // 1_000_000).alias('timestamp'),
+            (pl.col('error_timestamp_ns') // 1_000_000).alias('error_timestamp'),
+            ((pl.col('error_timestamp_ns') - pl.col('timestamp_ns')) // 1_000_000).alias('error_lag_ms'),
+            pl.col('severity').cast(pl.String),
+        ])
+        .sort(['errors_in_window', 'timestamp_ns'], descending=[True, True])
+        .select(['timestamp'] + event_columns[1:] + [
+            'match_key', 'errors_in_window', 'error_timestamp', 'error_lag_ms',
+            'error_service', 'error_severity', 'error_message',
+        ])
+    )
+
+
+def summarize(incidents: pl.DataFrame, operational: pl.DataFrame, security: pl.DataFrame,
+              window_seconds: int = DEFAULT_WINDOW_SECONDS) -> Dict[str, Any]:
+    """Summary counts for the correlated incidents dataset"""
+    by_key: Dict[str, int] = {key: 0 for key in CORRELATION_KEYS}
+    if not incidents.is_empty():
+        for row in incidents.group_by('match_key').len().iter_rows():
+            by_key[row[0]] = row[1]
+    
+    return {
+        'window_seconds': window_seconds,
+        'security_events': security.height,
+        'operational_logs': operational.height,
+        'correlated_events': incidents.height,
+        'by_match_key': by_key,
+    }
+
+
+def to_records(incidents: pl.DataFrame, limit: int = 500) -> List[Dict[str, Any]]:
+    """Convert the strongest incidents to JSON-ready dictionaries"""
+    return incidents.head(limit).to_dicts() if not incidents.is_empty() else []
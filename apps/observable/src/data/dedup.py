@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Streaming deduplication of log rows
+Drops repeated (timestamp, service, body) rows page by page while holding only 64-bit hashes
+"""
+
+import os
+import sys
+from typing import Any, Dict, Optional
+import numpy as np
+import polars as pl
+
+import sketches
+import state_store
+
+
+# Above this many remembered rows the exact hash set is folded into a Bloom filter
+DEDUP_MAX_EXACT = int(os.getenv('DEDUP_MAX_EXACT', '1000000'))
+
+# Persisted hashes older than this, relative to the newest row, are forgotten
+RETENTION_HOURS = 24
+
+NS_PER_HOUR = 3600 * 1_000_000_000
+
+# Fixed seed keeps row hashes identical across processes
+HASH_SEED = 0x6C6F6764
+
+# Polars only guarantees hash_rows values within a release, so persisted hashes carry the version
+HASHER = f"polars-{pl.__version__}"
+
+
+def row_hashes(df: pl.DataFrame) -> np.ndarray:
+    """64-bit hash of (timestamp_ns, service_name, message) per row"""
+    return df.select([
+        pl.col('timestamp_ns').cast(pl.Int64),
+        pl.col('service_name').cast(pl.String),
+        pl.col('message').cast(pl.String),
+    ]).hash_rows(seed=HASH_SEED).to_numpy().astype(np.uint64)
+
+
+class StreamingDeduplicator:
+    """Remembers row hashes across pages, shards and (with a state name) loader runs
+    
+    Hashes are kept in a sorted uint64 array next to their row timestamps, 16
+    bytes per row, so persisted state can expire by age. Past max_exact rows
+    the set becomes a Bloom filter of fixed size; a false positive then drops
+    a unique row with probability about BLOOM_ERROR. A full filter is kept as
+    the previous generation next to a fresh one, so at least the most recent
+    capacity rows are always remembered. State is kept under LOADER_STATE_DIR
+    unless state_dir names another directory.
+    """
+    
+    BLOOM_ERROR = 1e-3
+    
+    def __init__(self, state_name: Optional[str] = None, max_exact: int = DEDUP_MAX_EXACT,
+                 retention_hours: int = RETENTION_HOURS, state_dir: Optional[str] = None):
+        self.state_name = state_name
+        self.state_dir = state_dir
+        self.max_exact = max_exact
+        self.retention_ns = retention_hours * NS_PER_HOUR
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.bloom: Optional[sketches.BloomFilter] = None
+        self.previous_bloom: Optional[sketches.BloomFilter] = None
+        self.newest_ns = 0
+        self.rows_seen = 0
+        self.duplicates = 0
+        
+        state = state_store.load_json(state_name, default=None, directory=state_dir) if state_name else None
+        if state and state.get('hasher') != HASHER:
+            print(f"Discarding dedup state {state_name} hashed by {state.get('hasher')}", file=sys.stderr)
+        elif state:
+            self.newest_ns = state['newest_ns']
+            if state.get('bloom'):
+                self.bloom = sketches.BloomFilter.from_dict(state['bloom'])
+                if state.get('previous_bloom'):
+                    self.previous_bloom = sketches.BloomFilter.from_dict(state['previous_bloom'])
+            else:
+                self.hashes = sketches._decode(state['hashes'], np.uint64, (-1,))
+                self.timestamps = sketches._decode(state['timestamps'], np.int64, (-1,))
+            self._expire()
+    
+    def __len__(self) -> int:
+        """Number of remembered rows"""
+        if self.bloom is not None:
+            return self.bloom.count + (self.previous_bloom.count if self.previous_bloom is not None else 0)
+        return len(self.hashes)
+    
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Boolean membership per row hash"""
+        if self.bloom is not None:
+            found = self.bloom.contains(hashes)
+            if self.previous_bloom is not None:
+                found |= self.previous_bloom.contains(hashes)
+            return found
+        positions = np.searchsorted(self.hashes, hashes)
+        found = positions < len(self.hashes)
+        found[found] = self.hashes[positions[found]] == hashes[found]
+        return found
+    
+    def add(self, hashes: np.ndarray, timestamps: np.ndarray) -> None:
+        """Remember row hashes not seen before"""
+        if len(hashes) == 0:
+            return
+        self.newest_ns = max(self.newest_ns, int(timestamps.max()))
+        
+        if self.bloom is not None:
+            if self.bloom.count + len(hashes) > self.bloom.capacity:
+                self.previous_bloom = self.bloom
+                self.bloom = sketches.BloomFilter(capacity=self.bloom.capacity, error=self.bloom.error)
+            self.bloom.add(hashes)
+            return
+        
+        # Insert the sorted batch in place rather than re-sorting everything remembered
+        order = np.argsort(hashes)
+        hashes, timestamps = hashes[order], timestamps[order].astype(np.int64)
+        positions = np.searchsorted(self.hashes, hashes)
+        self.hashes = np.insert(self.hashes, positions, hashes)
+        self.timestamps = np.insert(self.timestamps, positions, timestamps)
+        
+        if len(self.hashes) > self.max_exact:
+            # Fold into a Bloom filter with room to grow
+            self.bloom = sketches.BloomFilter(capacity=4 * self.max_exact, error=self.BLOOM_ERROR)
+            self.bloom.add(self.hashes)
+            self.hashes = np.zeros(0, dtype=np.uint64)
+            self.timestamps = np.zeros(0, dtype=np.int64)
+    
+    def filter(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Drop rows repeated within the page or seen on earlier pages, keeping first occurrences"""
+        if df.is_empty():
+            return df
+        
+        hashes = row_hashes(df)
+        keep = pl.Series(hashes).is_first_distinct().to_numpy() & ~self.contains(hashes)
+        self.add(hashes[keep], df['timestamp_ns'].to_numpy()[keep])
+        
+        self.rows_seen += df.height
+        self.duplicates += df.height - int(keep.sum())
+        return df.filter(pl.Series(keep))
+    
+    def merge(self, other: 'StreamingDeduplicator') -> 'StreamingDeduplicator':
+        """Union with the hashes remembered by another run or shard"""
+        if other.bloom is not None:
+            if self.bloom is None:
+                self.bloom = sketches.BloomFilter(capacity=other.bloom.capacity, error=other.bloom.error)
+                self.bloom.add(self.hashes)
+                self.hashes = np.zeros(0, dtype=np.uint64)
+                self.timestamps = np.zeros(0, dtype=np.int64)
+            self.bloom.merge(other.bloom)
+            if other.previous_bloom is not None:
+                if self.previous_bloom is None:
+                    self.previous_bloom = other.previous_bloom
+                else:
+                    self.previous_bloom.merge(other.previous_bloom)
+            self.newest_ns = max(self.newest_ns, other.newest_ns)
+        else:
+            new = ~self.contains(other.hashes)
+            if new.any():
+                self.add(other.hashes[new], other.timestamps[new])
+        self.rows_seen += other.rows_seen
+        self.duplicates += other.duplicates
+        return self
+    
+    def _expire(self) -> None:
+        """Forget hashes of rows older than retention"""
+        if self.bloom is not None:
+            return
+        cutoff = self.newest_ns - self.retention_ns
+        if len(self.timestamps) and self.timestamps.min() < cutoff:
+            recent = self.timestamps >= cutoff
+            self.hashes, self.timestamps = self.hashes[recent], self.timestamps[recent]
+    
+    def stats(self) -> Dict[str, Any]:
+        """Rows seen, duplicates dropped and memory held"""
+        return {
+            'mode': 'bloom' if self.bloom is not None else 'exact',
+            'remembered': len(self),
+            'rows_seen': self.rows_seen,
+            'duplicates': self.duplicates,
+            'memory_bytes': sum(b.bits.nbytes for b in (self.bloom, self.previous_bloom) if b is not None)
+            if self.bloom is not None else self.hashes.nbytes + self.timestamps.nbytes,
+        }
+    
+    def save(self) -> None:
+        """Persist the remembered hashes for the next run"""
+        if not self.state_name:
+            return
+        
+        self._expire()
+        state = {'hasher': HASHER, 'newest_ns': self.newest_ns}
+        if self.bloom is not None:
+            state['bloom'] = self.bloom.to_dict()
+            if self.previous_bloom is not None:
+                state['previous_bloom'] = self.previous_bloom.to_dict()
+        else:
+            state['hashes'] = sketches._encode(self.hashes)
+            state['timestamps'] = sketches._encode(self.timestamps)
+        state_store.save_json(self.state_name, state, directory=self.state_dir)
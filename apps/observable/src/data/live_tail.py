@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+Live tail server for the security and operations dashboards
+Follows Loki's tail websocket and polls Quickwit incrementally, enriches rows in micro-batches with the loader classes and pushes them to browsers over Server-Sent Events
+"""
+
+import os
+import sys
+import ssl
+import json
+import time
+import base64
+import socket
+import hashlib
+import threading
+import collections
+import urllib.parse
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+import requests
+import polars as pl
+
+import anomaly
+import dedup
+import loaders
+import loki_planner
+import sampling
+
+
+LIVE_TAIL_PORT = int(os.getenv('LIVE_TAIL_PORT', '8765'))
+
+# Sources to follow, comma separated
+LIVE_TAIL_SOURCES = os.getenv('LIVE_TAIL_SOURCES', 'loki,quickwit')
+
+LOKI_TAIL_QUERY = os.getenv('LOKI_TAIL_QUERY', loki_planner.LOKI_STREAM_SELECTOR)
+
+# Micro-batch flush interval for the Loki tail and poll interval for Quickwit
+BATCH_INTERVAL_SECONDS = float(os.getenv('LIVE_TAIL_BATCH_SECONDS', '0.5'))
+POLL_INTERVAL_SECONDS = float(os.getenv('LIVE_TAIL_POLL_SECONDS', '1'))
+
+# Rows per pushed batch; larger batches are cut down with the stratified sampler
+MAX_BATCH_ROWS = 500
+
+# Batches buffered per subscriber; the oldest are dropped when a browser falls behind
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('LIVE_TAIL_QUEUE_SIZE', '64'))
+
+# Quickwit polls re-read this much history so late rows are not missed; repeats are deduplicated
+POLL_OVERLAP_SECONDS = 5
+
+# Hits per Quickwit page, and pages read per poll before the rest is left to the next poll
+POLL_PAGE_HITS = MAX_BATCH_ROWS * 2
+MAX_POLL_PAGES = 20
+
+KEEPALIVE_SECONDS = 15
+
+RECONNECT_MAX_SECONDS = 30
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class WebSocketClient:
+    """Minimal RFC 6455 client for reading a text message stream
+    
+    Frames are parsed from an internal buffer that is only consumed once a
+    whole frame has arrived, so a socket timeout can interrupt recv() at any
+    point and the next call resumes where it left off.
+    """
+    
+    def __init__(self, url: str, timeout: float = 30):
+        parts = urllib.parse.urlsplit(url)
+        secure = parts.scheme in ('wss', 'https')
+        port = parts.port or (443 if secure else 80)
+        
+        sock = socket.create_connection((parts.hostname, port), timeout=timeout)
+        if secure:
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+        self.sock = sock
+        self.buffer = bytearray()
+        
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        sock.sendall((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.netloc}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode('ascii'))
+        
+        while b'\r\n\r\n' not in self.buffer:
+            self._receive()
+        head, _, rest = bytes(self.buffer).partition(b'\r\n\r\n')
+        self.buffer = bytearray(rest)
+        
+        status, *header_lines = head.decode('latin-1').split('\r\n')
+        headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(':') for line in header_lines)}
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        if ' 101 ' not in f"{status} " or headers.get('sec-websocket-accept') != accept:
+            sock.close()
+            raise ConnectionError(f"WebSocket handshake failed: {status}")
+    
+    def _receive(self) -> None:
+        """Read more bytes into the buffer"""
+        chunk = self.sock.recv(65536)
+        if not chunk:
+            raise ConnectionError("WebSocket connection closed")
+        self.buffer.extend(chunk)
+    
+    def _frame(self) -> Tuple[int, int, bytes]:
+        """Next complete frame as (fin, opcode, payload), consuming it from the buffer"""
+        while True:
+            if len(self.buffer) >= 2:
+                length = self.buffer[1] & 0x7F
+                offset = 2 + {126: 2, 127: 8}.get(length, 0)
+                masked = self.buffer[1] & 0x80
+                if len(self.buffer) >= offset:
+                    if length >= 126:
+                        length = int.from_bytes(self.buffer[2:offset], 'big')
+                    start = offset + (4 if masked else 0)
+                    if len(self.buffer) >= start + length:
+                        break
+            self._receive()
+        
+        fin, opcode = self.buffer[0] & 0x80, self.buffer[0] & 0x0F
+        payload = bytes(self.buffer[start:start + length])
+        if masked:
+            mask = self.buffer[offset:start]
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        del self.buffer[:start + length]
+        return fin, opcode, payload
+    
+    def _send(self, opcode: int, payload: bytes = b'') -> None:
+        """Send a single masked frame"""
+        mask = os.urandom(4)
+        header = bytearray([0x80 | opcode])
+        if len(payload) < 126:
+            header.append(0x80 | len(payload))
+        elif len(payload) < 1 << 16:
+            header.append(0x80 | 126)
+            header.extend(len(payload).to_bytes(2, 'big'))
+        else:
+            header.append(0x80 | 127)
+            header.extend(len(payload).to_bytes(8, 'big'))
+        self.sock.sendall(bytes(header) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload)))
+    
+    def settimeout(self, timeout: Optional[float]) -> None:
+        """Bound how long recv() waits for data"""
+        self.sock.settimeout(timeout)
+    
+    def recv(self) -> Optional[str]:
+        """Next text message, or None once the server closes the connection"""
+        fragments: List[bytes] = []
+        while True:
+            fin, opcode, payload = self._frame()
+            if opcode == 0x8:
+                self.close()
+                return None
+            if opcode == 0x9:
+                self._send(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                fragments.append(payload)
+                if fin:
+                    return b''.join(fragments).decode('utf-8')
+    
+    def close(self) -> None:
+        """Close the connection"""
+        try:
+            self._send(0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class Subscriber:
+    """Bounded queue of serialized batches for one browser connection"""
+    
+    def __init__(self, sources: Set[str], size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.sources = sources
+        self.queue: Deque[str] = collections.deque(maxlen=size)
+        self.dropped = 0
+        self.condition = threading.Condition()
+    
+    def put(self, message: str) -> None:
+        """Queue a message, dropping the oldest when full"""
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(message)
+            self.condition.notify()
+    
+    def get(self, timeout: float) -> Optional[str]:
+        """Next message, or None after timeout"""
+        with self.condition:
+            if not self.queue:
+                self.condition.wait(timeout)
+            return self.queue.popleft() if self.queue else None
+
+
+class Broadcaster:
+    """Fans batches out to subscribers, serializing each batch once"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers: List[Subscriber] = []
+        self.sequence = 0
+        self.published: Dict[str, int] = collections.Counter()
+    
+    def subscribe(self, sources: Set[str]) -> Subscriber:
+        """Register a subscriber for the given sources"""
+        subscriber = Subscriber(sources)
+        with self.lock:
+            self.subscribers.append(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """Remove a disconnected subscriber"""
+        with self.lock:
+            self.subscribers.remove(subscriber)
+    
+    def publish(self, source: str, rows: List[Dict[str, Any]], total: int) -> None:
+        """Send a batch of rows from a source to every interested subscriber"""
+        with self.lock:
+            self.sequence += 1
+            self.published[source] += total
+            data = json.dumps({
+                'source': source,
+                'rows': rows,
+                'total': total,
+                'published_at': time.time()
+            }, default=str)
+            message = f"id: {self.sequence}\nevent: {source}\ndata: {data}\n\n"
+            for subscriber in self.subscribers:
+                if source in subscriber.sources:
+                    subscriber.put(message)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Subscriber, row and drop counters"""
+        with self.lock:
+            return {
+                'subscribers': len(self.subscribers),
+                'published_rows': dict(self.published),
+                'dropped_batches': sum(s.dropped for s in self.subscribers),
+            }
+
+
+def _cap(frame: pl.DataFrame) -> pl.DataFrame:
+    """Cut an oversized batch down to a stratified sample, newest first"""
+    if frame.height > MAX_BATCH_ROWS:
+        return sampling.stratified_sample(frame, size=MAX_BATCH_ROWS)
+    return frame.sort('timestamp_ns', descending=True)
+
+
+class LokiTailSource:
+    """Follows Loki's /loki/api/v1/tail websocket and publishes enriched micro-batches"""
+    
+    name = 'loki'
+    
+    def __init__(self, broadcaster: Broadcaster, query: str = LOKI_TAIL_QUERY,
+                 interval: float = BATCH_INTERVAL_SECONDS):
+        self.broadcaster = broadcaster
+        self.query = query
+        self.interval = interval
+        self.loader = loaders.load('loki-logs.py').LokiDataLoader()
+        # Reconnects resume from the last timestamp and may repeat entries
+        self.deduplicator = dedup.StreamingDeduplicator(max_exact=100_000)
+        self.last_ns = time.time_ns()
+    
+    def _url(self) -> str:
+        base = self.loader.loki_endpoint.replace('https://', 'wss://').replace('http://', 'ws://')
+        params = urllib.parse.urlencode({'query': self.query, 'start': self.last_ns, 'limit': MAX_BATCH_ROWS})
+        return f"{base}/loki/api/v1/tail?{params}"
+    
+    def flush(self, streams: List[Dict[str, Any]]) -> None:
+        """Enrich and publish the entries received since the last flush"""
+        # Templates are assigned from the persisted clusters; counting them is left to the snapshot loader
+        frame = self.loader.template_miner.mine(self.loader._process_loki_response({'data': {'result': streams}}))
+        frame = self.deduplicator.filter(frame)
+        if frame.is_empty():
+            return
+        self.last_ns = max(self.last_ns, int(frame['timestamp_ns'].max()))
+        self.broadcaster.publish(self.name, _cap(frame).to_dicts(), frame.height)
+    
+    def run(self, stop: threading.Event) -> None:
+        """Tail until stopped, reconnecting with backoff"""
+        backoff = 1
+        while not stop.is_set():
+            try:
+                client = WebSocketClient(self._url())
+            except (OSError, ConnectionError) as e:
+                print(f"Error connecting to Loki tail: {e}", file=sys.stderr)
+                stop.wait(backoff)
+                backoff = min(backoff * 2, RECONNECT_MAX_SECONDS)
+                continue
+            
+            backoff = 1
+            pending: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.interval
+            try:
+                while not stop.is_set():
+                    client.settimeout(max(deadline - time.monotonic(), 0.01))
+                    try:
+                        message = client.recv()
+                        if message is None:
+                            break
+                        pending.extend(json.loads(message).get('streams', []))
+                    except socket.timeout:
+                        pass
+                    
+                    if time.monotonic() >= deadline:
+                        if pending:
+                            self.flush(pending)
+                            pending = []
+                        deadline = time.monotonic() + self.interval
+            except (OSError, ConnectionError, ValueError) as e:
+                print(f"Loki tail interrupted: {e}", file=sys.stderr)
+            finally:
+                if pending:
+                    self.flush(pending)
+                client.close()
+
+
+class QuickwitPollSource:
+    """Polls Quickwit for rows newer than the last batch and publishes them analyzed"""
+    
+    name = 'quickwit'
+    
+    def __init__(self, broadcaster: Broadcaster, interval: float = POLL_INTERVAL_SECONDS):
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self.loader = loaders.load('quickwit-logs.py').QuickwitDataLoader()
+        # Baselines keep learning in memory; the snapshot loader owns the persisted state
+        self.detector = anomaly.AnomalyDetector()
+        self.deduplicator = dedup.StreamingDeduplicator(max_exact=100_000)
+        self.watermark_ns = time.time_ns()
+        # Start time and offset to resume a paged poll from once a poll reached MAX_POLL_PAGES
+        self.cursor: Optional[Tuple[int, int]] = None
+    
+    def poll(self) -> None:
+        """Fetch, analyze and publish the rows since the watermark, oldest first, a page at a time
+        
+        Pages are read in ascending time order, so every row up to the newest
+        one seen has been published and the watermark can follow it page by
+        page. A burst larger than MAX_POLL_PAGES pages is resumed at the same
+        offset by the next poll instead of being skipped.
+        """
+        url = f"{self.loader.quickwit_endpoint}/api/v1/otel-logs-v0_7/search"
+        start_timestamp, offset = self.cursor or (self.watermark_ns // 1_000_000_000 - POLL_OVERLAP_SECONDS, 0)
+        for _ in range(MAX_POLL_PAGES):
+            payload = {
+                "query": "*",
+                "max_hits": POLL_PAGE_HITS,
+                "start_offset": offset,
+                "start_timestamp": start_timestamp,
+                "sort": [{"timestamp_nanos": {"order": "asc"}}]
+            }
+            response = self.loader.session.post(url, json=payload, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            offset += POLL_PAGE_HITS
+            
+            frame = self.deduplicator.filter(self.loader._process_quickwit_response(data))
+            if not frame.is_empty():
+                self.watermark_ns = max(self.watermark_ns, int(frame['timestamp_ns'].max()))
+                frame = frame.with_columns(self.loader._security_relevance().alias('is_security_relevant'))
+                frame = frame.with_columns(self.detector.score_and_update(frame))
+                self.broadcaster.publish(self.name, self.loader._enhance(_cap(frame)), frame.height)
+            if len(data.get('hits', [])) < POLL_PAGE_HITS:
+                self.cursor = None
+                return
+        self.cursor = (start_timestamp, offset)
+        print(f"Quickwit poll stopped after {MAX_POLL_PAGES} pages of {POLL_PAGE_HITS} hits; "
+              f"resuming at offset {offset} on the next poll", file=sys.stderr)
+    
+    def run(self, stop: threading.Event) -> None:
+        """Poll until stopped"""
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll()
+            except requests.exceptions.RequestException as e:
+                print(f"Error polling Quickwit: {e}", file=sys.stderr)
+            except Exception as e:
+                # A malformed response or analysis failure must not end the polling thread
+                print(f"Error processing Quickwit poll: {e}", file=sys.stderr)
+            stop.wait(max(self.interval - (time.monotonic() - started), 0))
+
+
+class LiveTailHandler(BaseHTTPRequestHandler):
+    """GET /events streams batches as Server-Sent Events; GET /health reports counters"""
+    
+    broadcaster: Broadcaster = None
+    sources: Set[str] = set()
+    
+    def _send_headers(self, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+    
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == '/health':
+            self._send_headers('application/json')
+            self.wfile.write(json.dumps({
+                'sources': sorted(self.sources),
+                **self.broadcaster.stats(),
+                'last_updated': datetime.now().isoformat()
+            }).encode('utf-8'))
+            return
+        if url.path != '/events':
+            self.send_error(404)
+            return
+        
+        requested = urllib.parse.parse_qs(url.query).get('sources', [','.join(self.sources)])[0]
+        subscriber = self.broadcaster.subscribe(set(requested.split(',')) & self.sources)
+        self._send_headers('text/event-stream')
+        try:
+            while True:
+                message = subscriber.get(timeout=KEEPALIVE_SECONDS)
+                self.wfile.write((message or ': keepalive\n\n').encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.broadcaster.unsubscribe(subscriber)
+    
+    def log_message(self, format: str, *args: Any) -> None:
+        print(f"{self.address_string()} {format % args}", file=sys.stderr)
+
+
+def main():
+    """Main function to run the live tail server"""
+    broadcaster = Broadcaster()
+    sources = {LokiTailSource.name: LokiTailSource, QuickwitPollSource.name: QuickwitPollSource}
+    enabled = [name.strip() for name in LIVE_TAIL_SOURCES.split(',') if name.strip() in sources]
+    
+    stop = threading.Event()
+    for name in enabled:
+        source = sources[name](broadcaster)
+        threading.Thread(target=source.run, args=(stop,), name=name, daemon=True).start()
+    
+    LiveTailHandler.broadcaster = broadcaster
+    LiveTailHandler.sources = set(enabled)
+    server = ThreadingHTTPServer(('', LIVE_TAIL_PORT), LiveTailHandler)
+    server.daemon_threads = True
+    print(f"Live tail of {', '.join(enabled)} on port {LIVE_TAIL_PORT}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+"""
+Import helper for data loaders that build on each other
+Loader scripts have hyphenated file names, which are not valid module names
+"""
+
+import os
+import importlib.util
+from types import ModuleType
+
+
+def load(filename: str) -> ModuleType:
+    """Import a sibling data loader script by file name"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+    spec = importlib.util.spec_from_file_location(filename.replace('-', '_')[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Local archive of fetched log rows for replay and backfill
+Appends normalized rows to hourly zstd-compressed Parquet segments, compacted to one per hour once the hour closes, with a memory-mapped sparse index of timestamps to segment row offsets
+"""
+
+import os
+import sys
+import fcntl
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+import polars as pl
+
+import dedup
+import log_schema
+
+
+# On the Observable PVC next to the loaders; kept apart from LOADER_STATE_DIR so replays can use scratch state
+ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.archive'))
+
+# Archive every live fetch
+ARCHIVE_ENABLED = os.getenv('LOG_ARCHIVE', 'true').lower() in ('1', 'true', 'yes')
+
+# Segments whose newest row is older than this are deleted
+RETENTION_DAYS = float(os.getenv('LOG_ARCHIVE_RETENTION_DAYS', '30'))
+
+ZSTD_LEVEL = int(os.getenv('LOG_ARCHIVE_ZSTD_LEVEL', '3'))
+
+# Read the archive instead of the backends, over LOG_REPLAY_START..LOG_REPLAY_END when set
+REPLAY = os.getenv('LOG_REPLAY', '').lower() in ('1', 'true', 'yes')
+REPLAY_START = os.getenv('LOG_REPLAY_START', '')
+REPLAY_END = os.getenv('LOG_REPLAY_END', '')
+
+# Rows per Parquet row group and per sparse index entry
+BLOCK_ROWS = 8192
+
+# One fixed-width record per block: its first and last timestamp and where its rows live
+INDEX_DTYPE = np.dtype([
+    ('start_ns', '<i8'),
+    ('end_ns', '<i8'),
+    ('segment', '<u8'),
+    ('row', '<u4'),
+    ('rows', '<u4'),
+])
+
+INDEX_NAME = 'index.bin'
+LOCK_NAME = '.lock'
+
+# Hashes of the archived rows, kept with the archive so they always describe its contents
+HASHES_NAME = 'hashes.json'
+
+NS_PER_HOUR = 3600 * 1_000_000_000
+
+
+def parse_time(value: str) -> int:
+    """Nanoseconds since the epoch of epoch seconds or an ISO timestamp, UTC unless it has an offset"""
+    if value.strip().lstrip('-').replace('.', '', 1).isdigit():
+        return int(float(value) * 1e9)
+    parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1e9)
+
+
+def replay_window(hours_back: float, start: str = REPLAY_START, end: str = REPLAY_END) -> Tuple[int, int]:
+    """Replay window in nanoseconds; hours_back before the end unless a start is given"""
+    end_ns = parse_time(end) if end else int(datetime.now(timezone.utc).timestamp() * 1e9)
+    start_ns = parse_time(start) if start else end_ns - int(hours_back * 3600 * 1e9)
+    return start_ns, end_ns
+
+
+class LogArchive:
+    """Per-source archive of normalized log rows
+    
+    Each append sorts its rows by time and writes one segment per UTC hour as
+    <source>/<YYYY-MM-DD>/<HH>/<segment>.parquet, in row groups of BLOCK_ROWS.
+    The source's index.bin gains one INDEX_DTYPE record per row group, so a
+    time range is resolved against a memory-mapped array without opening any
+    segment, and only the matching row groups are read. The open (newest)
+    hour collects a small segment per run; once a newer hour is archived,
+    every closed hour with several segments is rewritten as one, so late rows
+    cost a rewrite of their hour and finished hours hold a single file. Rows
+    already archived by an earlier run are dropped through a deduplicator
+    whose hashes are stored in the source directory, since loaders fetch
+    overlapping windows.
+    """
+    
+    def __init__(self, directory: str = ARCHIVE_DIR, retention_days: float = RETENTION_DAYS,
+                 zstd_level: int = ZSTD_LEVEL):
+        self.directory = directory
+        self.retention_ns = int(retention_days * 24 * NS_PER_HOUR)
+        self.zstd_level = zstd_level
+    
+    def _source_dir(self, source: str) -> str:
+        """Directory holding a source's segments and index"""
+        return os.path.join(self.directory, source)
+    
+    def _segment_path(self, source: str, segment: int, start_ns: int) -> str:
+        """Location of a segment, partitioned by the UTC hour of its rows"""
+        hour = datetime.fromtimestamp(start_ns // NS_PER_HOUR * 3600, timezone.utc)
+        return os.path.join(self._source_dir(source), f"{hour:%Y-%m-%d}", f"{hour:%H}", f"{segment:012d}.parquet")
+    
+    @contextmanager
+    def _lock(self, source: str) -> Iterator[None]:
+        """Exclusive lock serializing writers of a source across loader processes"""
+        os.makedirs(self._source_dir(source), exist_ok=True)
+        with open(os.path.join(self._source_dir(source), LOCK_NAME), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def index(self, source: str) -> np.ndarray:
+        """Memory-mapped sparse index of a source, empty when nothing is archived"""
+        path = os.path.join(self._source_dir(source), INDEX_NAME)
+        try:
+            # A record being appended by another writer is not visible yet
+            records = os.path.getsize(path) // INDEX_DTYPE.itemsize
+        except OSError:
+            records = 0
+        if not records:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(path, dtype=INDEX_DTYPE, mode='r', shape=(records,))
+    
+    def _write_segment(self, source: str, segment: int, part: pl.DataFrame) -> List[Tuple[int, int, int, int, int]]:
+        """Write time-sorted rows of one hour as a segment and return its index records"""
+        timestamps = part['timestamp_ns'].to_numpy()
+        path = self._segment_path(source, segment, int(timestamps[0]))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        part.write_parquet(tmp_path, compression='zstd', compression_level=self.zstd_level,
+                           row_group_size=BLOCK_ROWS, statistics=True)
+        os.replace(tmp_path, path)
+        
+        records = []
+        for row in range(0, len(timestamps), BLOCK_ROWS):
+            block = timestamps[row:row + BLOCK_ROWS]
+            records.append((block[0], block[-1], segment, row, len(block)))
+        return records
+    
+    def _replace_index(self, source: str, records: np.ndarray) -> None:
+        """Atomically rewrite a source's index; caller holds the lock"""
+        path = os.path.join(self._source_dir(source), INDEX_NAME)
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    
+    def _remove_segments(self, source: str, starts: Dict[int, int]) -> None:
+        """Delete segment files given their first timestamps, once the index no longer points at them"""
+        for segment, start_ns in starts.items():
+            segment_path = self._segment_path(source, segment, start_ns)
+            try:
+                os.remove(segment_path)
+                # Drop the hour and day directories once empty
+                os.removedirs(os.path.dirname(segment_path))
+            except OSError:
+                pass
+    
+    def append(self, source: str, frame: pl.DataFrame) -> int:
+        """Archive the rows of a normalized frame not archived before; returns the rows written"""
+        if frame.is_empty():
+            return 0
+        
+        with self._lock(source):
+            deduplicator = dedup.StreamingDeduplicator(state_name=HASHES_NAME, state_dir=self._source_dir(source))
+            frame = deduplicator.filter(frame)
+            if frame.is_empty():
+                return 0
+            
+            index = self.index(source)
+            segment = int(index['segment'].max()) + 1 if len(index) else 0
+            records = []
+            hours = frame.sort('timestamp_ns').with_columns((pl.col('timestamp_ns') // NS_PER_HOUR).alias('_hour'))
+            for part in hours.partition_by('_hour', maintain_order=True):
+                records.extend(self._write_segment(source, segment, part.drop('_hour')))
+                segment += 1
+            
+            # Segments are in place before the index points at them
+            with open(os.path.join(self._source_dir(source), INDEX_NAME), 'ab') as f:
+                f.write(np.array(records, dtype=INDEX_DTYPE).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            deduplicator.save()
+            
+            self._compact(source)
+            self._prune(source, int(frame['timestamp_ns'].max()) - self.retention_ns)
+            return frame.height
+    
+    def _compact(self, source: str) -> None:
+        """Rewrite each closed hour holding several segments as one segment; caller holds the lock"""
+        index = self.index(source)
+        if not len(index):
+            return
+        
+        hours = index['start_ns'] // NS_PER_HOUR
+        open_hour = hours.max()
+        segments_by_hour: Dict[int, np.ndarray] = {}
+        for hour in np.unique(hours[hours < open_hour]).tolist():
+            segments = np.unique(index['segment'][hours == hour])
+            if len(segments) > 1:
+                segments_by_hour[hour] = segments
+        if not segments_by_hour:
+            return
+        
+        segment = int(index['segment'].max()) + 1
+        records = []
+        merged: Dict[int, int] = {}
+        for hour, segments in segments_by_hour.items():
+            starts = {int(s): int(index['start_ns'][index['segment'] == s].min()) for s in segments}
+            try:
+                part = log_schema.concat(
+                    pl.read_parquet(self._segment_path(source, s, start_ns)) for s, start_ns in starts.items()
+                ).sort('timestamp_ns')
+            except (OSError, pl.exceptions.ComputeError) as e:
+                print(f"Not compacting archived {source} hour {hour}: {e}", file=sys.stderr)
+                continue
+            records.extend(self._write_segment(source, segment, part))
+            merged.update(starts)
+            segment += 1
+        if not merged:
+            return
+        
+        kept = np.array(index[~np.isin(index['segment'], list(merged))])
+        self._replace_index(source, np.concatenate([kept, np.array(records, dtype=INDEX_DTYPE)]))
+        self._remove_segments(source, merged)
+    
+    def _prune(self, source: str, before_ns: int) -> None:
+        """Delete segments whose rows are all older than before_ns; caller holds the lock"""
+        index = self.index(source)
+        if not len(index) or index['end_ns'].min() >= before_ns:
+            return
+        
+        recent = np.unique(index['segment'][index['end_ns'] >= before_ns])
+        expired = np.setdiff1d(np.unique(index['segment']), recent)
+        if not len(expired):
+            return
+        starts = {int(segment): int(index['start_ns'][index['segment'] == segment].min()) for segment in expired}
+        
+        self._replace_index(source, np.array(index[~np.isin(index['segment'], expired)]))
+        self._remove_segments(source, starts)
+    
+    def read(self, source: str, start_ns: int, end_ns: int) -> pl.DataFrame:
+        """Archived rows of a source with start_ns <= timestamp_ns < end_ns, newest first"""
+        index = self.index(source)
+        blocks = index[(index['end_ns'] >= start_ns) & (index['start_ns'] < end_ns)]
+        if not len(blocks):
+            return log_schema.empty_frame()
+        
+        frames = []
+        in_window = (pl.col('timestamp_ns') >= start_ns) & (pl.col('timestamp_ns') < end_ns)
+        for segment in np.unique(blocks['segment']).tolist():
+            # Blocks of a time-sorted segment that overlap the window are contiguous
+            matched = blocks[blocks['segment'] == segment]
+            first = int(matched['row'].min())
+            last = int((matched['row'].astype(np.int64) + matched['rows']).max())
+            path = self._segment_path(source, segment, int(matched['start_ns'].min()))
+            try:
+                frames.append(pl.scan_parquet(path).slice(first, last - first).filter(in_window).collect())
+            except (OSError, pl.exceptions.ComputeError) as e:
+                print(f"Skipping unreadable archive segment {path}: {e}", file=sys.stderr)
+        
+        df = log_schema.concat(frames)
+        # Parquet does not keep the Enum and Categorical schema columns
+        return df.with_columns([
+            pl.col(column).cast(dtype) for column, dtype in log_schema.LOG_SCHEMA.items() if column in df.columns
+        ]).sort('timestamp_ns', descending=True)
+
+
+_archive: Optional[LogArchive] = None
+
+
+def shared() -> LogArchive:
+    """The process-wide archive"""
+    global _archive
+    if _archive is None:
+        _archive = LogArchive()
+    return _archive
+
+
+def append(source: str, frame: pl.DataFrame) -> None:
+    """Archive a live fetch when archiving is enabled; failures never fail the loader"""
+    if not ARCHIVE_ENABLED or REPLAY:
+        return
+    try:
+        shared().append(source, frame)
+    except Exception as e:
+        print(f"Error archiving {source} logs: {e}", file=sys.stderr)
+
+
+def replay(source: str, hours_back: float) -> pl.DataFrame:
+    """Archived rows of the replay window in place of a live fetch"""
+    start_ns, end_ns = replay_window(hours_back)
+    df = shared().read(source, start_ns, end_ns)
+    print(f"Replaying {df.height} archived {source} rows", file=sys.stderr)
+    return df
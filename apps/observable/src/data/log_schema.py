@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Unified log schema shared by the Loki and Quickwit data loaders
+Maps both backends into one normalized Polars frame so enrichment and dashboard joins work the same way for operational and security logs
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import polars as pl
+
+
+# Categorical columns built in separate frames must share one string cache on
+# Polars releases that still use it
+if not hasattr(pl, 'Categories'):
+    pl.enable_string_cache()
+
+# Canonical severities, ordered from least to most severe
+SEVERITY_LEVELS = ['unknown', 'debug', 'info', 'warning', 'error', 'critical']
+SEVERITY_DTYPE = pl.Enum(SEVERITY_LEVELS)
+
+# Prefix for flattened attribute columns, e.g. attributes.source_ip -> attr.source_ip
+ATTRIBUTE_PREFIX = 'attr.'
+
+# Core columns every normalized frame carries. Attribute columns are added on
+# top as Utf8 columns named ATTRIBUTE_PREFIX + dotted attribute path.
+LOG_SCHEMA = {
+    'timestamp_ns': pl.Int64,
+    'source': pl.Categorical,
+    'service_name': pl.Categorical,
+    'severity': SEVERITY_DTYPE,
+    'severity_text': pl.String,
+    'message': pl.String,
+    'trace_id': pl.String,
+    'span_id': pl.String,
+}
+
+# Fields of JSON log lines promoted to schema columns, first present wins;
+# other fields become attribute columns, attributes.* without the prefix
+JSON_FIELDS = {
+    'message': ('message', 'msg', 'body'),
+    'severity_text': ('severity', 'severity_text', 'level', 'levelname'),
+    'service_name': ('service_name', 'service.name', 'service'),
+    'trace_id': ('trace_id', 'traceId'),
+    'span_id': ('span_id', 'spanId'),
+}
+
+# JSON lines parsed per batch to extend the cached body schema
+JSON_SCHEMA_SAMPLE = 512
+
+# Rows per chunk when a batch fails to decode, so only chunks with bad lines take the slow paths
+JSON_FALLBACK_CHUNK = 1024
+
+# Default log_type when the record does not carry one
+DEFAULT_LOG_TYPES = {
+    'loki': 'operational',
+    'quickwit': 'security',
+}
+
+# Keyword categories, checked in order; the first match wins
+CATEGORY_KEYWORDS = {
+    'auth': ['login', 'logout', 'authentication', 'authorize', 'auth', 'signin', 'signout'],
+    'access': ['denied', 'forbidden', 'unauthorized', 'permission', 'access'],
+    'security': ['firewall', 'intrusion', 'malware', 'virus', 'attack', 'exploit'],
+    'network': ['connection', 'tcp', 'udp', 'port', 'network', 'socket'],
+    'system': ['system', 'kernel', 'process', 'service', 'daemon'],
+    'application': ['application', 'app', 'web', 'api', 'endpoint']
+}
+
+
+def empty_frame() -> pl.DataFrame:
+    """Return an empty frame with the core schema"""
+    return pl.DataFrame(schema=LOG_SCHEMA)
+
+
+def flatten_attributes(attributes: Any, prefix: str = ATTRIBUTE_PREFIX) -> Dict[str, str]:
+    """Flatten nested attributes into prefixed, dotted string columns"""
+    flat = {}
+    if not isinstance(attributes, dict):
+        return flat
+    
+    stack = [(prefix, attributes)]
+    while stack:
+        path, value = stack.pop()
+        for key, item in value.items():
+            name = f"{path}{key}"
+            if isinstance(item, dict):
+                stack.append((f"{name}.", item))
+            elif item is not None:
+                flat[name] = str(item).lower() if isinstance(item, bool) else str(item)
+    return flat
+
+
+def attribute(df: pl.DataFrame, *names: str, default: Optional[str] = '') -> pl.Expr:
+    """Coalesce the first present, non-empty attribute column among names"""
+    exprs = [
+        pl.when(pl.col(column) != '').then(pl.col(column))
+        for column in (f"{ATTRIBUTE_PREFIX}{name}" for name in names)
+        if column in df.columns
+    ]
+    exprs.append(pl.lit(default, dtype=pl.String))
+    return pl.coalesce(exprs)
+
+
+def _build_frame(source: str, timestamps: List[int], services: List[str], severities: List[str],
+                 messages: List[str], trace_ids: List[str], span_ids: List[str],
+                 attributes: List[Dict[str, str]]) -> pl.DataFrame:
+    """Assemble a normalized frame from column lists"""
+    if not timestamps:
+        return empty_frame()
+    
+    columns: Dict[str, List[Any]] = {
+        'timestamp_ns': timestamps,
+        'source': [source] * len(timestamps),
+        'service_name': services,
+        'severity_text': severities,
+        'message': messages,
+        'trace_id': trace_ids,
+        'span_id': span_ids,
+    }
+    
+    # Union of attribute keys, filled with nulls where a record lacks one
+    keys = sorted({key for attrs in attributes for key in attrs})
+    for key in keys:
+        columns[key] = [attrs.get(key) for attrs in attributes]
+    
+    schema = {name: LOG_SCHEMA.get(name, pl.String) for name in columns}
+    schema['severity_text'] = pl.String
+    df = pl.DataFrame(columns, schema=schema)
+    
+    return df.with_columns(
+        normalize_severity(pl.col('severity_text')).alias('severity')
+    ).select(list(LOG_SCHEMA) + keys)
+
+
+class JsonBodyDecoder:
+    """Decodes the JSON lines of a message column in one pass with a cached schema
+    
+    The schema is learned with json.loads from a sample of each batch and
+    kept between batches, so a steady stream of records decodes with a
+    single str.json_decode call. Every leaf decodes as a string and arrays
+    are skipped. A field decodes as the kind (object or scalar) most records
+    give it; lines that are not valid JSON decode to nulls, and records that
+    contradict the schema are pruned in Python, only in the chunks that
+    contain them.
+    """
+    
+    def __init__(self, sample_size: int = JSON_SCHEMA_SAMPLE):
+        self.sample_size = sample_size
+        self.kinds: Dict[Tuple[str, ...], Dict[str, int]] = {}
+        self.dtype: Optional[pl.Struct] = None
+    
+    def learn(self, lines: Iterable[str]) -> None:
+        """Count the kind of every field path in JSON object lines and rebuild the schema"""
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict):
+                self._count_fields(record, ())
+        self.dtype = self._struct(())
+    
+    def _count_fields(self, record: Dict[str, Any], prefix: Tuple[str, ...]) -> None:
+        """Count the kind of each field path in a decoded object"""
+        for key, value in record.items():
+            if value is None:
+                continue
+            path = prefix + (key,)
+            kind = 'object' if isinstance(value, dict) else 'array' if isinstance(value, list) else 'leaf'
+            counts = self.kinds.setdefault(path, {})
+            counts[kind] = counts.get(kind, 0) + 1
+            if kind == 'object':
+                self._count_fields(value, path)
+    
+    def _kind(self, path: Tuple[str, ...]) -> Optional[str]:
+        """Most common kind of a field path"""
+        counts = self.kinds.get(path)
+        return max(counts, key=lambda kind: counts[kind]) if counts else None
+    
+    def _struct(self, prefix: Tuple[str, ...]) -> Optional[pl.Struct]:
+        """Struct dtype of the decodable fields below a path"""
+        fields = {}
+        for path in self.kinds:
+            if len(path) != len(prefix) + 1 or path[:-1] != prefix:
+                continue
+            kind = self._kind(path)
+            if kind == 'leaf':
+                fields[path[-1]] = pl.String
+            elif kind == 'object':
+                child = self._struct(path)
+                if child is not None:
+                    fields[path[-1]] = child
+        return pl.Struct(fields) if fields else None
+    
+    def _prune(self, record: Dict[str, Any], prefix: Tuple[str, ...]) -> Dict[str, Any]:
+        """Drop fields whose kind contradicts the schema"""
+        pruned = {}
+        for key, value in record.items():
+            path = prefix + (key,)
+            kind = self._kind(path)
+            if kind == 'object' and isinstance(value, dict):
+                pruned[key] = self._prune(value, path)
+            elif kind == 'leaf' and not isinstance(value, (dict, list)):
+                pruned[key] = value
+        return pruned
+    
+    def _decode(self, lines: pl.Series) -> pl.Series:
+        """Struct column of JSON lines, falling back only as far as each chunk needs"""
+        try:
+            return lines.str.json_decode(self.dtype)
+        except pl.exceptions.ComputeError:
+            pass
+        
+        chunks = []
+        for offset in range(0, lines.len(), JSON_FALLBACK_CHUNK):
+            chunk = lines.slice(offset, JSON_FALLBACK_CHUNK)
+            try:
+                chunks.append(chunk.str.json_decode(self.dtype))
+                continue
+            except pl.exceptions.ComputeError:
+                pass
+            
+            # Null out lines that are not valid JSON
+            chunk = pl.select(pl.when(pl.lit(chunk).str.json_path_match('$').is_not_null()).then(pl.lit(chunk))).to_series()
+            try:
+                chunks.append(chunk.str.json_decode(self.dtype))
+                continue
+            except pl.exceptions.ComputeError:
+                pass
+            
+            # Some records contradict the schema
+            pruned = [json.dumps(self._prune(json.loads(line), ())) if line is not None else None for line in chunk.to_list()]
+            chunks.append(pl.Series(pruned, dtype=pl.String).str.json_decode(self.dtype))
+        return pl.concat(chunks)
+    
+    def _columns(self, expr: pl.Expr, dtype: pl.Struct, prefix: Tuple[str, ...]) -> List[pl.Expr]:
+        """Leaf fields of a struct expression, named by dotted path"""
+        columns = []
+        for field in dtype.fields:
+            path = prefix + (field.name,)
+            if isinstance(field.dtype, pl.Struct):
+                columns.extend(self._columns(expr.struct.field(field.name), field.dtype, path))
+            else:
+                columns.append(expr.struct.field(field.name).alias('.'.join(path)))
+        return columns
+    
+    def decode(self, messages: pl.Series) -> pl.DataFrame:
+        """One string column per decoded field path, null where a line is not JSON"""
+        is_json = messages.str.strip_chars_start().str.starts_with('{').fill_null(False)
+        lines = messages.filter(is_json)
+        if lines.is_empty():
+            return pl.DataFrame()
+        
+        self.learn((lines if lines.len() <= self.sample_size else lines.sample(self.sample_size, seed=0)).to_list())
+        if self.dtype is None:
+            return pl.DataFrame()
+        
+        candidates = pl.select(pl.when(pl.lit(is_json)).then(pl.lit(messages))).to_series()
+        return pl.DataFrame({'line': self._decode(candidates)}).select(self._columns(pl.col('line'), self.dtype, ()))
+
+
+def promote_json_bodies(df: pl.DataFrame, decoder: JsonBodyDecoder) -> pl.DataFrame:
+    """Replace JSON log lines with their message and promote their fields to columns
+    
+    Stream labels win over body fields for service and severity; lines that
+    are not JSON keep their text and fall back to the message heuristics.
+    """
+    if df.is_empty():
+        return df
+    decoded = decoder.decode(df['message'])
+    if decoded.width == 0:
+        return df
+    
+    decoded = decoded.rename({name: f"_json.{name}" for name in decoded.columns})
+    promoted = set()
+    
+    def field(column: str) -> pl.Expr:
+        names = [f"_json.{name}" for name in JSON_FIELDS[column] if f"_json.{name}" in decoded.columns]
+        promoted.update(names)
+        return pl.coalesce([pl.col(name) for name in names] + [pl.lit(None, dtype=pl.String)])
+    
+    service_label = pl.col(f"{ATTRIBUTE_PREFIX}service_name") if f"{ATTRIBUTE_PREFIX}service_name" in df.columns \
+        else pl.lit(None, dtype=pl.String)
+    updates = [
+        pl.coalesce([field('message'), pl.col('message')]).alias('message'),
+        pl.when(pl.col('severity_text') == '').then(pl.coalesce([field('severity_text'), pl.lit('')]))
+        .otherwise(pl.col('severity_text')).alias('severity_text'),
+        pl.when(service_label.is_null() | (service_label == ''))
+        .then(pl.coalesce([field('service_name'), pl.col('service_name').cast(pl.String)]))
+        .otherwise(pl.col('service_name').cast(pl.String)).cast(LOG_SCHEMA['service_name']).alias('service_name'),
+        pl.when(pl.col('trace_id') == '').then(pl.coalesce([field('trace_id'), pl.lit('')]))
+        .otherwise(pl.col('trace_id')).alias('trace_id'),
+        pl.when(pl.col('span_id') == '').then(pl.coalesce([field('span_id'), pl.lit('')]))
+        .otherwise(pl.col('span_id')).alias('span_id'),
+    ]
+    
+    # Remaining fields become attribute columns; stream labels of the same name
+    # win, then attributes.* over top-level fields
+    sources: Dict[str, List[str]] = {}
+    for name in sorted(decoded.columns, key=lambda name: not name.startswith('_json.attributes.')):
+        if name in promoted:
+            continue
+        path = name[len('_json.'):]
+        column = ATTRIBUTE_PREFIX + (path[len('attributes.'):] if path.startswith('attributes.') else path)
+        sources.setdefault(column, []).append(name)
+    for column, names in sources.items():
+        labels = [pl.col(column)] if column in df.columns else []
+        updates.append(pl.coalesce(labels + [pl.col(name) for name in names]).alias(column))
+    
+    return pl.concat([df, decoded], how='horizontal').with_columns(updates).with_columns(
+        normalize_severity(pl.col('severity_text')).alias('severity')
+    ).drop(decoded.columns)
+
+
+def from_loki_response(data: Dict, decoder: Optional[JsonBodyDecoder] = None) -> pl.DataFrame:
+    """Map a Loki query_range response into the normalized schema
+    
+    With a decoder, JSON log lines are decoded and their fields promoted.
+    """
+    if 'data' not in data or 'result' not in data['data']:
+        return empty_frame()
+    
+    timestamps, services, severities, messages, attributes = [], [], [], [], []
+    for stream in data['data']['result']:
+        labels = stream.get('stream', {})
+        values = stream.get('values', [])
+        if not values:
+            continue
+        
+        service = labels.get('service_name', labels.get('container', labels.get('job', 'unknown')))
+        severity = labels.get('level', labels.get('detected_level', labels.get('severity_text', '')))
+        stream_attrs = flatten_attributes(labels)
+        
+        count = len(values)
+        timestamps.extend(int(value[0]) for value in values)
+        messages.extend(value[1] for value in values)
+        services.extend([service] * count)
+        severities.extend([severity] * count)
+        attributes.extend([stream_attrs] * count)
+    
+    blanks = [''] * len(timestamps)
+    df = _build_frame('loki', timestamps, services, severities, messages, blanks, blanks, attributes)
+    return promote_json_bodies(df, decoder) if decoder is not None else df
+
+
+def from_quickwit_response(data: Dict) -> pl.DataFrame:
+    """Map a Quickwit search response into the normalized schema"""
+    if 'hits' not in data:
+        return empty_frame()
+    
+    timestamps, services, severities, messages = [], [], [], []
+    trace_ids, span_ids, attributes = [], [], []
+    for hit in data['hits']:
+        doc = hit.get('document', hit)
+        body = doc.get('body', '')
+        
+        timestamps.append(int(doc.get('timestamp_nanos', 0) or 0))
+        services.append(doc.get('service_name') or 'unknown')
+        severities.append(doc.get('severity_text') or '')
+        messages.append(body.get('message', '') if isinstance(body, dict) else str(body or ''))
+        trace_ids.append(doc.get('trace_id') or '')
+        span_ids.append(doc.get('span_id') or '')
+        attributes.append(flatten_attributes(doc.get('attributes', {})))
+    
+    return _build_frame('quickwit', timestamps, services, severities, messages, trace_ids, span_ids, attributes)
+
+
+def concat(frames: Iterable[pl.DataFrame]) -> pl.DataFrame:
+    """Concatenate normalized frames whose attribute columns may differ"""
+    frames = [df for df in frames if df.height]
+    if not frames:
+        return empty_frame()
+    return pl.concat(frames, how='diagonal_relaxed')
+
+
+def normalize_severity(expr: pl.Expr) -> pl.Expr:
+    """Map free-form severity text onto the canonical severity levels"""
+    upper = expr.fill_null('').str.to_uppercase()
+    return (
+        pl.when(upper.str.contains('CRIT|FATAL|EMERG|ALERT|PANIC')).then(pl.lit('critical'))
+        .when(upper.str.contains('ERR')).then(pl.lit('error'))
+        .when(upper.str.contains('WARN')).then(pl.lit('warning'))
+        .when(upper.str.contains('INFO|NOTICE')).then(pl.lit('info'))
+        .when(upper.str.contains('DEBUG|TRACE|DBG')).then(pl.lit('debug'))
+        .otherwise(pl.lit('unknown'))
+        .cast(SEVERITY_DTYPE)
+    )
+
+
+def severity_from_message(expr: pl.Expr) -> pl.Expr:
+    """Detect severity keywords in unstructured message text"""
+    upper = expr.str.to_uppercase()
+    return (
+        pl.when(upper.str.contains('ERROR|ERR|FATAL')).then(pl.lit('error'))
+        .when(upper.str.contains('WARN')).then(pl.lit('warning'))
+        .when(upper.str.contains('INFO')).then(pl.lit('info'))
+        .when(upper.str.contains('DEBUG|DBG')).then(pl.lit('debug'))
+        .otherwise(pl.lit('unknown'))
+        .cast(SEVERITY_DTYPE)
+    )
+
+
+def categorize_message(expr: pl.Expr) -> pl.Expr:
+    """Categorize messages by keyword, first matching category wins"""
+    lower = expr.str.to_lowercase()
+    chain = None
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        condition = lower.str.contains('|'.join(keywords))
+        chain = pl.when(condition) if chain is None else chain.when(condition)
+        chain = chain.then(pl.lit(category))
+    return chain.otherwise(pl.lit('general'))
+
+
+def enrich(df: pl.DataFrame) -> pl.DataFrame:
+    """Shared vectorized enrichment applied to both backends"""
+    if df.is_empty():
+        return df.with_columns([
+            pl.lit(None, dtype=pl.Int64).alias('timestamp'),
+            pl.lit(None, dtype=pl.Datetime('ns')).alias('datetime'),
+            pl.lit(None, dtype=pl.Int8).alias('hour'),
+            pl.lit(None, dtype=pl.Categorical).alias('category'),
+            pl.lit(None, dtype=pl.Categorical).alias('log_type'),
+            pl.lit(None, dtype=pl.Boolean).alias('is_demo'),
+            pl.lit(None, dtype=pl.UInt32).alias('message_length'),
+        ])
+    
+    default_log_type = pl.col('source').cast(pl.String).replace(DEFAULT_LOG_TYPES)
+    
+    df = df.with_columns([
+        # Structured severity wins; fall back to keywords in the message
+        pl.when(pl.col('severity') == 'unknown')
+        .then(severity_from_message(pl.col('message')))
+        .otherwise(pl.col('severity'))
+        .alias('severity'),
+        (pl.col('timestamp_ns') // 1_000_000).alias('timestamp'),
+        pl.from_epoch(pl.col('timestamp_ns'), time_unit='ns').alias('datetime'),
+        attribute(df, 'category', default=None).alias('_category'),
+        attribute(df, 'log_type', default=None).alias('_log_type'),
+        attribute(df, 'demo_data').alias('_demo_data'),
+        pl.col('message').str.len_chars().alias('message_length'),
+    ])
+    
+    return df.with_columns([
+        pl.col('datetime').dt.hour().alias('hour'),
+        pl.coalesce([pl.col('_category'), categorize_message(pl.col('message'))])
+        .cast(pl.Categorical).alias('category'),
+        pl.coalesce([pl.col('_log_type'), default_log_type]).cast(pl.Categorical).alias('log_type'),
+        (pl.col('message').str.contains('[DEMO]', literal=True) | (pl.col('_demo_data') == 'true'))
+        .alias('is_demo'),
+    ]).drop(['_category', '_log_type', '_demo_data'])
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for operations dashboard aggregates
+Log level distribution, service activity and error trends computed from Loki logs with Polars
+"""
+
+import json
+
+import loaders
+
+
+def main():
+    """Main function to run the data loader"""
+    loader = loaders.load('loki-logs.py').LokiDataLoader()
+    
+    # Same time range and limit as loki-logs.py
+    frame = loader.fetch_frame(hours_back=2, limit=1000)
+    
+    # Output as JSON for Observable Framework
+    print(json.dumps(loader.compute_aggregates(frame), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
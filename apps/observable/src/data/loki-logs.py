@@ -2,140 +2,298 @@
 """
 Observable Framework data loader for Loki logs
 Fetches operational logs from Loki API and processes them with Polars for enhanced performance
+Rows follow the unified log schema in log_schema.py
 """
 
 import os
 import sys
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Sequence, Tuple
 import requests
 import polars as pl
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+import backend_limits
+import log_archive
+import log_schema
+import loki_planner
+import query_cache
+import sampling
+import template_mining
+
 
 class LokiDataLoader:
     def __init__(self):
         self.loki_endpoint = os.getenv('LOKI_ENDPOINT', 'http://192.168.122.27:3100')
         self.session = self._create_session()
+        self.template_miner = template_mining.TemplateMiner()
+        self.json_decoder = log_schema.JsonBodyDecoder()
+        self.planner = loki_planner.LokiQueryPlanner(self._get)
     
     def _create_session(self) -> requests.Session:
-        """Create a requests session with retry strategy"""
+        """Create a requests session with retry strategy and the shared Loki limiter"""
         session = requests.Session()
+        # Connection errors are retried by urllib3; overload statuses by the limiter
         retry_strategy = Retry(
             total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "OPTIONS"]
+            backoff_factor=0.5,
+            allowed_methods=["HEAD", "GET", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = backend_limits.LimitedAdapter('loki', max_retries=retry_strategy)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
     
     def fetch_logs(self, hours_back: int = 1, limit: int = 500) -> List[Dict[str, Any]]:
         """Fetch logs from Loki API"""
+        return self.display_rows(self.fetch_frame(hours_back, limit))
+    
+    def display_rows(self, frame: pl.DataFrame) -> List[Dict[str, Any]]:
+        """Output rows for a processed frame"""
+        # Display rows are a stratified sample by severity and service
+        frame = sampling.stratified_sample(frame)
+        
+        # Convert to list of dictionaries for Observable Framework
+        return frame.to_dicts()
+    
+    def fetch_frame(self, hours_back: int = 1, limit: int = 500,
+                    line_filters: Optional[Sequence[str]] = None) -> pl.DataFrame:
+        """Fetch logs from Loki API as a processed Polars frame
+        
+        The window is split into narrow per-stream-group queries planned from
+        the index; line_filters are pushed down into each query as LogQL line filters.
+        In replay mode (LOG_REPLAY) every archived row of the window is read
+        from the local archive instead, without the limit.
+        """
         try:
-            end_time = datetime.now()
-            start_time = end_time - timedelta(hours=hours_back)
+            if log_archive.REPLAY:
+                df = log_archive.replay('loki', hours_back)
+                for line_filter in line_filters or []:
+                    # Matched against the decoded message rather than the raw line
+                    if line_filter.startswith('~'):
+                        df = df.filter(pl.col('message').str.contains(line_filter[1:]))
+                    else:
+                        df = df.filter(pl.col('message').str.contains(line_filter, literal=True))
+                # Replays assign templates without counting the rows again
+                return self.template_miner.mine(self.enrich(df))
             
-            url = f"{self.loki_endpoint}/loki/api/v1/query_range"
-            params = {
-                'query': '{job=~".+"}',
-                'start': int(start_time.timestamp() * 1000000000),
-                'end': int(end_time.timestamp() * 1000000000),
-                'limit': limit,
-                'direction': 'backward'
-            }
+            # Minute-aligned so rebuilds and other loaders share cached results
+            start_time, end_time = query_cache.aligned_window(hours_back)
+            start_ns, end_ns = start_time * 1000000000, end_time * 1000000000
             
-            response = self.session.get(url, params=params, timeout=30)
-            response.raise_for_status()
+            queries = self.planner.plan(start_ns, end_ns, line_filters)
+            
+            def query_range(query: str, bucket: Tuple[int, int]) -> List[Dict]:
+                bucket_start_ns, bucket_end_ns = bucket[0] * 1000000000, bucket[1] * 1000000000
+                data = self._get('/loki/api/v1/query_range', {
+                    'query': query,
+                    'start': bucket_start_ns,
+                    'end': bucket_end_ns,
+                    'limit': limit,
+                    'direction': 'backward'
+                })
+                # Buckets are half-open, and the oldest one reaches back before the window
+                low_ns = max(bucket_start_ns, start_ns)
+                return [
+                    {**stream, 'values': [value for value in stream.get('values', [])
+                                          if low_ns <= int(value[0]) < bucket_end_ns]}
+                    for stream in data['data']['result']
+                ]
             
-            return self._process_loki_response(response.json())
+            # Closed sub-buckets come from the cache; newest first, stopping once
+            # limit rows are in hand since older buckets cannot hold newer rows
+            results: List[Dict] = []
+            rows = 0
+            with ThreadPoolExecutor(max_workers=max(1, len(queries))) as executor:
+                for bucket in query_cache.sub_buckets(start_time, end_time):
+                    for streams in executor.map(lambda query: query_range(query, bucket), queries):
+                        results.extend(streams)
+                        rows += sum(len(stream['values']) for stream in streams)
+                    if rows >= limit:
+                        break
             
+            # Each group returns its newest rows; keep the newest overall before enrichment
+            timestamps = sorted((int(value[0]) for stream in results for value in stream.get('values', [])), reverse=True)
+            if len(timestamps) > limit:
+                cutoff = timestamps[limit - 1]
+                results = [
+                    {**stream, 'values': [value for value in stream.get('values', []) if int(value[0]) >= cutoff]}
+                    for stream in results
+                ]
+            
+            # Raw rows are archived so improved enrichment can be replayed over them
+            df = log_schema.from_loki_response({'data': {'result': results}}, self.json_decoder)
+            log_archive.append('loki', df)
+            # Template counts persist across runs; only this path adds to them
+            return self.template_miner.mine_and_save(self.enrich(df)).head(limit)
+        
         except requests.exceptions.RequestException as e:
             print(f"Error fetching Loki logs: {e}", file=sys.stderr)
-            return []
+            return log_schema.empty_frame()
         except Exception as e:
             print(f"Unexpected error: {e}", file=sys.stderr)
-            return []
+            return log_schema.empty_frame()
     
-    def _process_loki_response(self, data: Dict) -> List[Dict[str, Any]]:
-        """Process Loki API response using Polars for efficient data manipulation"""
-        logs = []
-        
-        if 'data' not in data or 'result' not in data['data']:
-            return logs
-        
-        # Extract raw log entries
-        raw_entries = []
-        for stream in data['data']['result']:
-            labels = stream.get('stream', {})
-            for value in stream.get('values', []):
-                timestamp_ns = int(value[0])
-                message = value[1]
-                
-                raw_entries.append({
-                    'timestamp_ns': timestamp_ns,
-                    'timestamp': timestamp_ns // 1000000,  # Convert to milliseconds
-                    'message': message,
-                    'source': 'loki',
-                    'job': labels.get('job', 'unknown'),
-                    'instance': labels.get('instance', 'unknown'),
-                    'level': self._extract_log_level(message),
-                    'service_name': labels.get('service_name', labels.get('container', 'unknown')),
-                    'labels': labels
-                })
+    def _get(self, path: str, params: Dict[str, Any]) -> Dict:
+        """Cached GET against the Loki API, keyed by the request's time bucket"""
+        def fetch() -> Dict:
+            response = self.session.get(f"{self.loki_endpoint}{path}", params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        
+        start, end = params['start'] // 1000000000, params['end'] // 1000000000
+        return query_cache.cached('loki', {'path': path, **params}, start, end, fetch)
+    
+    def compute_aggregates(self, frame: pl.DataFrame) -> Dict[str, Any]:
+        """Compute the operations dashboard group-bys on a fetched frame"""
+        total = frame.height
+        if not total:
+            return {
+                'total_logs': 0,
+                'error_logs': 0,
+                'levels': [],
+                'services': [],
+                'error_trend': [],
+                'unique_services': 0,
+                'avg_message_length': 0,
+                'last_updated': datetime.now().isoformat()
+            }
         
-        if not raw_entries:
-            return logs
+        is_error = pl.col('severity') == 'error'
         
-        # Use Polars for efficient data processing
-        df = pl.DataFrame(raw_entries)
+        # Log level distribution
+        levels = (
+            frame.group_by(pl.col('severity').cast(pl.String).alias('level')).agg(pl.len().alias('count'))
+            .with_columns((pl.col('count') / total * 100).round(1).alias('percentage'))
+            .sort('count', descending=True)
+        )
+        
+        # Per-service activity, top 10 by log count
+        known = frame.filter(pl.col('service_name') != 'unknown')
+        services = (
+            known.group_by(pl.col('service_name').cast(pl.String).alias('service')).agg([
+                pl.len().alias('count'),
+                is_error.sum().alias('error_count'),
+                pl.col('message_length').mean().round(0).alias('avg_message_length'),
+            ])
+            .with_columns((pl.col('error_count') / pl.col('count') * 100).round(1).alias('error_rate'))
+            .sort(['count', 'service'], descending=[True, False])
+            .head(10)
+        )
+        
+        # Top 3 keywords per listed service
+        keywords = (
+            known.select([pl.col('service_name').cast(pl.String).alias('service'), 'keywords'])
+            .filter(pl.col('service').is_in(services['service']))
+            .explode('keywords')
+            .drop_nulls('keywords')
+            .group_by(['service', 'keywords']).agg(pl.len().alias('count'))
+            .sort(['count', 'keywords'], descending=[True, False])
+            .group_by('service', maintain_order=True).agg(pl.col('keywords').head(3).alias('top_keywords'))
+        )
+        services = services.join(keywords, on='service', how='left').with_columns(
+            pl.col('top_keywords').fill_null(pl.lit([], dtype=pl.List(pl.String)))
+        ).sort(['count', 'service'], descending=[True, False])
         
-        # Add derived columns
+        # Hourly error counts, bucket start in epoch milliseconds
+        error_trend = (
+            frame.filter(is_error)
+            .group_by((pl.col('timestamp') // 3_600_000 * 3_600_000).alias('time'))
+            .agg(pl.len().alias('count'))
+            .sort('time')
+        )
+        
+        error_logs = int(frame.select(is_error.sum()).item())
+        return {
+            'total_logs': total,
+            'error_logs': error_logs,
+            'levels': levels.to_dicts(),
+            'services': services.to_dicts(),
+            'error_trend': error_trend.to_dicts(),
+            'unique_services': known['service_name'].n_unique(),
+            'avg_message_length': round(frame['message_length'].mean(), 1),
+            'last_updated': datetime.now().isoformat()
+        }
+    
+    def compute_templates(self, frame: pl.DataFrame, limit: int = 200) -> Dict[str, Any]:
+        """Template dictionary with per-template statistics for a fetched frame"""
+        if frame.is_empty():
+            return {
+                'total_logs': 0,
+                'distinct_templates': 0,
+                'known_templates': len(self.template_miner.clusters),
+                'templates': [],
+                'top_error_templates': [],
+                'encoding': {'raw_bytes': 0, 'encoded_bytes': 0, 'ratio': 0},
+                'last_updated': datetime.now().isoformat()
+            }
+        
+        dictionary = pl.DataFrame({
+            'template_id': pl.Series(list(self.template_miner.templates()), dtype=pl.Int32),
+            'template': list(self.template_miner.templates().values()),
+        })
+        
+        stats = (
+            frame.group_by('template_id').agg([
+                pl.len().alias('count'),
+                pl.col('severity').cast(pl.String).is_in(['error', 'critical']).sum().alias('error_count'),
+                pl.col('service_name').cast(pl.String).unique().sort().head(5).alias('services'),
+                pl.col('timestamp').max().alias('last_seen'),
+                pl.col('message').first().alias('example'),
+            ])
+            .join(dictionary, on='template_id', how='left')
+            .sort(['count', 'template_id'], descending=[True, False])
+        )
+        
+        # Size of the messages against template IDs plus parameters plus each template once
+        raw_bytes = int(frame['message'].str.len_bytes().sum())
+        encoded_bytes = int(
+            frame['template_params'].list.join(' ').str.len_bytes().sum()
+            + 4 * frame.height
+            + stats['template'].str.len_bytes().sum()
+        )
+        
+        return {
+            'total_logs': frame.height,
+            'distinct_templates': stats.height,
+            'known_templates': len(self.template_miner.clusters),
+            'templates': stats.head(limit).to_dicts(),
+            'top_error_templates': stats.filter(pl.col('error_count') > 0)
+            .sort(['error_count', 'template_id'], descending=[True, False]).head(10).to_dicts(),
+            'encoding': {
+                'raw_bytes': raw_bytes,
+                'encoded_bytes': encoded_bytes,
+                'ratio': round(raw_bytes / encoded_bytes, 2) if encoded_bytes else 0
+            },
+            'last_updated': datetime.now().isoformat()
+        }
+    
+    def _process_loki_response(self, data: Dict) -> pl.DataFrame:
+        """Process Loki API response through the unified log schema"""
+        # JSON log lines are decoded in one pass and their fields promoted to columns
+        return self.enrich(log_schema.from_loki_response(data, self.json_decoder))
+    
+    def enrich(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Enrich normalized rows with the shared and Loki-specific columns"""
+        if df.is_empty():
+            return df
+        
+        # Shared enrichment: severity, category, log_type, time columns
+        df = log_schema.enrich(df)
+        
+        # Loader-specific columns on top of the shared schema
         df = df.with_columns([
-            # Extract timestamp as datetime
-            pl.from_epoch(pl.col('timestamp'), time_unit='ms').alias('datetime'),
-            # Categorize log levels
-            pl.col('level').map_elements(self._normalize_log_level, return_dtype=pl.String).alias('severity'),
+            pl.col('severity').cast(pl.String).str.to_uppercase().alias('level'),
+            log_schema.attribute(df, 'job', default='unknown').alias('job'),
+            log_schema.attribute(df, 'instance', default='unknown').alias('instance'),
             # Extract keywords from message
-            pl.col('message').map_elements(self._extract_keywords, return_dtype=pl.List(pl.String)).alias('keywords'),
-            # Message length for analysis
-            pl.col('message').str.len_chars().alias('message_length')
+            pl.col('message').map_elements(self._extract_keywords, return_dtype=pl.List(pl.String)).alias('keywords')
         ])
         
         # Sort by timestamp (most recent first)
-        df = df.sort('timestamp', descending=True)
-        
-        # Convert back to list of dictionaries for Observable Framework
-        return df.to_dicts()
-    
-    def _extract_log_level(self, message: str) -> str:
-        """Extract log level from message"""
-        message_upper = message.upper()
-        
-        if any(level in message_upper for level in ['ERROR', 'ERR', 'FATAL']):
-            return 'ERROR'
-        elif any(level in message_upper for level in ['WARN', 'WARNING']):
-            return 'WARNING'
-        elif any(level in message_upper for level in ['INFO', 'INFORMATION']):
-            return 'INFO'
-        elif any(level in message_upper for level in ['DEBUG', 'DBG']):
-            return 'DEBUG'
-        else:
-            return 'UNKNOWN'
-    
-    def _normalize_log_level(self, level: str) -> str:
-        """Normalize log level for consistent display"""
-        level_map = {
-            'ERROR': 'error',
-            'WARNING': 'warning',
-            'INFO': 'info',
-            'DEBUG': 'debug',
-            'UNKNOWN': 'unknown'
-        }
-        return level_map.get(level, 'unknown')
+        return df.sort('timestamp_ns', descending=True)
     
     def _extract_keywords(self, message: str) -> List[str]:
         """Extract relevant keywords from log message"""
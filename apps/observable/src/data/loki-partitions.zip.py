@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for Loki logs partitioned by service
+Writes a zip archive of fixed-name shards holding hashed groups of services (PARTITION_BY_HOUR=1 adds hours) and a manifest.json; pages fetch only the shard of the service they show
+"""
+
+import sys
+
+import loaders
+import partitions
+
+
+def main():
+    """Main function to run the data loader"""
+    loader = loaders.load('loki-logs.py').LokiDataLoader()
+    
+    # Same time range and limit as loki-logs.py
+    frame = loader.fetch_frame(hours_back=2, limit=1000)
+    
+    # Output as a zip archive for Observable Framework
+    partitions.write_archive(partitions.build(frame, loader.display_rows, 'loki'), sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
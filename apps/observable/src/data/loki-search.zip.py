@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for Loki logs with a search index
+Writes a zip archive with the display rows as rows.json and an inverted index over them as index.json; pages filter rows with src/components/search-index.js
+"""
+
+import sys
+import json
+
+import loaders
+import partitions
+import search_index
+
+
+def main():
+    """Main function to run the data loader"""
+    loader = loaders.load('loki-logs.py').LokiDataLoader()
+    
+    # Same time range and limit as loki-logs.py
+    rows = loader.display_rows(loader.fetch_frame(hours_back=2, limit=1000))
+    
+    # Row IDs in the index are positions in rows.json, so both come from the same run
+    index = search_index.SearchIndex.from_rows(rows)
+    
+    # Output as a zip archive for Observable Framework
+    partitions.write_archive({
+        'rows.json': json.dumps(rows, default=str).encode('utf-8'),
+        'index.json': json.dumps(index.to_dict(), separators=(',', ':')).encode('utf-8'),
+    }, sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Stream-aware query planning for the Loki data loaders
+Looks up the streams active in a window from the index and splits the fetch into narrow selectors of balanced cost, with line filters pushed down into LogQL
+"""
+
+import os
+import re
+import sys
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+# Streams the loaders read; planned queries narrow it and never widen it
+LOKI_STREAM_SELECTOR = os.getenv('LOKI_STREAM_SELECTOR', '{job=~".+"}')
+
+# Labels tried for grouping streams into queries, in order of preference
+GROUP_LABELS = ('service_name', 'container', 'job', 'app', 'namespace')
+
+# Upper bound on planned queries per fetch; each label value gets its own query up to it
+MAX_QUERY_GROUPS = int(os.getenv('LOKI_MAX_QUERY_GROUPS', '4'))
+
+# Query the index volume endpoint (Loki 2.9+) for bytes per group; stream counts otherwise
+USE_VOLUME = os.getenv('LOKI_PLANNER_VOLUME', 'true').lower() in ('1', 'true', 'yes')
+
+LABEL_NAME_RE = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+
+
+def quote(value: str) -> str:
+    """LogQL double-quoted string literal"""
+    return json.dumps(value)
+
+
+def with_matcher(selector: str, matcher: str) -> str:
+    """Add a label matcher to a stream selector"""
+    inner = selector.strip()[1:-1].strip()
+    return f"{{{inner}, {matcher}}}" if inner else f"{{{matcher}}}"
+
+
+def group_matcher(label: str, values: Sequence[str]) -> str:
+    """Matcher selecting exactly the given label values"""
+    if len(values) == 1:
+        return f"{label}={quote(values[0])}"
+    return f"{label}=~{quote('|'.join(re.escape(value) for value in sorted(values)))}"
+
+
+def line_filter_pipeline(line_filters: Optional[Sequence[str]]) -> str:
+    """Line filter stages, all of which must match, e.g. ['error'] -> |= "error"
+    
+    Filters starting with ~ are regular expressions, e.g. '~(?i)denied|failed'.
+    """
+    stages = []
+    for line_filter in line_filters or []:
+        if line_filter.startswith('~'):
+            stages.append(f"|~ {quote(line_filter[1:])}")
+        else:
+            stages.append(f"|= {quote(line_filter)}")
+    return ' '.join(stages)
+
+
+def balance(costs: Dict[str, float], groups: int) -> List[List[str]]:
+    """Split values into at most groups lists of similar total cost, largest first"""
+    bins: List[List[Any]] = [[0.0, []] for _ in range(max(1, min(groups, len(costs))))]
+    for value in sorted(costs, key=lambda value: (-costs[value], value)):
+        lightest = min(bins, key=lambda item: item[0])
+        lightest[0] += costs[value]
+        lightest[1].append(value)
+    return [values for _, values in bins if values]
+
+
+class LokiQueryPlanner:
+    """Plans narrow LogQL selectors from the streams active in a window
+    
+    get(path, params) performs a GET against the Loki API and returns the
+    decoded JSON body. Index lookups (/series, /index/volume) do not read
+    chunks, so planning costs little next to a query over every stream.
+    """
+    
+    def __init__(self, get: Callable[[str, Dict[str, Any]], Dict], base_selector: str = LOKI_STREAM_SELECTOR,
+                 group_labels: Sequence[str] = GROUP_LABELS, max_groups: int = MAX_QUERY_GROUPS,
+                 use_volume: bool = USE_VOLUME):
+        self.get = get
+        self.base_selector = base_selector
+        self.group_labels = group_labels
+        self.max_groups = max_groups
+        self.use_volume = use_volume
+    
+    def streams(self, start_ns: int, end_ns: int) -> List[Dict[str, str]]:
+        """Label sets of the streams matching the base selector in the window"""
+        data = self.get('/loki/api/v1/series', {'match[]': self.base_selector, 'start': start_ns, 'end': end_ns})
+        return data.get('data') or []
+    
+    def volumes(self, label: str, start_ns: int, end_ns: int) -> Optional[Dict[str, float]]:
+        """Bytes per label value in the window, or None when the backend has no volume endpoint"""
+        try:
+            data = self.get('/loki/api/v1/index/volume', {
+                'query': self.base_selector, 'start': start_ns, 'end': end_ns,
+                'targetLabels': label, 'aggregateBy': 'series'
+            })
+            return {
+                item['metric'][label]: float(item['value'][1])
+                for item in data['data']['result'] if label in item.get('metric', {})
+            }
+        except Exception:
+            return None
+    
+    def group_label(self, streams: List[Dict[str, str]]) -> Optional[str]:
+        """The first grouping label that splits the streams, else the one present on the most streams"""
+        values = {label: {stream[label] for stream in streams if stream.get(label)} for label in self.group_labels
+                  if LABEL_NAME_RE.match(label)}
+        for label, seen in values.items():
+            if len(seen) > 1:
+                return label
+        return max(values, key=lambda label: len(values[label]), default=None) if any(values.values()) else None
+    
+    def plan(self, start_ns: int, end_ns: int, line_filters: Optional[Sequence[str]] = None) -> List[str]:
+        """LogQL queries that together cover the base selector's streams in the window
+        
+        An empty list means no stream was active. When the index cannot be
+        asked, the plan falls back to the base selector as a single query.
+        """
+        pipeline = line_filter_pipeline(line_filters)
+        
+        def query(selector: str) -> str:
+            return f"{selector} {pipeline}" if pipeline else selector
+        
+        try:
+            streams = self.streams(start_ns, end_ns)
+        except Exception as e:
+            print(f"Loki series lookup failed, querying {self.base_selector}: {e}", file=sys.stderr)
+            return [query(self.base_selector)]
+        if not streams:
+            return []
+        
+        label = self.group_label(streams)
+        if label is None:
+            return [query(self.base_selector)]
+        
+        counts: Dict[str, float] = {}
+        unlabeled = 0
+        for stream in streams:
+            value = stream.get(label)
+            if value:
+                counts[value] = counts.get(value, 0) + 1
+            else:
+                unlabeled += 1
+        
+        costs = counts
+        if self.use_volume:
+            volumes = self.volumes(label, start_ns, end_ns)
+            if volumes:
+                # Values the volume endpoint missed still cost at least the smallest known volume
+                floor = min(volumes.values())
+                costs = {value: volumes.get(value, floor) for value in counts}
+        
+        # Split by value even for a handful of streams: one narrow query per service
+        # is cheaper for Loki than a catch-all over all of them
+        groups = min(self.max_groups, len(counts))
+        queries = [
+            query(with_matcher(self.base_selector, group_matcher(label, values)))
+            for values in balance(costs, groups)
+        ]
+        if unlabeled:
+            # Streams without the grouping label match it as an empty string
+            queries.append(query(with_matcher(self.base_selector, f'{label}=""')))
+        return queries
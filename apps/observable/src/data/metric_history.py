@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Ring buffer of past health summaries from the metrics loader
+Keeps a fixed number of score snapshots in a memory-mapped file under LOADER_STATE_DIR and derives vectorized trend features from them
+"""
+
+import os
+import sys
+import fcntl
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+import numpy as np
+
+import state_store
+
+
+HISTORY_NAME = 'metric-history.bin'
+
+# Two days of snapshots at one loader run per minute
+CAPACITY = int(os.getenv('METRIC_HISTORY_SNAPSHOTS', '2880'))
+
+# Score slopes are fitted over this window
+TREND_WINDOW_SECONDS = float(os.getenv('METRIC_TREND_WINDOW_SECONDS', '3600'))
+
+# A snapshot's weight in the EWMA halves every this many seconds, so irregular run intervals do not skew it
+EWMA_HALF_LIFE_SECONDS = float(os.getenv('METRIC_EWMA_HALF_LIFE_SECONDS', '900'))
+
+# Slopes are only fitted once the window's snapshots span this long, so bursts of rebuilds do not extrapolate
+MIN_TREND_SPAN_SECONDS = 300
+
+# Overall score slopes within this many points per hour count as stable
+STABLE_SLOPE_PER_HOUR = 2.0
+
+MAGIC = b'MHST'
+FORMAT_VERSION = 1
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S4'),
+    ('version', '<u4'),
+    ('capacity', '<u4'),
+    ('reserved', '<u4'),
+    ('appended', '<u8'),
+])
+
+# One fixed-width record per loader run
+SNAPSHOT_DTYPE = np.dtype([
+    ('timestamp_ms', '<i8'),
+    ('performance_score', '<f8'),
+    ('availability_score', '<f8'),
+    ('overall_score', '<f8'),
+    ('critical_alerts', '<u4'),
+    ('health', 'u1'),
+    ('reserved', 'V3'),
+])
+
+SCORES = ['performance_score', 'availability_score', 'overall_score']
+
+HEALTH_CODES = {'unknown': 0, 'good': 1, 'warning': 2, 'critical': 3}
+
+
+class SnapshotHistory:
+    """Fixed-size ring buffer of health snapshots
+    
+    The file is a HEADER_DTYPE record followed by capacity SNAPSHOT_DTYPE
+    slots. Snapshot n goes to slot n % capacity and the header counts the
+    snapshots ever appended, so an append writes one slot and the counter
+    whatever the history length, and the oldest snapshot is overwritten once
+    the buffer is full. A file written with another capacity is rebuilt
+    keeping its newest snapshots.
+    """
+    
+    def __init__(self, path: Optional[str] = None, capacity: int = CAPACITY):
+        self.path = path or state_store.state_path(HISTORY_NAME)
+        self.capacity = max(1, capacity)
+    
+    @contextmanager
+    def _lock(self) -> Iterator[None]:
+        """Exclusive lock serializing writers across loader processes"""
+        with open(f"{self.path}.lock", 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def _create(self, snapshots: np.ndarray) -> None:
+        """Write a new file holding the newest of the given ordered snapshots"""
+        snapshots = snapshots[-self.capacity:]
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (MAGIC, FORMAT_VERSION, self.capacity, 0, len(snapshots))
+        slots = np.zeros(self.capacity, dtype=SNAPSHOT_DTYPE)
+        slots[:len(snapshots)] = snapshots
+        tmp_path = f"{self.path}.tmp.{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(slots.tobytes())
+        os.replace(tmp_path, self.path)
+    
+    def _map(self, mode: str = 'r'):
+        """Memory-mapped header and slots, None when the file is missing or not a history"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return None
+        if size < HEADER_DTYPE.itemsize:
+            return None
+        header = np.memmap(self.path, dtype=HEADER_DTYPE, mode=mode, shape=(1,))
+        capacity = int(header['capacity'][0])
+        if (header['magic'][0] != MAGIC or header['version'][0] != FORMAT_VERSION
+                or size != HEADER_DTYPE.itemsize + capacity * SNAPSHOT_DTYPE.itemsize):
+            return None
+        slots = np.memmap(self.path, dtype=SNAPSHOT_DTYPE, mode=mode, offset=HEADER_DTYPE.itemsize, shape=(capacity,))
+        return header, slots
+    
+    @staticmethod
+    def _ordered(header: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """Stored snapshots, oldest first"""
+        appended = int(header['appended'][0])
+        capacity = len(slots)
+        if appended <= capacity:
+            return np.array(slots[:appended])
+        head = appended % capacity
+        return np.concatenate([slots[head:], slots[:head]])
+    
+    def snapshots(self) -> np.ndarray:
+        """Stored snapshots, oldest first"""
+        mapped = self._map()
+        if mapped is None:
+            return np.zeros(0, dtype=SNAPSHOT_DTYPE)
+        return self._ordered(*mapped)
+    
+    def append(self, timestamp_ms: int, summary: Dict[str, Any]) -> None:
+        """Record the health summary of one loader run"""
+        performance = float(summary.get('performance_score') or 0)
+        availability = float(summary.get('availability_score') or 0)
+        record = (
+            timestamp_ms, performance, availability, (performance + availability) / 2,
+            int(summary.get('critical_alerts') or 0), HEALTH_CODES.get(summary.get('overall_health'), 0), b''
+        )
+        
+        with self._lock():
+            mapped = self._map('r+')
+            if mapped is None or len(mapped[1]) != self.capacity:
+                self._create(self._ordered(*mapped) if mapped is not None else np.zeros(0, dtype=SNAPSHOT_DTYPE))
+                mapped = self._map('r+')
+            header, slots = mapped
+            appended = int(header['appended'][0])
+            slots[appended % self.capacity] = record
+            # The slot is written before the counter that makes it visible
+            slots.flush()
+            header['appended'] = appended + 1
+            header.flush()
+
+
+def trends(snapshots: np.ndarray, now_ms: int, window_seconds: float = TREND_WINDOW_SECONDS,
+           half_life_seconds: float = EWMA_HALF_LIFE_SECONDS) -> Dict[str, Any]:
+    """Slopes, EWMAs and critical-state recency of the score history"""
+    result: Dict[str, Any] = {
+        'snapshots': int(len(snapshots)),
+        'window_seconds': window_seconds,
+        'history_seconds': 0.0,
+        'direction': 'unknown',
+        'seconds_since_critical': None,
+        'critical_snapshots_in_window': 0,
+    }
+    for score in SCORES:
+        result[f"{score}_slope_per_hour"] = None
+        result[f"{score}_ewma"] = None
+    if not len(snapshots):
+        return result
+    
+    seconds = (snapshots['timestamp_ms'] - now_ms) / 1000.0
+    values = np.stack([snapshots[score] for score in SCORES])
+    result['history_seconds'] = max(0.0, float(-seconds[0]))
+    
+    # Time-decayed EWMA of every score at once
+    weights = np.exp2(seconds / half_life_seconds)
+    for score, ewma in zip(SCORES, values @ weights / weights.sum()):
+        result[f"{score}_ewma"] = round(float(ewma), 2)
+    
+    # Least-squares slopes over the window, in points per hour
+    in_window = seconds >= -window_seconds
+    t = seconds[in_window] / 3600
+    if len(t) >= 2 and np.ptp(t) * 3600 >= MIN_TREND_SPAN_SECONDS:
+        centered = t - t.mean()
+        y = values[:, in_window]
+        slopes = (y - y.mean(axis=1, keepdims=True)) @ centered / (centered @ centered)
+        for score, slope in zip(SCORES, slopes):
+            result[f"{score}_slope_per_hour"] = round(float(slope), 3)
+        overall = slopes[SCORES.index('overall_score')]
+        result['direction'] = (
+            'stable' if abs(overall) < STABLE_SLOPE_PER_HOUR else 'improving' if overall > 0 else 'degrading'
+        )
+    
+    critical = snapshots['health'] == HEALTH_CODES['critical']
+    result['critical_snapshots_in_window'] = int((critical & in_window).sum())
+    if critical.any():
+        result['seconds_since_critical'] = max(0.0, round(float(-seconds[np.flatnonzero(critical)[-1]]), 1))
+    return result
+
+
+def record(timestamp_ms: int, summary: Dict[str, Any], history: Optional[SnapshotHistory] = None) -> Dict[str, Any]:
+    """Append a run's summary to the history and return the trends including it; failures never fail the loader"""
+    try:
+        history = history or SnapshotHistory()
+        history.append(timestamp_ms, summary)
+        return trends(history.snapshots(), timestamp_ms)
+    except Exception as e:
+        print(f"Error updating metric history: {e}", file=sys.stderr)
+        return {'error': str(e)}
@@ -7,13 +7,17 @@ Fetches system metrics from Prometheus API and processes them for dashboard disp
 import os
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 import requests
 import pandas as pd
-from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
+import backend_limits
+import metric_history
+import query_cache
+
 
 class PrometheusDataLoader:
     def __init__(self):
@@ -21,14 +25,15 @@ class PrometheusDataLoader:
         self.session = self._create_session()
         
     def _create_session(self) -> requests.Session:
-        """Create a requests session with retry strategy"""
+        """Create a requests session with retry strategy and the shared Prometheus limiter"""
         session = requests.Session()
+        # Connection errors are retried by urllib3; overload statuses by the limiter
         retry_strategy = Retry(
             total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "OPTIONS"]
+            backoff_factor=0.5,
+            allowed_methods=["HEAD", "GET", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = backend_limits.LimitedAdapter('prometheus', max_retries=retry_strategy)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
@@ -47,6 +52,10 @@ class PrometheusDataLoader:
             # Generate summary statistics
             metrics_data['summary'] = self._generate_summary(metrics_data)
             
+            # Trends come from the snapshots of earlier runs, not from range queries
+            if 'error' not in metrics_data['summary']:
+                metrics_data['trends'] = metric_history.record(metrics_data['timestamp'], metrics_data['summary'])
+            
             return metrics_data
             
         except Exception as e:
@@ -55,8 +64,6 @@ class PrometheusDataLoader:
     
     def _fetch_system_metrics(self) -> Dict[str, Any]:
         """Fetch system-level metrics"""
-        metrics = {}
-        
         # Define queries for system metrics
         queries = {
             'cpu_usage': 'avg(1 - rate(node_cpu_seconds_total{mode="idle"}[5m])) * 100',
@@ -68,20 +75,10 @@ class PrometheusDataLoader:
             'uptime': 'avg(node_time_seconds - node_boot_time_seconds)'
         }
         
-        for metric_name, query in queries.items():
-            try:
-                result = self._execute_query(query)
-                metrics[metric_name] = self._extract_metric_value(result)
-            except Exception as e:
-                print(f"Error fetching {metric_name}: {e}", file=sys.stderr)
-                metrics[metric_name] = None
-        
-        return metrics
+        return self._query_values(queries, report_errors=True)
     
     def _fetch_application_metrics(self) -> Dict[str, Any]:
         """Fetch application-specific metrics"""
-        metrics = {}
-        
         queries = {
             'http_requests_total': 'sum(rate(http_requests_total[5m]))',
             'http_request_duration': 'avg(http_request_duration_seconds)',
@@ -92,20 +89,11 @@ class PrometheusDataLoader:
             'cache_hit_rate': 'rate(redis_keyspace_hits_total[5m]) / (rate(redis_keyspace_hits_total[5m]) + rate(redis_keyspace_misses_total[5m])) * 100'
         }
         
-        for metric_name, query in queries.items():
-            try:
-                result = self._execute_query(query)
-                metrics[metric_name] = self._extract_metric_value(result)
-            except Exception as e:
-                # Many of these metrics may not exist in all environments
-                metrics[metric_name] = None
-        
-        return metrics
+        # Many of these metrics may not exist in all environments
+        return self._query_values(queries)
     
     def _fetch_observability_metrics(self) -> Dict[str, Any]:
         """Fetch metrics specific to our observability stack"""
-        metrics = {}
-        
         queries = {
             # Kubernetes metrics
             'pod_count': 'count(kube_pod_info)',
@@ -125,27 +113,38 @@ class PrometheusDataLoader:
             'alertmanager_alerts': 'sum(alertmanager_alerts)'
         }
         
-        for metric_name, query in queries.items():
+        return self._query_values(queries)
+    
+    def _query_values(self, queries: Dict[str, str], report_errors: bool = False) -> Dict[str, Optional[float]]:
+        """Run named queries concurrently through the shared limiter and extract their values"""
+        def value(item):
+            metric_name, query = item
             try:
-                result = self._execute_query(query)
-                metrics[metric_name] = self._extract_metric_value(result)
+                return metric_name, self._extract_metric_value(self._execute_query(query))
             except Exception as e:
-                metrics[metric_name] = None
+                if report_errors:
+                    print(f"Error fetching {metric_name}: {e}", file=sys.stderr)
+                return metric_name, None
         
-        return metrics
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            return dict(executor.map(value, queries.items()))
     
     def _execute_query(self, query: str) -> Dict:
-        """Execute a Prometheus query"""
+        """Execute a Prometheus instant query at the current minute, through the query cache"""
         url = f"{self.prometheus_endpoint}/api/v1/query"
+        # The evaluation minute is an open bucket; it is shared by loaders and rebuilds until its TTL
+        evaluated, bucket_end = query_cache.instant_time()
         params = {
             'query': query,
-            'time': datetime.now().isoformat()
+            'time': evaluated
         }
         
-        response = self.session.get(url, params=params, timeout=10)
-        response.raise_for_status()
+        def fetch() -> Dict:
+            response = self.session.get(url, params=params, timeout=10)
+            response.raise_for_status()
+            return response.json()
         
-        return response.json()
+        return query_cache.cached('prometheus', query, evaluated, bucket_end, fetch)
     
     def _extract_metric_value(self, result: Dict) -> Optional[float]:
         """Extract numeric value from Prometheus query result"""
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Multi-core enrichment of large log frames
+Splits a frame into row chunks, hands them to worker processes as Arrow IPC files on shared memory and reassembles the enriched chunks in order
+"""
+
+import os
+import sys
+import atexit
+import inspect
+import tempfile
+import threading
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import polars as pl
+
+
+# Worker processes, or auto for one per available core; 1 keeps enrichment in the loader process
+ENRICH_WORKERS = os.getenv('ENRICH_WORKERS', 'auto')
+
+# Frames below this many rows are enriched in-process, where worker start-up would cost more than it saves
+ENRICH_PARALLEL_MIN_ROWS = int(os.getenv('ENRICH_PARALLEL_MIN_ROWS', '200000'))
+
+# Chunks per worker; more than one evens out chunks whose messages cost more to match
+CHUNKS_PER_WORKER = 2
+
+# tmpfs, so chunk files never touch the disk
+SHARED_MEMORY_DIR = os.getenv('ENRICH_SHM_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+
+CGROUP_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+
+
+def available_cores() -> int:
+    """CPUs this process may use, honouring its affinity mask and the cgroup CPU quota"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    
+    # A pod limited to 1000m has one core's worth of time however many the node shows
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def worker_count(setting: str = ENRICH_WORKERS) -> int:
+    """Configured number of worker processes"""
+    if setting.strip().lower() in ('', 'auto', '0'):
+        return available_cores()
+    try:
+        return max(1, int(setting))
+    except ValueError:
+        print(f"Invalid ENRICH_WORKERS {setting!r}, enriching in-process", file=sys.stderr)
+        return 1
+
+
+def _function_reference(function: Callable) -> Tuple[str, str]:
+    """Source file and qualified name under which a worker can find a function"""
+    qualname = getattr(function, '__qualname__', '')
+    try:
+        path = inspect.getfile(function)
+    except TypeError:
+        path = None
+    if not path or not qualname or '<locals>' in qualname:
+        raise ValueError(f"{function!r} is not reachable by name from its module")
+    return os.path.abspath(path), qualname
+
+
+# Functions resolved in this worker, by reference
+_resolved: Dict[Tuple[str, str], Callable] = {}
+
+
+def _resolve(path: str, qualname: str) -> Callable:
+    """Import a function by source file and qualified name, once per worker"""
+    key = (path, qualname)
+    if key not in _resolved:
+        # Loader scripts have hyphenated file names, so they are imported by path
+        name = f"_enrich_{os.path.basename(path)[:-3].replace('-', '_').replace('.', '_')}"
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        target = module
+        for part in qualname.split('.'):
+            target = getattr(target, part)
+        _resolved[key] = target
+    return _resolved[key]
+
+
+def _enrich_chunk(path: str, qualname: str, chunk_path: str) -> Tuple[str, List[str]]:
+    """Worker: enrich one chunk file and write the result next to it
+    
+    Categorical columns travel as strings, since each worker builds its own
+    category mapping; the names come back so the parent can restore them.
+    """
+    df = _resolve(path, qualname)(pl.read_ipc(chunk_path))
+    categorical = [name for name, dtype in df.schema.items() if dtype == pl.Categorical]
+    result_path = f"{chunk_path[:-6]}.out.arrow"
+    df.with_columns([pl.col(name).cast(pl.String) for name in categorical]).write_ipc(result_path, compression='uncompressed')
+    return result_path, categorical
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _pool(workers: int) -> ProcessPoolExecutor:
+    """The process-wide worker pool, started on first use and reused across frames"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or _executor_workers != workers:
+            if _executor is None:
+                atexit.register(_shutdown)
+            else:
+                _executor.shutdown()
+            # Forking a process that already runs Polars threads can deadlock; spawn starts clean
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _executor_workers = workers
+        return _executor
+
+
+def _shutdown() -> None:
+    """Stop the worker pool at exit"""
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+
+
+def apply(df: pl.DataFrame, function: Callable[[pl.DataFrame], pl.DataFrame],
+          workers: Optional[int] = None, min_rows: int = ENRICH_PARALLEL_MIN_ROWS) -> pl.DataFrame:
+    """function(df), computed chunk by chunk in worker processes when the frame is large
+    
+    function must be row-wise, so that enriching chunks and concatenating them
+    gives the same frame as enriching the whole, and importable by name from
+    its module: a module-level function, staticmethod or classmethod. Any
+    failure in the parallel path falls back to a single in-process call.
+    """
+    workers = worker_count() if workers is None else workers
+    if workers <= 1 or df.height < max(min_rows, 2):
+        return function(df)
+    
+    try:
+        reference = _function_reference(function)
+    except ValueError as e:
+        print(f"Parallel enrichment unavailable: {e}", file=sys.stderr)
+        return function(df)
+    
+    chunks = min(workers * CHUNKS_PER_WORKER, df.height)
+    size = -(-df.height // chunks)
+    # Each worker sizes its Polars thread pool from this at import
+    threads = os.environ.get('POLARS_MAX_THREADS')
+    os.environ['POLARS_MAX_THREADS'] = str(max(1, available_cores() // workers))
+    try:
+        with tempfile.TemporaryDirectory(prefix='enrich-', dir=SHARED_MEMORY_DIR) as directory:
+            futures = []
+            pool = _pool(workers)
+            for i, offset in enumerate(range(0, df.height, size)):
+                chunk_path = os.path.join(directory, f"{i:05d}.arrow")
+                df.slice(offset, size).write_ipc(chunk_path, compression='uncompressed')
+                futures.append(pool.submit(_enrich_chunk, *reference, chunk_path))
+            
+            results = [future.result() for future in futures]
+            categorical = sorted({name for _, names in results for name in names})
+            # Read back while the files exist; the concatenation owns its memory
+            enriched = pl.concat([pl.read_ipc(result_path) for result_path, _ in results], how='diagonal_relaxed', rechunk=True)
+        return enriched.with_columns([pl.col(name).cast(pl.Categorical) for name in categorical])
+    
+    except Exception as e:
+        print(f"Parallel enrichment failed, enriching in-process: {e}", file=sys.stderr)
+        return function(df)
+    
+    finally:
+        if threads is None:
+            os.environ.pop('POLARS_MAX_THREADS', None)
+        else:
+            os.environ['POLARS_MAX_THREADS'] = threads
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Partitioned output for the log data loaders
+Splits display rows into a fixed set of shards keyed by a hash of the service (and optionally per hour) with a manifest of row counts and time ranges, packed as a zip archive
+"""
+
+import io
+import os
+import json
+import zlib
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Callable, Dict, List
+import polars as pl
+
+
+# Shard encoding, json or parquet
+PARTITION_FORMAT = os.getenv('PARTITION_FORMAT', 'json')
+
+# Split each service further into one shard per UTC hour
+PARTITION_BY_HOUR = os.getenv('PARTITION_BY_HOUR', '').lower() in ('1', 'true', 'yes')
+
+# Services are hashed onto this many shard files, so pages can reference every shard by a fixed name
+PARTITION_SHARDS = int(os.getenv('PARTITION_SHARDS', '16'))
+
+MANIFEST_NAME = 'manifest.json'
+
+NS_PER_HOUR = 3600 * 1_000_000_000
+
+UNKNOWN_SERVICE = 'unknown'
+
+
+def shard_of(service: str, shards: int = PARTITION_SHARDS) -> int:
+    """Shard holding a service's rows; pages look services up in the manifest rather than hashing"""
+    return zlib.crc32(service.encode('utf-8')) % shards
+
+
+def _isoformat(timestamp_ns: int) -> str:
+    """UTC ISO timestamp of nanoseconds since the epoch"""
+    return datetime.fromtimestamp(timestamp_ns / 1e9, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _encode(rows: List[Dict[str, Any]], fmt: str) -> bytes:
+    """Serialize shard rows"""
+    if fmt == 'parquet':
+        buffer = io.BytesIO()
+        # Empty shards are still written, as a table without columns
+        (pl.from_dicts(rows, infer_schema_length=None) if rows else pl.DataFrame()).write_parquet(buffer)
+        return buffer.getvalue()
+    return json.dumps(rows, default=str, separators=(',', ':')).encode('utf-8')
+
+
+def build(frame: pl.DataFrame, to_rows: Callable[[pl.DataFrame], List[Dict[str, Any]]], source: str,
+          by_hour: bool = PARTITION_BY_HOUR, fmt: str = PARTITION_FORMAT,
+          shards: int = PARTITION_SHARDS) -> Dict[str, bytes]:
+    """Shard files and manifest, keyed by path within the archive
+    
+    to_rows turns one service (or service hour) of the frame into its display
+    rows, so every service is sampled on its own and stays the same size as
+    services are added. Services are hashed onto shard-NN files, or
+    shard-NN/<hour> files by hour, and every shard is written even when
+    empty: Framework pages can only reference files by literal name, so a
+    page lists the shards up front and downloads just the one the manifest
+    names for the selected service.
+    """
+    if fmt not in ('json', 'parquet'):
+        raise ValueError(f"Unsupported partition format: {fmt}")
+    
+    rows_by_path: Dict[str, List[Dict[str, Any]]] = {
+        f"shard-{shard:02d}.{fmt}": [] for shard in range(shards)
+    } if not by_hour else {}
+    entries = []
+    if not frame.is_empty():
+        keyed = frame.with_columns([
+            pl.col('service_name').cast(pl.String).fill_null(UNKNOWN_SERVICE).alias('_service'),
+            (pl.col('timestamp_ns') // NS_PER_HOUR).alias('_hour'),
+        ])
+        keys = ['_service', '_hour'] if by_hour else ['_service']
+        
+        for part in keyed.partition_by(keys, maintain_order=True):
+            service = part['_service'][0]
+            shard = shard_of(service, shards)
+            hour = part['_hour'][0] * NS_PER_HOUR if by_hour else None
+            path = f"shard-{shard:02d}/{_isoformat(hour)[:13]}.{fmt}" if by_hour else f"shard-{shard:02d}.{fmt}"
+            
+            rows = to_rows(part.drop(['_service', '_hour']))
+            rows_by_path.setdefault(path, []).extend(rows)
+            entries.append({
+                'service_name': service,
+                'hour': _isoformat(hour) if by_hour else None,
+                'shard': shard,
+                'path': path,
+                'rows': len(rows),
+                'matched_rows': part.height,
+                'start': _isoformat(part['timestamp_ns'].min()),
+                'end': _isoformat(part['timestamp_ns'].max()),
+            })
+    
+    files = {path: _encode(rows, fmt) for path, rows in rows_by_path.items()}
+    for entry in entries:
+        entry['shard_bytes'] = len(files[entry['path']])
+    
+    entries.sort(key=lambda entry: (entry['service_name'], entry['hour'] or ''))
+    manifest = {
+        'source': source,
+        'format': fmt,
+        'by_hour': by_hour,
+        'shards': shards,
+        'generated_at': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'total_rows': sum(entry['rows'] for entry in entries),
+        'matched_rows': frame.height,
+        'services': sorted({entry['service_name'] for entry in entries}),
+        'partitions': entries,
+    }
+    return {MANIFEST_NAME: json.dumps(manifest, indent=2).encode('utf-8'), **files}
+
+
+def write_archive(files: Dict[str, bytes], stream: BinaryIO) -> None:
+    """Write shard files as a zip archive, e.g. to a loader's stdout"""
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, data in files.items():
+            archive.writestr(path, data)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of backend query results
+Keys results by backend, normalized query and aligned time bucket, in an in-memory LRU over an on-disk store
+"""
+
+import os
+import re
+import sys
+import gzip
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import state_store
+
+
+CACHE_DIR = os.getenv('QUERY_CACHE_DIR', os.path.join(state_store.STATE_DIR, 'query-cache'))
+
+# Disk layer size; least recently used entries are evicted beyond it
+MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+MEMORY_ENTRIES = 128
+
+# Seconds an open bucket's result stays fresh, overridable with QUERY_CACHE_TTL_<BACKEND>
+DEFAULT_TTLS = {'loki': 60, 'quickwit': 60, 'prometheus': 30}
+
+# Query windows are aligned to this many seconds so rebuilds share keys
+BUCKET_SECONDS = 60
+
+# Fetch windows are split into sub-buckets aligned to this many seconds and cached one by one,
+# so only the open bucket and the recently closed ones are fetched again on the next run
+SUB_BUCKET_SECONDS = int(os.getenv('QUERY_CACHE_SUB_BUCKET_SECONDS', '600'))
+
+# Buckets that ended this long ago no longer receive late data and are cached for good
+SETTLE_SECONDS = 600
+
+STATS_STATE_NAME = 'query-cache-stats.json'
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def aligned_window(hours_back: float, now: Optional[float] = None) -> Tuple[int, int]:
+    """Start and end in epoch seconds of a window ending at the last bucket boundary"""
+    now = time.time() if now is None else now
+    end = int(now // BUCKET_SECONDS * BUCKET_SECONDS)
+    return end - int(hours_back * 3600), end
+
+
+def sub_buckets(start: int, end: int, size: int = SUB_BUCKET_SECONDS) -> List[Tuple[int, int]]:
+    """Aligned [bucket_start, bucket_end) windows covering [start, end), newest first
+    
+    The oldest bucket starts at the boundary before start, so its key does not
+    change as the window slides; callers drop the rows before start. The
+    newest bucket ends at end and is the only one whose key changes.
+    """
+    buckets = []
+    bucket_end = end
+    while bucket_end > start:
+        bucket_start = (bucket_end - 1) // size * size
+        buckets.append((bucket_start, bucket_end))
+        bucket_end = bucket_start
+    return buckets
+
+
+def instant_time(step: int = BUCKET_SECONDS, now: Optional[float] = None) -> Tuple[int, int]:
+    """Evaluation time of an instant query and the end of its open bucket
+    
+    A point-in-time value has no closed sub-buckets to keep; it is cached as
+    the open bucket [time, time + step), which expires after the backend's TTL.
+    """
+    now = time.time() if now is None else now
+    evaluated = int(now // step * step)
+    return evaluated, evaluated + step
+
+
+def normalize_query(query: Any) -> str:
+    """Canonical text of a query string or request body"""
+    if isinstance(query, str):
+        # Whitespace outside quoted strings does not change LogQL or PromQL
+        parts = re.split(r'("(?:[^"\\]|\\.)*"|`[^`]*`)', query.strip())
+        return ''.join(part if i % 2 else WHITESPACE_RE.sub(' ', part) for i, part in enumerate(parts))
+    return json.dumps(query, sort_keys=True, separators=(',', ':'))
+
+
+def cache_key(backend: str, query: Any, start: int, end: int) -> str:
+    """Content address of a query over a time bucket"""
+    material = json.dumps([backend, normalize_query(query), start, end], separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class QueryCache:
+    """Two-level TTL cache of JSON query results
+    
+    Results of buckets that ended more than SETTLE_SECONDS ago never expire;
+    open buckets expire after the backend's TTL. The disk layer keeps one
+    gzipped JSON file per key and evicts the least recently used files once
+    it grows past max_bytes.
+    """
+    
+    def __init__(self, directory: str = CACHE_DIR, memory_entries: int = MEMORY_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.memory: 'OrderedDict[str, Tuple[Optional[float], Any]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk_bytes: Optional[int] = None
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+    
+    @staticmethod
+    def ttl(backend: str) -> float:
+        """Freshness of an open bucket's result for a backend"""
+        return float(os.getenv(f'QUERY_CACHE_TTL_{backend.upper()}', DEFAULT_TTLS.get(backend, 60)))
+    
+    def _path(self, key: str) -> str:
+        """Disk location of a key, fanned out over 256 directories"""
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+    
+    def _count(self, counter: str) -> None:
+        """Increment a stats counter"""
+        with self.lock:
+            self.counters[counter] += 1
+    
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """(found, value) for a key, from memory or disk"""
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return True, entry[1]
+        
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False, None
+        if stored['expires'] is not None and stored['expires'] <= now:
+            return False, None
+        
+        # Touch for LRU eviction and promote to memory
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self._remember(key, stored['expires'], stored['value'])
+        self._count('disk_hits')
+        return True, stored['value']
+    
+    def _remember(self, key: str, expires: Optional[float], value: Any) -> None:
+        """Store in the memory layer, dropping the least recently used entries"""
+        with self.lock:
+            self.memory[key] = (expires, value)
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+    
+    def put(self, key: str, value: Any, expires: Optional[float]) -> None:
+        """Store a value in both layers"""
+        self._remember(key, expires, value)
+        self._count('stores')
+        
+        path = self._path(key)
+        tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=1) as f:
+                json.dump({'expires': expires, 'value': value}, f, separators=(',', ':'))
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Error caching query result {path}: {e}", file=sys.stderr)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        
+        with self.lock:
+            if self.disk_bytes is not None:
+                self.disk_bytes += size
+            over = self.disk_bytes is None or self.disk_bytes > self.max_bytes
+        if over:
+            self._evict()
+    
+    def _evict(self) -> None:
+        """Delete the least recently used files until the disk layer fits in max_bytes"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    status = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((status.st_mtime, status.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                evicted += 1
+            except OSError:
+                pass
+        
+        with self.lock:
+            self.disk_bytes = total
+            self.counters['evictions'] += evicted
+    
+    def fetch(self, backend: str, query: Any, start: int, end: int, fetch: Callable[[], Any]) -> Any:
+        """Cached result of fetch() for a query over [start, end] in epoch seconds
+        
+        Exceptions from fetch() propagate and nothing is cached.
+        """
+        key = cache_key(backend, query, start, end)
+        found, value = self.get(key)
+        if found:
+            return value
+        
+        self._count('misses')
+        value = fetch()
+        settled = end <= time.time() - SETTLE_SECONDS
+        self.put(key, value, None if settled else time.time() + self.ttl(backend))
+        return value
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit and miss counters with the hit ratio"""
+        with self.lock:
+            counters = dict(self.counters)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return {**counters, 'lookups': lookups, 'hit_ratio': round(hits / lookups, 4) if lookups else 0}
+
+
+_cache: Optional[QueryCache] = None
+_cache_lock = threading.Lock()
+
+
+def shared() -> QueryCache:
+    """The process-wide cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QueryCache()
+            atexit.register(_record_stats)
+        return _cache
+
+
+def cached(backend: str, query: Any, start: int, end: int, fetch: Callable[[], Any]) -> Any:
+    """Cached result of fetch() through the process-wide cache"""
+    return shared().fetch(backend, query, start, end, fetch)
+
+
+def _record_stats() -> None:
+    """Add this run's counters to the cumulative stats kept between runs"""
+    run = _cache.stats()
+    if not run['lookups']:
+        return
+    print(f"Query cache: {run['lookups']} lookups, hit ratio {run['hit_ratio']}", file=sys.stderr)
+    
+    # Loaders exit concurrently; the lock keeps one from overwriting another's counts
+    with state_store.locked(STATS_STATE_NAME):
+        total = state_store.load_json(STATS_STATE_NAME, default={})
+        for counter in ('memory_hits', 'disk_hits', 'misses', 'stores', 'evictions', 'lookups'):
+            total[counter] = total.get(counter, 0) + run[counter]
+        hits = total['memory_hits'] + total['disk_hits']
+        total['hit_ratio'] = round(hits / total['lookups'], 4) if total['lookups'] else 0
+        state_store.save_json(STATS_STATE_NAME, total)
+
+
+def cumulative_stats() -> Dict[str, Any]:
+    """Counters summed over every run that used the cache"""
+    return state_store.load_json(STATS_STATE_NAME, default={})
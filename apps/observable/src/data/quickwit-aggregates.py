@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for security dashboard aggregates
+Risk distribution, categories, hourly series and per-IP statistics computed from Quickwit logs with Polars
+"""
+
+import json
+
+import loaders
+
+
+def main():
+    """Main function to run the data loader"""
+    loader = loaders.load('quickwit-logs.py').QuickwitDataLoader()
+    
+    # Same time range and limit as quickwit-logs.py
+    frame = loader.analyze_frame(loader.fetch_frame(hours_back=2, max_hits=1000))
+    
+    # Output as JSON for Observable Framework
+    print(json.dumps(loader.compute_aggregates(frame), indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
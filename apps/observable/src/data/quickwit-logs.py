@@ -2,44 +2,84 @@
 """
 Observable Framework data loader for Quickwit security logs
 Fetches security logs from Quickwit API and processes them with Pandas for analysis
+Rows follow the unified log schema in log_schema.py
 """
 
 import os
 import sys
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
 import requests
 import pandas as pd
-from requests.adapters import HTTPAdapter
+import polars as pl
 from urllib3.util.retry import Retry
 
+import anomaly
+import backend_limits
+import dedup
+import log_archive
+import log_schema
+import parallel_enrich
+import query_cache
+import sampling
+import security_fields
+import threat_sketches
+
 
 class QuickwitDataLoader:
     def __init__(self):
         self.quickwit_endpoint = os.getenv('QUICKWIT_ENDPOINT', 'http://192.168.122.27:7280')
         self.session = self._create_session()
-        
+        self.threat_sketches = threat_sketches.ThreatSketches()
+        # Where the last fetch stopped being truncated; baselines only learn from rows after it
+        self.covered_start_ns: Optional[int] = None
+    
     def _create_session(self) -> requests.Session:
-        """Create a requests session with retry strategy"""
+        """Create a requests session with retry strategy and the shared Quickwit limiter"""
         session = requests.Session()
+        # Connection errors are retried by urllib3; overload statuses by the limiter
         retry_strategy = Retry(
             total=3,
-            status_forcelist=[429, 500, 502, 503, 504],
-            method_whitelist=["HEAD", "GET", "POST", "OPTIONS"]
+            backoff_factor=0.5,
+            allowed_methods=["HEAD", "GET", "POST", "OPTIONS"]
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
+        adapter = backend_limits.LimitedAdapter('quickwit', max_retries=retry_strategy)
         session.mount("http://", adapter)
         session.mount("https://", adapter)
         return session
     
     def fetch_logs(self, hours_back: int = 1, max_hits: int = 500) -> List[Dict[str, Any]]:
         """Fetch security logs from Quickwit API"""
+        return self.display_rows(self.analyze_frame(self.fetch_frame(hours_back, max_hits)))
+    
+    def display_rows(self, frame: pl.DataFrame) -> List[Dict[str, Any]]:
+        """Output rows for an analyzed frame"""
+        # Display rows are a stratified sample; errors and anomalies are always kept
+        frame = sampling.stratified_sample(
+            frame,
+            priority=pl.col('severity').cast(pl.String).is_in(sampling.PRIORITY_SEVERITIES) | (pl.col('anomaly_score') > 0.5)
+        )
+        
+        # Enhance with pandas for the row-level output columns
+        return self._enhance(frame)
+    
+    def fetch_frame(self, hours_back: int = 1, max_hits: int = 500) -> pl.DataFrame:
+        """Fetch security logs from Quickwit API as a deduplicated Polars frame
+        
+        In replay mode (LOG_REPLAY) every archived row of the window is read
+        from the local archive instead, without the max_hits limit.
+        """
         try:
+            if log_archive.REPLAY:
+                self.covered_start_ns = log_archive.replay_window(hours_back)[0]
+                return parallel_enrich.apply(log_archive.replay('quickwit', hours_back), self.enrich)
+            
             url = f"{self.quickwit_endpoint}/api/v1/otel-logs-v0_7/search"
             
-            end_time = int(datetime.now().timestamp())
-            start_time = int((datetime.now() - timedelta(hours=hours_back)).timestamp())
+            # Minute-aligned so rebuilds and other loaders share cached results
+            start_time, end_time = query_cache.aligned_window(hours_back)
             
             # Build comprehensive query for security-relevant logs
             queries = [
@@ -49,205 +89,259 @@ class QuickwitDataLoader:
                 "body:(auth OR login OR failed OR unauthorized OR denied OR firewall)"  # Security keywords
             ]
             
-            all_logs = []
-            for query in queries:
-                payload = {
-                    "query": query,
-                    "max_hits": max_hits // len(queries),
-                    "start_timestamp": start_time,
-                    "end_timestamp": end_time,
-                    "sort": [{"timestamp_nanos": {"order": "desc"}}]
-                }
-                
-                try:
-                    response = self.session.post(url, json=payload, timeout=30)
-                    response.raise_for_status()
+            def search(query: str) -> Tuple[List[pl.DataFrame], int]:
+                """Pages of one query's newest hits, newest sub-bucket first, and where they are complete from"""
+                per_query = max_hits // len(queries)
+                wanted = per_query
+                pages = []
+                covered_ns = end_time * 1000000000
+                # Closed sub-buckets come from the cache; older buckets cannot hold newer hits
+                for bucket_start, bucket_end in query_cache.sub_buckets(start_time, end_time):
+                    payload = {
+                        "query": query,
+                        # The full page size keeps a bucket's key the same whatever newer buckets held
+                        "max_hits": per_query,
+                        "start_timestamp": bucket_start,
+                        "end_timestamp": bucket_end,
+                        "sort": [{"timestamp_nanos": {"order": "desc"}}]
+                    }
                     
-                    query_logs = self._process_quickwit_response(response.json())
-                    all_logs.extend(query_logs)
+                    def fetch() -> Dict:
+                        response = self.session.post(url, json=payload, timeout=30)
+                        response.raise_for_status()
+                        return response.json()
                     
-                except requests.exceptions.RequestException as e:
-                    print(f"Error with query '{query}': {e}", file=sys.stderr)
-                    continue
+                    try:
+                        data = query_cache.cached('quickwit', payload, bucket_start, bucket_end, fetch)
+                    except requests.exceptions.RequestException as e:
+                        print(f"Error with query '{query}': {e}", file=sys.stderr)
+                        break
+                    
+                    # The oldest bucket reaches back before the window
+                    page = log_schema.from_quickwit_response(data)
+                    page = page.filter(pl.col('timestamp_ns') >= start_time * 1000000000).head(wanted)
+                    pages.append(page)
+                    wanted -= page.height
+                    if wanted <= 0:
+                        # Truncated inside this bucket: complete only from its oldest kept hit
+                        covered_ns = int(page['timestamp_ns'].min())
+                        break
+                    covered_ns = max(bucket_start, start_time) * 1000000000
+                return pages, covered_ns
+            
+            # Queries run concurrently; the shared limiter decides how many reach Quickwit at once.
+            # Overlapping queries return the same rows; drop them as each page arrives
+            deduplicator = dedup.StreamingDeduplicator()
+            frames = []
+            with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+                for i, (pages, covered_ns) in enumerate(executor.map(search, queries)):
+                    frames.extend(deduplicator.filter(page) for page in pages)
+                    # The match-all query sees every event, so it bounds the rates the baselines learn
+                    if i == 0:
+                        self.covered_start_ns = covered_ns
             
-            # Remove duplicates and process with pandas
-            return self._deduplicate_and_enhance(all_logs)
+            # Raw rows are archived so improved enrichment can be replayed over them
+            frame = log_schema.concat(frames)
+            log_archive.append('quickwit', frame)
             
+            # Enrichment is row-wise, so large windows can be split across cores
+            return parallel_enrich.apply(frame, self.enrich)
+        
         except Exception as e:
             print(f"Unexpected error in fetch_logs: {e}", file=sys.stderr)
-            return []
+            return log_schema.empty_frame()
     
-    def _process_quickwit_response(self, data: Dict) -> List[Dict[str, Any]]:
-        """Process Quickwit API response"""
-        logs = []
+    def analyze_frame(self, frame: pl.DataFrame) -> pl.DataFrame:
+        """Add security relevance and streaming anomaly scores to a fetched frame"""
+        if frame.is_empty():
+            return frame
         
-        if 'hits' not in data:
-            return logs
+        frame = frame.with_columns(self._security_relevance().alias('is_security_relevant'))
         
-        for hit in data['hits']:
-            doc = hit.get('document', {})
-            
-            # Extract timestamp
-            timestamp_nanos = doc.get('timestamp_nanos', 0)
-            timestamp_ms = timestamp_nanos // 1000000 if timestamp_nanos else 0
-            
-            # Build structured log entry
-            log_entry = {
-                'timestamp': timestamp_ms,
-                'timestamp_nanos': timestamp_nanos,
-                'message': doc.get('body', ''),
-                'severity': doc.get('severity_text', 'unknown'),
-                'service': doc.get('service_name', 'unknown'),
-                'source': 'quickwit',
-                'log_type': doc.get('attributes', {}).get('log_type', 'unknown'),
-                'resource_attributes': doc.get('resource_attributes', {}),
-                'attributes': doc.get('attributes', {}),
-                'trace_id': doc.get('trace_id', ''),
-                'span_id': doc.get('span_id', ''),
-                'scope_name': doc.get('scope_name', ''),
-                'raw_document': doc
-            }
-            
-            # Extract additional security-relevant fields
-            log_entry.update(self._extract_security_fields(doc))
-            
-            logs.append(log_entry)
+        # Score against per-service baselines persisted between runs
+        detector = anomaly.AnomalyDetector()
+        frame = frame.with_columns(detector.score_and_save(frame, self.covered_start_ns))
         
-        return logs
+        # Heavy hitters and distinct counts, merged across runs
+        self.threat_sketches.update(frame)
+        self.threat_sketches.save()
+        return frame
     
-    def _extract_security_fields(self, doc: Dict) -> Dict[str, Any]:
-        """Extract security-relevant fields from log document"""
-        security_fields = {}
+    def compute_aggregates(self, frame: pl.DataFrame) -> Dict[str, Any]:
+        """Compute the security dashboard group-bys on an analyzed frame"""
+        total = frame.height
+        if not total:
+            return {
+                'total_events': 0,
+                'security_events': 0,
+                'risk_distribution': [],
+                'categories': [],
+                'hourly': [{'hour': hour, 'count': 0} for hour in range(24)],
+                'top_source_ips': [],
+                'indicators': {'high_risk_events': 0, 'auth_failures': 0, 'night_activity': 0, 'unique_ips': 0},
+                'anomalous_events': [],
+                'threat_sketches': self.threat_sketches.summary(),
+                'last_updated': datetime.now().isoformat()
+            }
         
-        # Extract from attributes
-        attrs = doc.get('attributes', {})
+        events = frame.filter(pl.col('is_security_relevant'))
+        event_count = events.height
         
-        # Common security fields
-        security_fields.update({
-            'user_id': attrs.get('user_id', attrs.get('user', '')),
-            'source_ip': attrs.get('source_ip', attrs.get('client_ip', attrs.get('remote_addr', ''))),
-            'user_agent': attrs.get('user_agent', attrs.get('http_user_agent', '')),
-            'http_method': attrs.get('http_method', attrs.get('method', '')),
-            'http_status': attrs.get('http_status', attrs.get('status_code', '')),
-            'url': attrs.get('url', attrs.get('request_uri', '')),
-            'session_id': attrs.get('session_id', ''),
-            'category': self._categorize_log(doc.get('body', '')),
-            'risk_score': self._calculate_risk_score(doc)
-        })
+        # Risk score distribution over all events
+        risk_distribution = (
+            frame.group_by('risk_score').agg(pl.len().alias('count'))
+            .with_columns((pl.col('count') / total * 100).round(1).alias('percentage'))
+            .sort('risk_score')
+        )
         
-        return security_fields
-    
-    def _categorize_log(self, message: str) -> str:
-        """Categorize log entry based on content"""
-        message_lower = message.lower()
+        # Categories and hour of day over security-relevant events
+        categories = (
+            events.group_by(pl.col('category').cast(pl.String)).agg(pl.len().alias('count'))
+            .with_columns((pl.col('count') / max(event_count, 1) * 100).round(1).alias('percentage'))
+            .sort('count', descending=True)
+        )
+        hourly = dict(events.group_by('hour').agg(pl.len().alias('count')).iter_rows())
+        
+        # Per-IP statistics, top 15 by event count
+        with_ip = events.filter(pl.col('source_ip') != '')
+        top_source_ips = (
+            with_ip.group_by('source_ip').agg([
+                pl.len().alias('count'),
+                pl.col('risk_score').mean().round(2).alias('avg_risk'),
+                pl.col('category').cast(pl.String).unique().sort().alias('categories'),
+                pl.col('timestamp').max().alias('latest_event'),
+            ])
+            .sort(['count', 'source_ip'], descending=[True, False])
+            .head(15)
+            .rename({'source_ip': 'ip'})
+        )
+        
+        message = pl.col('message').str.to_lowercase()
+        indicators = frame.select([
+            (pl.col('risk_score') >= 7).sum().alias('high_risk_events'),
+            ((pl.col('category') == 'auth') & message.str.contains('failed|denied')).sum().alias('auth_failures'),
+            (pl.col('is_security_relevant') & ((pl.col('hour') < 6) | (pl.col('hour') > 22)))
+            .sum().alias('night_activity'),
+        ]).to_dicts()[0]
+        indicators['unique_ips'] = with_ip['source_ip'].n_unique()
+        
+        # Ten most anomalous events as display rows, so the page needs no row-level file;
+        # _enhance orders by time, so the rows are sorted by score again below
+        anomalous = frame.filter(pl.col('anomaly_score') > 0.5).sort('anomaly_score', descending=True).head(10)
         
-        categories = {
-            'auth': ['login', 'logout', 'authentication', 'authorize', 'auth', 'signin', 'signout'],
-            'access': ['denied', 'forbidden', 'unauthorized', 'permission', 'access'],
-            'security': ['firewall', 'intrusion', 'malware', 'virus', 'attack', 'exploit'],
-            'network': ['connection', 'tcp', 'udp', 'port', 'network', 'socket'],
-            'system': ['system', 'kernel', 'process', 'service', 'daemon'],
-            'application': ['application', 'app', 'web', 'api', 'endpoint']
+        return {
+            'total_events': total,
+            'security_events': event_count,
+            'risk_distribution': risk_distribution.to_dicts(),
+            'categories': categories.to_dicts(),
+            'hourly': [{'hour': hour, 'count': hourly.get(hour, 0)} for hour in range(24)],
+            'top_source_ips': top_source_ips.to_dicts(),
+            'indicators': indicators,
+            'anomalous_events': sorted(self._enhance(anomalous), key=lambda row: -row['anomaly_score']),
+            'threat_sketches': self.threat_sketches.summary(),
+            'last_updated': datetime.now().isoformat()
         }
+    
+    def _process_quickwit_response(self, data: Dict) -> pl.DataFrame:
+        """Process Quickwit API response through the unified log schema"""
+        return self.enrich(log_schema.from_quickwit_response(data))
+    
+    @classmethod
+    def enrich(cls, df: pl.DataFrame) -> pl.DataFrame:
+        """Row-wise enrichment of normalized rows; safe to run on chunks in worker processes"""
+        if df.is_empty():
+            return df
         
-        for category, keywords in categories.items():
-            if any(keyword in message_lower for keyword in keywords):
-                return category
+        # Shared enrichment: severity, category, log_type, time columns
+        df = log_schema.enrich(df)
         
-        return 'general'
+        # Extract additional security-relevant fields
+        return cls._extract_security_fields(df)
     
-    def _calculate_risk_score(self, doc: Dict) -> int:
-        """Calculate a simple risk score for the log entry"""
-        score = 0
-        message = doc.get('body', '').lower()
-        severity = doc.get('severity_text', '').lower()
+    @classmethod
+    def _extract_security_fields(cls, df: pl.DataFrame) -> pl.DataFrame:
+        """Extract security-relevant fields from flattened attributes, then from the message text"""
+        attribute = log_schema.attribute
+        
+        # Common security fields
+        df = df.with_columns([
+            attribute(df, 'user_id', 'user', 'username').alias('user_id'),
+            attribute(df, 'source_ip', 'client_ip', 'remote_addr').alias('source_ip'),
+            attribute(df, 'user_agent', 'http_user_agent').alias('user_agent'),
+            attribute(df, 'http_method', 'method').alias('http_method'),
+            attribute(df, 'http_status', 'status_code').alias('http_status'),
+            attribute(df, 'url', 'request_uri').alias('url'),
+            attribute(df, 'session_id').alias('session_id'),
+            attribute(df, 'attack_type').alias('attack_type')
+        ])
+        
+        # Events that only describe the details in the body text
+        df = security_fields.fill_from_message(df)
+        
+        return df.with_columns(cls._calculate_risk_score().alias('risk_score'))
+    
+    @staticmethod
+    def _calculate_risk_score() -> pl.Expr:
+        """Calculate a simple risk score for each log entry"""
+        message = pl.col('message').str.to_lowercase()
         
         # Severity-based scoring
         severity_scores = {
+            'critical': 4,
             'error': 3,
             'warning': 2,
             'info': 1,
             'debug': 0
         }
-        score += severity_scores.get(severity, 0)
+        score = pl.lit(0)
+        for severity, points in severity_scores.items():
+            score = score + pl.when(pl.col('severity') == severity).then(points).otherwise(0)
         
         # Content-based scoring
         high_risk_keywords = ['failed', 'denied', 'unauthorized', 'error', 'attack', 'intrusion']
         medium_risk_keywords = ['warning', 'timeout', 'retry', 'slow']
         
         for keyword in high_risk_keywords:
-            if keyword in message:
-                score += 2
+            score = score + message.str.contains(keyword, literal=True).cast(pl.Int32) * 2
         
         for keyword in medium_risk_keywords:
-            if keyword in message:
-                score += 1
+            score = score + message.str.contains(keyword, literal=True).cast(pl.Int32)
         
-        return min(score, 10)  # Cap at 10
+        return pl.min_horizontal(score, pl.lit(10)).cast(pl.Int32)  # Cap at 10
     
-    def _deduplicate_and_enhance(self, logs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Remove duplicates and enhance data using pandas"""
-        if not logs:
+    def _enhance(self, frame: pl.DataFrame) -> List[Dict[str, Any]]:
+        """Enhance data using pandas"""
+        if frame.is_empty():
             return []
         
-        # Convert to DataFrame for advanced processing
-        df = pd.DataFrame(logs)
-        
-        # Remove duplicates based on timestamp and message
-        df = df.drop_duplicates(subset=['timestamp_nanos', 'message'], keep='first')
+        # Convert to pandas for the row-level output columns
+        df = frame.to_pandas()
         
         # Sort by timestamp (most recent first)
-        df = df.sort_values('timestamp', ascending=False)
+        df = df.sort_values('timestamp_ns', ascending=False)
         
         # Add time-based analysis
-        df['datetime'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df['hour'] = df['datetime'].dt.hour
         df['day_of_week'] = df['datetime'].dt.dayofweek
         
         # Enhance with statistical analysis
-        df['message_length'] = df['message'].str.len()
         df['word_count'] = df['message'].str.split().str.len()
         
-        # Security analysis
-        df['is_security_relevant'] = df.apply(self._is_security_relevant, axis=1)
-        df['anomaly_score'] = df.apply(self._calculate_anomaly_score, axis=1)
+        # Missing attributes become null rather than NaN in the JSON output
+        df = df.astype(object).where(df.notna(), None)
         
         # Convert back to list of dictionaries
         return df.to_dict('records')
     
-    def _is_security_relevant(self, row: pd.Series) -> bool:
-        """Determine if log entry is security-relevant"""
-        security_indicators = [
-            row['category'] in ['auth', 'access', 'security'],
-            row['risk_score'] >= 3,
-            row['severity'].lower() in ['error', 'warning'],
-            any(keyword in row['message'].lower() for keyword in 
-                ['failed', 'denied', 'unauthorized', 'attack', 'intrusion', 'malware'])
-        ]
-        
-        return any(security_indicators)
-    
-    def _calculate_anomaly_score(self, row: pd.Series) -> float:
-        """Calculate anomaly score based on various factors"""
-        score = 0.0
+    def _security_relevance(self) -> pl.Expr:
+        """Determine if log entries are security-relevant"""
+        message = pl.col('message').str.to_lowercase()
         
-        # Time-based anomalies (unusual hours)
-        if row['hour'] < 6 or row['hour'] > 22:
-            score += 0.2
-        
-        # Message length anomalies
-        if row['message_length'] > 500 or row['message_length'] < 10:
-            score += 0.1
-        
-        # High risk score
-        if row['risk_score'] >= 5:
-            score += 0.3
-        
-        # Security relevance
-        if row['is_security_relevant']:
-            score += 0.2
-        
-        return min(score, 1.0)  # Cap at 1.0
+        return (
+            pl.col('category').cast(pl.String).is_in(['auth', 'access', 'security'])
+            | (pl.col('risk_score') >= 3)
+            | pl.col('severity').cast(pl.String).is_in(['error', 'warning'])
+            | message.str.contains('failed|denied|unauthorized|attack|intrusion|malware')
+        )
 
 
 def main():
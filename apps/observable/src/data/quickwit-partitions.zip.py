@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+"""
+Observable Framework data loader for Quickwit security logs partitioned by service
+Writes a zip archive of fixed-name shards holding hashed groups of services (PARTITION_BY_HOUR=1 adds hours) and a manifest.json; pages fetch only the shard of the service they show
+"""
+
+import sys
+
+import loaders
+import partitions
+
+
+def main():
+    """Main function to run the data loader"""
+    loader = loaders.load('quickwit-logs.py').QuickwitDataLoader()
+    
+    # Same time range and limit as quickwit-logs.py
+    frame = loader.analyze_frame(loader.fetch_frame(hours_back=2, max_hits=1000))
+    
+    # Output as a zip archive for Observable Framework
+    partitions.write_archive(partitions.build(frame, loader.display_rows, 'quickwit'), sys.stdout.buffer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Stratum budget allocation and sample seeding shared by every log loader
+Standard library only, so the standalone loaders at the repository root import it too
+"""
+
+import os
+import zlib
+from typing import List, Sequence
+
+
+# Mixed into every sample seed; change it to draw different, still reproducible samples
+SAMPLE_SEED = os.getenv('SAMPLE_SEED', '0')
+
+
+def allocate(available: Sequence[int], budget: int) -> List[int]:
+    """Split budget across strata proportionally, at least one row each while budget lasts
+    
+    Uses largest remainders so allocations sum exactly to min(budget, sum(available)).
+    """
+    total = sum(available)
+    if total <= budget:
+        return list(available)
+    
+    allocation = [0] * len(available)
+    # One row for as many strata as the budget allows, largest strata first
+    order = sorted(range(len(available)), key=lambda i: -available[i])
+    for i in order[:budget]:
+        if available[i]:
+            allocation[i] = 1
+    remaining = budget - sum(allocation)
+    
+    spare = [a - n for a, n in zip(available, allocation)]
+    spare_total = sum(spare)
+    if remaining and spare_total:
+        shares = [s * remaining / spare_total for s in spare]
+        extra = [int(share) for share in shares]
+        leftover = remaining - sum(extra)
+        for i in sorted(range(len(shares)), key=lambda i: extra[i] - shares[i])[:leftover]:
+            extra[i] += 1
+        allocation = [n + e for n, e in zip(allocation, extra)]
+    return allocation
+
+
+def window_seed(start: int, end: int) -> int:
+    """Sample seed for a time window, so rebuilding the same window shows the same rows"""
+    return zlib.crc32(f"{SAMPLE_SEED}:{start}:{end}".encode('ascii'))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Stratified reservoir sampling for dashboard display tables
+Keeps a bounded, representative sample per severity and service while counting every row exactly
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+import polars as pl
+
+import sample_budget
+
+
+DISPLAY_SAMPLE_SIZE = int(os.getenv('DISPLAY_SAMPLE_SIZE', '500'))
+
+# Rows at these severities are always kept while they fit in the sample
+PRIORITY_SEVERITIES = ['error', 'critical']
+
+
+class StratifiedSampler:
+    """Single-pass stratified reservoir over frames streamed in batches
+    
+    Every row gets a uniform random key and each stratum keeps the rows with
+    the smallest keys, which is a uniform reservoir of that stratum. Memory is
+    bounded by strata * size rows however many batches are added. Priority
+    rows (error and critical by default) form their own strata and fill the
+    sample first, so they are all included unless they alone exceed the size.
+    """
+    
+    def __init__(self, size: int = DISPLAY_SAMPLE_SIZE, strata: Sequence[str] = ('severity', 'service_name'),
+                 priority: Optional[pl.Expr] = None, seed: Optional[int] = None):
+        self.size = size
+        self.strata = list(strata)
+        self.priority = priority if priority is not None else (
+            pl.col('severity').cast(pl.String).is_in(PRIORITY_SEVERITIES)
+        )
+        self.rng = np.random.default_rng(seed)
+        self.total = 0
+        self._counts: Optional[pl.DataFrame] = None
+        self._reservoir: Optional[pl.DataFrame] = None
+    
+    def add(self, df: pl.DataFrame) -> None:
+        """Add a batch of rows"""
+        if df.is_empty():
+            return
+        
+        # Strata collapse into one string key so null severities or services still group
+        keys = ['_stratum', '_priority']
+        df = df.with_columns([
+            pl.Series('_key', self.rng.random(df.height)),
+            pl.concat_str([pl.col(c).cast(pl.String).fill_null('') for c in self.strata], separator='\x1f')
+            .alias('_stratum'),
+            self.priority.fill_null(False).alias('_priority'),
+        ])
+        self.total += df.height
+        
+        # Exact counts per stratum
+        counts = df.group_by(keys).agg(
+            [pl.col(c).cast(pl.String).first() for c in self.strata] + [pl.len().alias('count')]
+        )
+        if self._counts is not None:
+            counts = pl.concat([self._counts, counts], how='vertical_relaxed').group_by(keys).agg(
+                [pl.col(c).first() for c in self.strata] + [pl.col('count').sum()]
+            )
+        self._counts = counts
+        
+        reservoir = df if self._reservoir is None else pl.concat([self._reservoir, df], how='diagonal_relaxed')
+        self._reservoir = reservoir.filter(pl.col('_key').rank('ordinal').over(keys) <= self.size)
+    
+    def sample(self) -> pl.DataFrame:
+        """Fixed-size display sample, newest first"""
+        if self._reservoir is None:
+            return pl.DataFrame()
+        
+        keys = ['_stratum', '_priority']
+        strata = self._counts.with_columns(
+            pl.min_horizontal(pl.col('count'), pl.lit(self.size)).alias('available')
+        ).sort(keys)
+        
+        # Priority strata take what they need first; the rest share what is left
+        priority = strata.filter(pl.col('_priority'))
+        regular = strata.filter(~pl.col('_priority'))
+        priority_alloc = sample_budget.allocate(priority['available'].to_list(), self.size)
+        regular_alloc = sample_budget.allocate(regular['available'].to_list(), self.size - sum(priority_alloc))
+        
+        allocation = pl.concat([
+            priority.with_columns(pl.Series('allocated', priority_alloc, dtype=pl.Int64)),
+            regular.with_columns(pl.Series('allocated', regular_alloc, dtype=pl.Int64)),
+        ]).select(keys + ['allocated'])
+        
+        sample = (
+            self._reservoir.join(allocation, on=keys, how='inner')
+            .filter(pl.col('_key').rank('ordinal').over(keys) <= pl.col('allocated'))
+            .drop(['_key', '_stratum', '_priority', 'allocated'])
+        )
+        if 'timestamp_ns' in sample.columns:
+            sample = sample.sort('timestamp_ns', descending=True)
+        return sample
+    
+    def counts(self) -> Dict[str, Any]:
+        """Exact row counts, overall and per stratum"""
+        if self._counts is None:
+            return {'total': 0, 'sample_size': 0, 'strata': []}
+        
+        strata = (
+            self._counts.group_by(self.strata).agg(pl.col('count').sum())
+            .sort(['count'] + self.strata, descending=[True] + [False] * len(self.strata))
+        )
+        return {
+            'total': self.total,
+            'sample_size': min(self.total, self.size),
+            'strata': strata.to_dicts(),
+        }
+
+
+def stratified_sample(df: pl.DataFrame, size: int = DISPLAY_SAMPLE_SIZE,
+                      priority: Optional[pl.Expr] = None) -> pl.DataFrame:
+    """Stratified display sample of a single frame, seeded by its time range"""
+    seed = None
+    if 'timestamp_ns' in df.columns and not df.is_empty():
+        seed = sample_budget.window_seed(df['timestamp_ns'].min(), df['timestamp_ns'].max())
+    sampler = StratifiedSampler(size=size, priority=priority, seed=seed)
+    sampler.add(df)
+    return sampler.sample()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Inverted index over the log rows a loader emits
+Maps message, service and category terms to sorted row-ID postings, delta and varint compressed, and answers boolean term queries
+"""
+
+import re
+import base64
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional
+import numpy as np
+import polars as pl
+
+
+FORMAT_VERSION = 1
+
+# Dotted, hyphenated and @ tokens (IPs, hosts, user names) are indexed whole and by their parts
+COMPOUND_TOKEN = r'[a-z0-9_]+(?:[.@-][a-z0-9_]+)*'
+PART_TOKEN = r'[a-z0-9_]+'
+
+# Longer tokens are hashes and encoded blobs nobody searches for
+MAX_TOKEN_LENGTH = 64
+
+# Whole column values are terms under these prefixes, e.g. service:auth-service
+FIELD_PREFIXES = {'service_name': 'service:', 'category': 'category:'}
+FIELD_ALIASES = {'service': 'service_name', 'category': 'category'}
+
+QUERY_ITEM_RE = re.compile(r'-?"[^"]*"|\S+')
+COMPOUND_TOKEN_RE = re.compile(COMPOUND_TOKEN)
+
+# Bits of a value per varint byte; the high bit marks that more bytes follow
+VARINT_BITS = 7
+VARINT_MAX_BYTES = 5
+
+
+def varint_lengths(values: np.ndarray) -> np.ndarray:
+    """Encoded size in bytes of each value"""
+    lengths = np.ones(len(values), dtype=np.int64)
+    for i in range(1, VARINT_MAX_BYTES):
+        lengths += values >= (1 << (VARINT_BITS * i))
+    return lengths
+
+
+def encode_varints(values: np.ndarray) -> np.ndarray:
+    """LEB128 bytes of unsigned 32-bit values, all at once"""
+    values = values.astype(np.uint64)
+    lengths = varint_lengths(values)
+    
+    position = np.arange(VARINT_MAX_BYTES)
+    groups = (values[:, None] >> (VARINT_BITS * position).astype(np.uint64)) & 0x7F
+    more = (position[None, :] < lengths[:, None] - 1).astype(np.uint64) << 7
+    # Row-major masking keeps each value's bytes together, low bits first
+    return (groups | more).astype(np.uint8)[position[None, :] < lengths[:, None]]
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Values of concatenated LEB128 bytes, all at once"""
+    if not len(data):
+        return np.zeros(0, dtype=np.uint64)
+    last = data < 0x80
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    value = np.cumsum(np.concatenate([[0], last[:-1]]))
+    shift = (VARINT_BITS * (np.arange(len(data)) - starts[value])).astype(np.uint64)
+    return np.add.reduceat((data & 0x7F).astype(np.uint64) << shift, starts)
+
+
+def query_terms(text: str) -> List[str]:
+    """Index terms a free-text query word must all match"""
+    return [token for token in COMPOUND_TOKEN_RE.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+
+class SearchIndex:
+    """Term to row-ID postings over a window of rows
+    
+    Row IDs are positions in the rows the index was built over. Each term's
+    postings are stored as the first row ID followed by gaps, LEB128 encoded
+    into one byte string; offsets[i]:offsets[i + 1] is the slice of terms[i].
+    to_dict() is the JSON form read by src/components/search-index.js.
+    """
+    
+    def __init__(self, rows: int, terms: List[str], counts: np.ndarray, offsets: np.ndarray, postings: np.ndarray):
+        self.rows = rows
+        self.terms = terms
+        self.counts = counts
+        self.offsets = offsets
+        self.data = postings
+        self._decoded: Dict[int, np.ndarray] = {}
+    
+    @classmethod
+    def build(cls, frame: pl.DataFrame) -> 'SearchIndex':
+        """Index the message, service_name and category columns of a frame"""
+        lists = []
+        if 'message' in frame.columns:
+            message = pl.col('message').cast(pl.String).fill_null('').str.to_lowercase()
+            for pattern in (COMPOUND_TOKEN, PART_TOKEN):
+                tokens = message.str.extract_all(pattern)
+                lists.append(tokens.list.eval(pl.element().filter(pl.element().str.len_bytes() <= MAX_TOKEN_LENGTH)))
+        for column, prefix in FIELD_PREFIXES.items():
+            if column in frame.columns:
+                lists.append(pl.concat_list([pl.lit(prefix) + pl.col(column).cast(pl.String).str.to_lowercase()]))
+        
+        if not lists or frame.is_empty():
+            return cls(frame.height, [], np.zeros(0, dtype=np.int64), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.uint8))
+        
+        # Rows are exploded in order, and grouping keeps that order, so each
+        # posting list comes out sorted; only the distinct terms need sorting
+        postings = (
+            frame.select([
+                pl.int_range(0, pl.len(), dtype=pl.UInt32).alias('row'),
+                pl.concat_list(lists).list.unique().alias('term'),
+            ])
+            .explode('term')
+            .filter(pl.col('term').is_not_null())
+            .group_by('term')
+            .agg('row')
+            .sort('term')
+        )
+        terms = postings['term'].to_list()
+        counts = postings['row'].list.len().to_numpy().astype(np.int64)
+        
+        # Gaps within a term; each term starts from its first row ID
+        rows = postings['row'].explode().to_numpy().astype(np.int64)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        gaps = np.diff(rows, prepend=0)
+        gaps[starts] = rows[starts]
+        ends = np.cumsum(varint_lengths(gaps))[np.cumsum(counts) - 1]
+        return cls(frame.height, terms, counts, np.concatenate([[0], ends]), encode_varints(gaps))
+    
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> 'SearchIndex':
+        """Index loader output rows, in their order"""
+        return cls.build(pl.DataFrame({
+            column: pl.Series([row.get(column) for row in rows], dtype=pl.String)
+            for column in ['message', *FIELD_PREFIXES]
+        }))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-serializable form with the postings base64 encoded"""
+        return {
+            'version': FORMAT_VERSION,
+            'rows': self.rows,
+            'token_pattern': COMPOUND_TOKEN,
+            'max_token_length': MAX_TOKEN_LENGTH,
+            'fields': FIELD_PREFIXES,
+            'terms': self.terms,
+            'counts': self.counts.tolist(),
+            'offsets': self.offsets.tolist(),
+            'postings': base64.b64encode(self.data.tobytes()).decode('ascii'),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SearchIndex':
+        """Index from its to_dict() form"""
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version: {data.get('version')}")
+        return cls(
+            data['rows'], data['terms'], np.array(data['counts'], dtype=np.int64),
+            np.array(data['offsets'], dtype=np.int64),
+            np.frombuffer(base64.b64decode(data['postings']), dtype=np.uint8)
+        )
+    
+    def postings(self, term: str) -> np.ndarray:
+        """Sorted row IDs containing a term"""
+        i = bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            return np.zeros(0, dtype=np.int64)
+        if i not in self._decoded:
+            gaps = decode_varints(self.data[self.offsets[i]:self.offsets[i + 1]])
+            self._decoded[i] = np.cumsum(gaps.astype(np.int64))
+        return self._decoded[i]
+    
+    def _item(self, item: str) -> Optional[List[np.ndarray]]:
+        """Posting lists one query item needs all of, None when it holds no terms"""
+        field, _, value = item.partition(':')
+        if value and field.lower() in FIELD_ALIASES:
+            return [self.postings(FIELD_PREFIXES[FIELD_ALIASES[field.lower()]] + value.strip('"').lower())]
+        
+        terms = query_terms(item)
+        return [self.postings(term) for term in terms] if terms else None
+    
+    def _intersect(self, postings: List[np.ndarray]) -> np.ndarray:
+        """Rows in every posting list, starting from the rarest term"""
+        postings = sorted(postings, key=len)
+        result = postings[0]
+        for other in postings[1:]:
+            if not len(result):
+                break
+            # A row mask is linear in both lists, where sorted merging is not
+            mask = np.zeros(self.rows, dtype=bool)
+            mask[other] = True
+            result = result[mask[result]]
+        return result
+    
+    def search(self, query: str) -> np.ndarray:
+        """Sorted row IDs matching a boolean term query
+        
+        Words must all match; OR separates alternatives; -word or NOT word
+        excludes; service:<name> and category:<name> match whole values.
+        Quoted phrases match rows holding all of their words.
+        """
+        clauses: List[List[str]] = [[]]
+        negate = False
+        for item in QUERY_ITEM_RE.findall(query):
+            if item == 'OR':
+                clauses.append([])
+            elif item == 'NOT':
+                negate = True
+            elif item != 'AND':
+                clauses[-1].append(f"-{item}" if negate else item)
+                negate = False
+        
+        selected = np.zeros(self.rows, dtype=bool)
+        for clause in clauses:
+            include: List[np.ndarray] = []
+            exclude: List[List[np.ndarray]] = []
+            for item in clause:
+                negated = item.startswith('-')
+                postings = self._item(item[1:] if negated else item)
+                if postings is None:
+                    continue
+                if negated:
+                    exclude.append(postings)
+                else:
+                    include.extend(postings)
+            if not include and not exclude:
+                continue
+            
+            matched = self._intersect(include) if include else np.arange(self.rows, dtype=np.int64)
+            for postings in exclude:
+                excluded = np.zeros(self.rows, dtype=bool)
+                excluded[self._intersect(postings)] = True
+                matched = matched[~excluded[matched]]
+            selected[matched] = True
+        return np.flatnonzero(selected)
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Streaming sketches for log analytics
+Fixed-size, serializable and mergeable summaries that can be updated batch by batch across loader runs
+"""
+
+import math
+import base64
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+
+def hash64(values: Iterable[str]) -> np.ndarray:
+    """Stable 64-bit hashes of strings, identical across processes and library versions"""
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little')
+         for value in values),
+        dtype=np.uint64
+    )
+
+
+def _encode(array: np.ndarray) -> str:
+    """Encode an array's raw bytes for JSON"""
+    return base64.b64encode(np.ascontiguousarray(array).tobytes()).decode('ascii')
+
+
+def _decode(data: str, dtype: Any, shape: Any) -> np.ndarray:
+    """Decode an array written by _encode"""
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).reshape(shape).copy()
+
+
+class CountMinSketch:
+    """Count-min sketch over 64-bit hashes
+    
+    Estimates never undercount. With width w and depth d an estimate exceeds the
+    true count by more than (e / w) * total with probability at most exp(-d).
+    """
+    
+    def __init__(self, width: int = 1024, depth: int = 4, table: Optional[np.ndarray] = None):
+        self.width = width
+        self.depth = depth
+        self.table = table if table is not None else np.zeros((depth, width), dtype=np.uint32)
+    
+    @classmethod
+    def from_error(cls, epsilon: float, delta: float) -> 'CountMinSketch':
+        """Size a sketch for overcount <= epsilon * total with probability 1 - delta"""
+        return cls(width=math.ceil(math.e / epsilon), depth=math.ceil(math.log(1 / delta)))
+    
+    @property
+    def total(self) -> int:
+        """Total count added to the sketch"""
+        return int(self.table[0].sum())
+    
+    def _indexes(self, hashes: np.ndarray) -> np.ndarray:
+        """Column index per row, derived from two hash halves (Kirsch-Mitzenmacher)"""
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((low[None, :] + rows * high[None, :]) % np.uint64(self.width)).astype(np.intp)
+    
+    def add(self, hashes: np.ndarray, counts: Optional[np.ndarray] = None) -> None:
+        """Add a batch of hashed items"""
+        if len(hashes) == 0:
+            return
+        counts = np.ones(len(hashes), dtype=np.uint32) if counts is None else counts.astype(np.uint32)
+        indexes = self._indexes(hashes)
+        for row in range(self.depth):
+            np.add.at(self.table[row], indexes[row], counts)
+    
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated counts for a batch of hashed items"""
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=np.uint32)
+        indexes = self._indexes(hashes)
+        return self.table[np.arange(self.depth)[:, None], indexes].min(axis=0)
+    
+    def merge(self, other: 'CountMinSketch') -> 'CountMinSketch':
+        """Add another sketch of the same shape into this one"""
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Cannot merge count-min sketches of different shapes")
+        self.table += other.table
+        return self
+    
+    def halve(self) -> None:
+        """Age the sketch by halving every counter"""
+        self.table >>= 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {'width': self.width, 'depth': self.depth, 'table': _encode(self.table)}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'CountMinSketch':
+        """Deserialize a sketch written by to_dict"""
+        width, depth = data['width'], data['depth']
+        return cls(width, depth, _decode(data['table'], np.uint32, (depth, width)))
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters over at most k counters
+    
+    Each tracked item has count >= true count >= count - error, and every item
+    whose true count exceeds total / k is tracked.
+    """
+    
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.total = 0
+        self.counters: Dict[str, List[int]] = {}
+    
+    def add_counts(self, items: Iterable[str], counts: Iterable[int]) -> None:
+        """Add pre-aggregated batch counts, largest first for the tightest bounds"""
+        for item, count in sorted(zip(items, counts), key=lambda pair: -pair[1]):
+            self.total += count
+            counter = self.counters.get(item)
+            if counter is not None:
+                counter[0] += count
+            elif len(self.counters) < self.k:
+                self.counters[item] = [count, 0]
+            else:
+                # Replace the smallest counter; its count becomes the new item's error
+                victim = min(self.counters, key=lambda key: self.counters[key][0])
+                floor = self.counters.pop(victim)[0]
+                self.counters[item] = [floor + count, floor]
+    
+    def _floor(self) -> int:
+        """Count an untracked item may have had, zero while counters are free"""
+        if len(self.counters) < self.k:
+            return 0
+        return min(counter[0] for counter in self.counters.values())
+    
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Merge another summary, keeping the k largest combined counters"""
+        floor, other_floor = self._floor(), other._floor()
+        combined = {}
+        for item in set(self.counters) | set(other.counters):
+            count, error = self.counters.get(item, [floor, floor])
+            other_count, other_error = other.counters.get(item, [other_floor, other_floor])
+            combined[item] = [count + other_count, error + other_error]
+        
+        self.k = max(self.k, other.k)
+        self.total += other.total
+        self.counters = dict(sorted(combined.items(), key=lambda pair: -pair[1][0])[:self.k])
+        return self
+    
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        """Top n items with count, error and whether their rank is guaranteed"""
+        ranked = sorted(self.counters.items(), key=lambda pair: (-pair[1][0], pair[0]))[:n + 1]
+        result = []
+        for i, (item, (count, error)) in enumerate(ranked[:n]):
+            # An item is guaranteed to be in the true top i+1 if its lower bound
+            # beats the next item's upper bound
+            next_count = ranked[i + 1][1][0] if i + 1 < len(ranked) else self._floor()
+            result.append({
+                'item': item,
+                'count': count,
+                'error': error,
+                'guaranteed': count - error >= next_count
+            })
+        return result
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {'k': self.k, 'total': self.total, 'counters': [[item, c[0], c[1]] for item, c in self.counters.items()]}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'SpaceSaving':
+        """Deserialize a summary written by to_dict"""
+        sketch = cls(data['k'])
+        sketch.total = data['total']
+        sketch.counters = {item: [count, error] for item, count, error in data['counters']}
+        return sketch
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter with 2^precision registers
+    
+    The relative standard error of the estimate is about 1.04 / sqrt(2^precision),
+    1.6% at the default precision of 12 (4 KiB of registers).
+    """
+    
+    def __init__(self, precision: int = 12, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = registers if registers is not None else np.zeros(self.m, dtype=np.uint8)
+    
+    @property
+    def relative_error(self) -> float:
+        """Relative standard error of estimate()"""
+        return 1.04 / math.sqrt(self.m)
+    
+    def add(self, hashes: np.ndarray) -> None:
+        """Add a batch of hashed items"""
+        if len(hashes) == 0:
+            return
+        hashes = hashes.astype(np.uint64)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        
+        # Bit length of the remaining bits, split in 32-bit halves so float log2 stays exact
+        high = (rest >> np.uint64(32)).astype(np.float64)
+        low = (rest & np.uint64(0xFFFFFFFF)).astype(np.float64)
+        with np.errstate(divide='ignore'):
+            bit_length = np.where(
+                high > 0, 33 + np.floor(np.log2(np.maximum(high, 1))),
+                np.where(low > 0, 1 + np.floor(np.log2(np.maximum(low, 1))), 0)
+            )
+        rank = ((64 - self.precision) - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+    
+    def estimate(self) -> float:
+        """Estimated number of distinct items"""
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m * self.m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return self.m * math.log(self.m / zeros)
+        return float(raw)
+    
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Union with another sketch of the same precision"""
+        if self.precision != other.precision:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {'precision': self.precision, 'registers': _encode(self.registers)}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'HyperLogLog':
+        """Deserialize a sketch written by to_dict"""
+        precision = data['precision']
+        return cls(precision, _decode(data['registers'], np.uint8, (1 << precision,)))
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit hashes
+    
+    Membership tests have no false negatives. Sized for capacity items, the
+    false positive rate stays near error until that many items are added.
+    """
+    
+    def __init__(self, capacity: int = 1_000_000, error: float = 1e-3, bits: Optional[np.ndarray] = None, count: int = 0):
+        self.capacity = capacity
+        self.error = error
+        self.size = math.ceil(-capacity * math.log(error) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bits if bits is not None else np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        self.count = count
+    
+    def _indexes(self, hashes: np.ndarray) -> np.ndarray:
+        """Bit index per hash function, derived from two hash halves (Kirsch-Mitzenmacher)"""
+        low = hashes & np.uint64(0xFFFFFFFF)
+        high = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.hash_count, dtype=np.uint64)[:, None]
+        return ((low[None, :] + rows * high[None, :]) % np.uint64(self.size)).astype(np.intp)
+    
+    def add(self, hashes: np.ndarray) -> None:
+        """Add a batch of hashed items"""
+        if len(hashes) == 0:
+            return
+        indexes = self._indexes(hashes.astype(np.uint64)).ravel()
+        np.bitwise_or.at(self.bits, indexes >> 3, np.left_shift(1, indexes & 7).astype(np.uint8))
+        self.count += len(hashes)
+    
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """Boolean membership per hashed item"""
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=bool)
+        indexes = self._indexes(hashes.astype(np.uint64))
+        return ((self.bits[indexes >> 3] >> (indexes & 7).astype(np.uint8)) & 1).all(axis=0).astype(bool)
+    
+    def merge(self, other: 'BloomFilter') -> 'BloomFilter':
+        """Union with another filter of the same shape"""
+        if (self.size, self.hash_count) != (other.size, other.hash_count):
+            raise ValueError("Cannot merge Bloom filters of different shapes")
+        np.bitwise_or(self.bits, other.bits, out=self.bits)
+        self.count += other.count
+        return self
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {'capacity': self.capacity, 'error': self.error, 'count': self.count, 'bits': _encode(self.bits)}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'BloomFilter':
+        """Deserialize a filter written by to_dict"""
+        bloom = cls(data['capacity'], data['error'], count=data['count'])
+        bloom.bits = _decode(data['bits'], np.uint8, bloom.bits.shape)
+        return bloom
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Persistent state shared by data loader runs
+Stores small JSON documents (baselines, sketches, watermarks) under LOADER_STATE_DIR
+"""
+
+import os
+import sys
+import json
+import fcntl
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+
+STATE_DIR = os.getenv('LOADER_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.state'))
+
+
+def state_path(name: str, directory: Optional[str] = None) -> str:
+    """Return the path of a named state file, creating the state directory"""
+    directory = directory or STATE_DIR
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+def load_json(name: str, default: Any = None, directory: Optional[str] = None) -> Any:
+    """Load a named JSON state document, or default when missing or unreadable"""
+    path = os.path.join(directory or STATE_DIR, name)
+    if not os.path.exists(path):
+        return default
+    
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable state {path}: {e}", file=sys.stderr)
+        return default
+
+
+def save_json(name: str, data: Any, directory: Optional[str] = None) -> None:
+    """Atomically write a named JSON state document, under directory instead of LOADER_STATE_DIR when given"""
+    path = state_path(name, directory)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error saving state {path}: {e}", file=sys.stderr)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextmanager
+def locked(name: str) -> Iterator[None]:
+    """Exclusive lock on a named state document, serializing read-modify-write across loader processes"""
+    with open(f"{state_path(name)}.lock", 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Drain-style log template mining
+Clusters messages into templates with a fixed-depth prefix tree, updated incrementally and persisted between loader runs
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+import polars as pl
+
+import state_store
+
+
+DEFAULT_STATE_NAME = 'loki-templates.json'
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+
+WILDCARD = '<*>'
+
+# Tokens that are always parameters: numbers with optional units, IPv4
+# addresses with optional port, hex values, UUIDs
+PARAMETER_RE = re.compile(
+    r'^(?:'
+    r'[-+]?\d+(?:[.,:]\d+)*[a-zA-Z%]{0,3}'
+    r'|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?'
+    r'|0x[0-9a-fA-F]+'
+    r'|(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{8,}'
+    r'|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    r')[,;.]?$'
+)
+
+HAS_DIGIT_RE = re.compile(r'\d')
+
+
+class LogCluster:
+    """One template and the number of messages it has absorbed"""
+    
+    __slots__ = ('cluster_id', 'tokens', 'size')
+    
+    def __init__(self, cluster_id: int, tokens: List[str], size: int = 0):
+        self.cluster_id = cluster_id
+        self.tokens = tokens
+        self.size = size
+    
+    @property
+    def template(self) -> str:
+        """Template text with parameters replaced by wildcards"""
+        return ' '.join(self.tokens)
+    
+    def similarity(self, tokens: List[str]) -> Tuple[float, int]:
+        """Share of positions matching exactly, and the wildcard count for tie-breaking"""
+        same = wildcards = 0
+        for template_token, token in zip(self.tokens, tokens):
+            if template_token == WILDCARD:
+                wildcards += 1
+            elif template_token == token:
+                same += 1
+        return same / len(tokens), wildcards
+
+
+class TemplateMiner:
+    """Incremental Drain template miner
+    
+    Messages are routed by token count and then by their first depth - 2
+    tokens (tokens containing digits route through a wildcard branch) to a
+    leaf of candidate clusters. The most similar candidate absorbs the
+    message when similarity reaches the threshold, turning differing tokens
+    into wildcards; otherwise the message starts a new cluster. Cluster IDs
+    are stable across runs because the clusters are persisted and the tree is
+    rebuilt from them on load.
+    
+    Cluster sizes count each logged message once: only rows newer than the
+    persisted timestamp_ns watermark add to them, and the newest minute of a
+    batch is left for the next run since it is still filling up. Every row
+    still gets its template ID. mine() changes nothing on disk; mine_and_save()
+    merges a live fetch into the latest persisted clusters under a lock.
+    """
+    
+    def __init__(self, depth: int = 4, similarity: float = 0.4, max_children: int = 100,
+                 max_clusters: int = 5000, state_name: Optional[str] = DEFAULT_STATE_NAME):
+        self.depth = depth
+        self.similarity_threshold = similarity
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.state_name = state_name
+        self.clusters: Dict[int, LogCluster] = {}
+        self.tree: Dict[Any, Any] = {}
+        self.next_id = 1
+        self.watermark_ns = 0
+        
+        # Masked token sequences already absorbed map straight to their cluster;
+        # merging identical tokens again would not change the template
+        self._seen: Dict[Tuple[str, ...], int] = {}
+        
+        if state_name:
+            self._load()
+    
+    def _load(self) -> None:
+        """Replace the clusters with the persisted state"""
+        self.clusters, self.tree, self._seen = {}, {}, {}
+        self.next_id, self.watermark_ns = 1, 0
+        state = state_store.load_json(self.state_name, default=None)
+        if state:
+            self.next_id = state['next_id']
+            self.watermark_ns = state.get('watermark_ns', 0)
+            for cluster_id, tokens, size in state['clusters']:
+                self._insert(LogCluster(cluster_id, tokens, size))
+    
+    @staticmethod
+    def tokenize(message: str) -> List[str]:
+        """Split a message into tokens, masking tokens that are always parameters"""
+        return [WILDCARD if PARAMETER_RE.match(token) else token for token in message.split()]
+    
+    def _leaf(self, tokens: List[str], create: bool) -> Optional[List[int]]:
+        """Walk the prefix tree to the leaf for tokens, optionally creating nodes"""
+        node = self.tree.get(len(tokens))
+        if node is None:
+            if not create:
+                return None
+            node = self.tree[len(tokens)] = {}
+        
+        route = tokens[:self.depth - 2]
+        for i, token in enumerate(route):
+            key = WILDCARD if HAS_DIGIT_RE.search(token) else token
+            if key not in node:
+                # Unknown tokens share the wildcard branch once a node is full
+                if not create or len(node) >= self.max_children:
+                    key = WILDCARD
+                if key not in node:
+                    if not create:
+                        return None
+                    node[key] = [] if i == len(route) - 1 else {}
+            node = node[key]
+        
+        if isinstance(node, dict):
+            # Messages shorter than the routing depth end at an inner node
+            node = node.setdefault('', [])
+        return node
+    
+    def _insert(self, cluster: LogCluster) -> None:
+        """Register a cluster and place it in the prefix tree"""
+        self.clusters[cluster.cluster_id] = cluster
+        self._leaf(cluster.tokens, create=True).append(cluster.cluster_id)
+    
+    def add_message(self, message: str, count: int = 1) -> int:
+        """Assign a message to a cluster, updating the template, and return the cluster ID"""
+        tokens = self.tokenize(message)
+        if not tokens:
+            tokens = ['']
+        
+        key = tuple(tokens)
+        cluster_id = self._seen.get(key)
+        if cluster_id is not None:
+            self.clusters[cluster_id].size += count
+            return cluster_id
+        
+        best: Optional[LogCluster] = None
+        best_score = (-1.0, -1)
+        for cluster_id in self._leaf(tokens, create=False) or []:
+            cluster = self.clusters[cluster_id]
+            score = cluster.similarity(tokens)
+            if score > best_score:
+                best, best_score = cluster, score
+        
+        if best is not None and best_score[0] >= self.similarity_threshold:
+            best.tokens = [t if t == m else WILDCARD for t, m in zip(best.tokens, tokens)]
+            best.size += count
+            self._seen[key] = best.cluster_id
+            return best.cluster_id
+        
+        cluster = LogCluster(self.next_id, tokens, count)
+        self.next_id += 1
+        self._insert(cluster)
+        self._seen[key] = cluster.cluster_id
+        return cluster.cluster_id
+    
+    def parameters(self, cluster_id: int, message: str) -> List[str]:
+        """Extract the values a message fills into its template's wildcards"""
+        template = self.clusters[cluster_id].tokens
+        return [token for token, slot in zip(message.split(), template) if slot == WILDCARD]
+    
+    def mine(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Add template_id and template_params columns to a frame with message and timestamp_ns columns"""
+        if df.is_empty():
+            return df.with_columns([
+                pl.lit(None, dtype=pl.Int32).alias('template_id'),
+                pl.lit(None, dtype=pl.List(pl.String)).alias('template_params'),
+            ])
+        
+        # Rows up to the watermark were counted by an earlier run
+        open_minute_ns = int(df['timestamp_ns'].max()) // NS_PER_MINUTE * NS_PER_MINUTE
+        unseen = (pl.col('timestamp_ns') > self.watermark_ns) & (pl.col('timestamp_ns') < open_minute_ns)
+        
+        # Each distinct message is clustered once, weighted by its unseen rows
+        counts = df.group_by('message', maintain_order=True).agg(unseen.sum().alias('_count'))
+        messages = counts['message'].to_list()
+        ids = [self.add_message(message, count) for message, count in zip(messages, counts['_count'].to_list())]
+        
+        # Parameters are read against the final templates of this batch
+        lookup = pl.DataFrame({
+            'message': messages,
+            'template_id': pl.Series(ids, dtype=pl.Int32),
+            'template_params': pl.Series(
+                [self.parameters(cluster_id, message) for cluster_id, message in zip(ids, messages)],
+                dtype=pl.List(pl.String)
+            ),
+        })
+        self.watermark_ns = max(self.watermark_ns, open_minute_ns - 1)
+        
+        # Joined on a row index since left joins need not keep row order
+        return df.with_row_index('_row').join(lookup, on='message', how='left').sort('_row').drop('_row')
+    
+    def mine_and_save(self, df: pl.DataFrame) -> pl.DataFrame:
+        """Mine a live fetch into the latest persisted clusters and save them
+        
+        Loaders run as separate processes over the same window; reloading
+        under the state lock keeps one process from overwriting another's
+        clusters, and the watermark keeps them from counting rows twice.
+        """
+        if not self.state_name:
+            return self.mine(df)
+        with state_store.locked(self.state_name):
+            self._load()
+            df = self.mine(df)
+            self.save()
+        return df
+    
+    def templates(self) -> Dict[int, str]:
+        """Template dictionary keyed by cluster ID"""
+        return {cluster_id: cluster.template for cluster_id, cluster in self.clusters.items()}
+    
+    def save(self) -> None:
+        """Persist the clusters, keeping the largest when over max_clusters"""
+        if not self.state_name:
+            return
+        
+        clusters = sorted(self.clusters.values(), key=lambda c: c.size, reverse=True)[:self.max_clusters]
+        state_store.save_json(self.state_name, {
+            'next_id': self.next_id,
+            'watermark_ns': self.watermark_ns,
+            'clusters': [[c.cluster_id, c.tokens, c.size] for c in clusters],
+        })
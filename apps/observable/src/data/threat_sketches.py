@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Hourly sketch windows over security events
+Tracks heavy-hitter source IPs, users and attack types plus distinct IPs and users without exact per-key counting
+"""
+
+import math
+from typing import Any, Dict, List, Optional
+import numpy as np
+import polars as pl
+
+import sketches
+import state_store
+
+
+DEFAULT_STATE_NAME = 'quickwit-threat-sketches.json'
+
+# Hourly windows older than this are dropped (roughly 30 KiB of state per window)
+RETENTION_HOURS = 48
+
+# Counters kept per Space-Saving summary
+TOP_K = 200
+
+NS_PER_MINUTE = 60 * 1_000_000_000
+NS_PER_HOUR = 60 * NS_PER_MINUTE
+
+
+class ThreatWindow:
+    """Sketches for one hour of security events"""
+    
+    def __init__(self):
+        self.source_ips = sketches.SpaceSaving(TOP_K)
+        self.users = sketches.SpaceSaving(TOP_K)
+        self.attack_types = sketches.SpaceSaving(TOP_K)
+        self.ip_frequency = sketches.CountMinSketch(width=1024, depth=4)
+        self.distinct_ips = sketches.HyperLogLog()
+        self.distinct_users = sketches.HyperLogLog()
+    
+    def merge(self, other: 'ThreatWindow') -> 'ThreatWindow':
+        """Merge another window into this one"""
+        self.source_ips.merge(other.source_ips)
+        self.users.merge(other.users)
+        self.attack_types.merge(other.attack_types)
+        self.ip_frequency.merge(other.ip_frequency)
+        self.distinct_ips.merge(other.distinct_ips)
+        self.distinct_users.merge(other.distinct_users)
+        return self
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize to a JSON-ready dictionary"""
+        return {name: sketch.to_dict() for name, sketch in vars(self).items()}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ThreatWindow':
+        """Deserialize a window written by to_dict"""
+        window = cls()
+        for name, sketch in vars(window).items():
+            setattr(window, name, type(sketch).from_dict(data[name]))
+        return window
+
+
+def _update_heavy_hitters(sketch: sketches.SpaceSaving, values: pl.Series) -> None:
+    """Feed the non-empty values of a batch into a Space-Saving summary"""
+    counts = values.filter(values != '').value_counts()
+    if counts.height:
+        sketch.add_counts(counts[:, 0].to_list(), counts[:, 1].to_list())
+
+
+def _distinct_hashes(values: pl.Series) -> np.ndarray:
+    """Hashes of the distinct non-empty values of a batch"""
+    return sketches.hash64(values.filter(values != '').unique().to_list())
+
+
+class ThreatSketches:
+    """Hourly threat sketch windows persisted and merged across loader runs
+    
+    Only events newer than the previous run's watermark are added, so
+    overlapping fetch windows do not double count. Events in the newest
+    row's minute are still arriving and are left for a later run, so the
+    watermark stops at the start of that open minute and late rows inside it
+    are still counted. Windows from other runs or shards combine with merge().
+    """
+    
+    def __init__(self, state_name: Optional[str] = DEFAULT_STATE_NAME):
+        self.state_name = state_name
+        self.watermark_ns = 0
+        self.windows: Dict[int, ThreatWindow] = {}
+        
+        state = state_store.load_json(state_name, default=None) if state_name else None
+        if state:
+            self.watermark_ns = state['watermark_ns']
+            self.windows = {int(hour): ThreatWindow.from_dict(data) for hour, data in state['windows'].items()}
+    
+    def update(self, df: pl.DataFrame) -> int:
+        """Add unseen events from a frame with source_ip, user_id and attack_type columns"""
+        if df.is_empty():
+            return 0
+        open_minute_ns = int(df['timestamp_ns'].max()) // NS_PER_MINUTE * NS_PER_MINUTE
+        new = df.filter((pl.col('timestamp_ns') > self.watermark_ns) & (pl.col('timestamp_ns') < open_minute_ns))
+        if new.is_empty():
+            return 0
+        
+        columns = [pl.col(name).cast(pl.String).fill_null('') for name in ('source_ip', 'user_id', 'attack_type')]
+        new = new.select([(pl.col('timestamp_ns') // NS_PER_HOUR).alias('hour')] + columns)
+        
+        for hour, batch in new.partition_by('hour', as_dict=True).items():
+            hour = hour[0] if isinstance(hour, tuple) else hour
+            window = self.windows.setdefault(hour, ThreatWindow())
+            
+            _update_heavy_hitters(window.source_ips, batch['source_ip'])
+            _update_heavy_hitters(window.users, batch['user_id'])
+            _update_heavy_hitters(window.attack_types, batch['attack_type'])
+            
+            ips = batch['source_ip'].filter(batch['source_ip'] != '')
+            window.ip_frequency.add(sketches.hash64(ips.to_list()))
+            window.distinct_ips.add(_distinct_hashes(batch['source_ip']))
+            window.distinct_users.add(_distinct_hashes(batch['user_id']))
+        
+        self.watermark_ns = max(self.watermark_ns, open_minute_ns - 1)
+        
+        # Drop windows past retention
+        newest = max(self.windows)
+        self.windows = {hour: w for hour, w in self.windows.items() if hour > newest - RETENTION_HOURS}
+        return new.height
+    
+    def merge(self, other: 'ThreatSketches') -> 'ThreatSketches':
+        """Merge windows from another run or shard"""
+        for hour, window in other.windows.items():
+            if hour in self.windows:
+                self.windows[hour].merge(window)
+            else:
+                self.windows[hour] = ThreatWindow.from_dict(window.to_dict())
+        self.watermark_ns = max(self.watermark_ns, other.watermark_ns)
+        return self
+    
+    def combined(self, hours: int = 24) -> ThreatWindow:
+        """Merge the windows of the most recent hours"""
+        result = ThreatWindow()
+        if self.windows:
+            newest = max(self.windows)
+            for hour, window in self.windows.items():
+                if hour > newest - hours:
+                    result.merge(window)
+        return result
+    
+    def ip_counts(self, ips: List[str], hours: int = 24) -> List[int]:
+        """Estimated event counts per source IP over the most recent hours"""
+        return self.combined(hours).ip_frequency.estimate(sketches.hash64(ips)).tolist()
+    
+    def summary(self, hours: int = 24, top: int = 10) -> Dict[str, Any]:
+        """Heavy hitters and distinct counts over the most recent hours, with error bounds"""
+        window = self.combined(hours)
+        
+        def heavy_hitters(sketch: sketches.SpaceSaving, key: str) -> List[Dict[str, Any]]:
+            return [
+                {key: entry['item'], 'count': entry['count'], 'error': entry['error'], 'guaranteed': entry['guaranteed']}
+                for entry in sketch.top(top)
+            ]
+        
+        return {
+            'window_hours': hours,
+            'source_ip_events': window.source_ips.total,
+            'distinct_ips': round(window.distinct_ips.estimate()),
+            'distinct_users': round(window.distinct_users.estimate()),
+            'threat_sources': heavy_hitters(window.source_ips, 'ip'),
+            'top_users': heavy_hitters(window.users, 'user'),
+            'attack_types': heavy_hitters(window.attack_types, 'type'),
+            'error_bounds': {
+                'distinct_relative_error': round(window.distinct_ips.relative_error, 4),
+                'heavy_hitter_max_error': window.source_ips.total // TOP_K,
+                'ip_frequency_max_overcount': round(math.e / window.ip_frequency.width * window.ip_frequency.total),
+                'ip_frequency_confidence': round(1 - math.exp(-window.ip_frequency.depth), 4)
+            }
+        }
+    
+    def save(self) -> None:
+        """Persist the windows for the next run"""
+        if not self.state_name:
+            return
+        state_store.save_json(self.state_name, {
+            'watermark_ns': self.watermark_ns,
+            'windows': {str(hour): window.to_dict() for hour, window in self.windows.items()}
+        })
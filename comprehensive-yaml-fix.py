@@ -2,163 +2,526 @@
 """
 Comprehensive YAML Lint Fixer
 Fixes common YAML lint issues identified in GitHub Actions
+
+All fixes are applied in a single streaming pass driven by a line tokenizer
+that tracks block scalars, flow collections and multi-line scalars across
+documents, so only structural lines are ever edited. Files are processed in a
+process pool and a content-hash cache skips files that were clean on the last
+run, so large manifest trees only pay for what changed.
+
+Run with --golden yaml-fix-golden to check the fixer against its golden corpus.
 """
 
+import argparse
+import difflib
+import hashlib
+import json
 import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def fix_syntax_errors(content):
-    """Fix common YAML syntax errors"""
-    lines = content.split('\n')
-    fixed_lines = []
-    
-    for i, line in enumerate(lines):
-        # Fix missing colons after keys
-        if re.match(r'^(\s*)[a-zA-Z][a-zA-Z0-9_-]*\s*$', line):
-            # Check if next line is indented more (suggesting this should have a colon)
-            if i + 1 < len(lines) and lines[i + 1].strip():
-                next_indent = len(lines[i + 1]) - len(lines[i + 1].lstrip())
-                curr_indent = len(line) - len(line.lstrip())
-                if next_indent > curr_indent:
-                    line = line.rstrip() + ':'
-        
-        fixed_lines.append(line)
-    
-    return '\n'.join(fixed_lines)
-
-def fix_indentation(content):
-    """Fix YAML indentation issues"""
-    lines = content.split('\n')
-    fixed_lines = []
-    
-    for i, line in enumerate(lines):
-        if not line.strip():
-            fixed_lines.append(line)
-            continue
-            
-        # Fix document separators at root level
-        if line.strip() in ['---', '...']:
-            fixed_lines.append(line.strip())
-            continue
-            
-        # Get current indentation
-        indent = len(line) - len(line.lstrip())
-        content_line = line.lstrip()
-        
-        # Fix common indentation patterns
-        if content_line.startswith('- '):
-            # List items should maintain consistent indentation
-            if indent % 2 != 0:
-                indent = (indent // 2) * 2
-            fixed_lines.append(' ' * indent + content_line)
-        elif ':' in content_line and not content_line.startswith('#'):
-            # Key-value pairs
-            if indent % 2 != 0:
-                indent = (indent // 2) * 2
-            fixed_lines.append(' ' * indent + content_line)
-        else:
-            # Other lines
-            if indent % 2 != 0:
-                indent = (indent // 2) * 2
-            fixed_lines.append(' ' * indent + content_line)
-    
-    return '\n'.join(fixed_lines)
-
-def fix_line_length(content, max_length=120):
-    """Fix overly long lines by breaking them appropriately"""
-    lines = content.split('\n')
-    fixed_lines = []
-    
-    for line in lines:
-        if len(line) <= max_length:
-            fixed_lines.append(line)
-            continue
-            
-        # Don't break lines that are comments or URLs
-        if line.strip().startswith('#') or 'http' in line:
-            fixed_lines.append(line)
-            continue
-            
-        # Try to break long lines at logical points
-        indent = len(line) - len(line.lstrip())
-        content_part = line.lstrip()
-        
-        # If it's a long string value, keep it as is (often better than breaking)
-        if '"' in content_part or "'" in content_part:
-            fixed_lines.append(line)
-            continue
-            
-        # For very long lines that are lists or complex structures
-        if len(line) > max_length + 20:  # Only break very long lines
-            # This is complex to do safely, so we'll leave it for manual review
-            fixed_lines.append(line)
+# Bump when the fix rules change so stale cache entries are ignored
+FIXER_VERSION = 3
+CACHE_FILE = '.yaml-fix-cache.json'
+
+# Below this many files the process pool costs more than it saves
+PARALLEL_THRESHOLD = 32
+
+BARE_KEY_RE = re.compile(r'^(\s*)[a-zA-Z][a-zA-Z0-9_-]*\s*$')
+SEQUENCE_PREFIX_RE = re.compile(r'^(?:-(?:\s+|$))*')
+BLOCK_INDICATOR_RE = re.compile(r'(?:^|\s)(?:[&!]\S*\s+)*[|>](?P<digits>[1-9]?)[+-]?(?P<trailing_digits>[1-9]?)$')
+DOCUMENT_MARKER_RE = re.compile(r'^(?:---|\.\.\.)(?:\s|$)')
+
+# Line kinds produced by YamlLineTokenizer
+STRUCTURAL = 'structural'
+BLANK = 'blank'
+COMMENT = 'comment'
+DOCUMENT = 'document'
+BLOCK_SCALAR = 'block_scalar'
+FLOW = 'flow'
+QUOTED = 'quoted'
+PLAIN = 'plain'
+
+# Node indicators after which a quote or flow collection may start
+NODE_START = (None, ':', '-', '?', ',', '[', '{')
+
+
+def content_hash(content):
+    """Hash file content for the clean-file cache"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _indent_of(line):
+    return len(line) - len(line.lstrip())
+
+
+def scan_line(text, quote=None, depth=0):
+    """Scan one line of YAML for quote, flow and comment context
+
+    quote and depth carry an unterminated quoted scalar and open flow
+    collections over from previous lines. Returns (code, quote, depth,
+    mapping_pos) where code is the text with any trailing comment removed and
+    mapping_pos is the offset of the first block mapping indicator, or -1.
+    """
+    prev = None
+    mapping_pos = -1
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i]
+        if quote == '"':
+            if c == '\\':
+                i += 1
+            elif c == '"':
+                quote = None
+                prev = c
+        elif quote == "'":
+            if c == "'":
+                if i + 1 < n and text[i + 1] == "'":
+                    i += 1
+                else:
+                    quote = None
+                    prev = c
+        elif c == '#' and (i == 0 or text[i - 1] in ' \t'):
+            return text[:i], quote, depth, mapping_pos
+        elif c in '"\'' and prev in NODE_START:
+            quote = c
+        elif c in '[{' and prev in NODE_START:
+            depth += 1
+            prev = c
+        elif c in ']}' and depth:
+            depth -= 1
+            prev = c
+        elif c == ':' and (i + 1 == n or text[i + 1] in ' \t') and (depth or prev is not None):
+            if not depth and mapping_pos < 0:
+                mapping_pos = i
+            prev = c
+        elif c == ',' and depth:
+            prev = c
+        elif c in '-?' and prev in NODE_START and (i + 1 == n or text[i + 1] in ' \t'):
+            prev = c
+        elif c not in ' \t':
+            prev = 'x'
+        i += 1
+    return text, quote, depth, mapping_pos
+
+
+class YamlLineTokenizer:
+    """Streaming classifier for YAML lines
+
+    Tracks block scalars, multi-line flow collections, quoted and plain
+    scalars across lines and resets at document markers, so that fixes are
+    only applied to lines that carry YAML structure. All positions are
+    measured on the original input.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset state at a document boundary"""
+        self.block_parent = None
+        self.block_indent = None
+        self.plain_parent = None
+        self.quote = None
+        self.depth = 0
+        # Whether the last structural line can own more indented children
+        self.opens_node = True
+        # Whether the last structural line starts a sequence item
+        self.sequence_item = False
+        # Column its children must sit at, when fixed by an inline mapping
+        self.child_col = None
+
+    def classify(self, line):
+        """Return the kind of the given line and advance the tokenizer"""
+        stripped = line.strip()
+        indent = _indent_of(line)
+
+        if self.block_parent is not None:
+            if not stripped:
+                return BLOCK_SCALAR
+            if DOCUMENT_MARKER_RE.match(line):
+                self.block_parent = None
+            elif self.block_indent is None and indent > self.block_parent:
+                self.block_indent = indent
+                return BLOCK_SCALAR
+            elif self.block_indent is not None and indent >= self.block_indent:
+                return BLOCK_SCALAR
+            else:
+                self.block_parent = None
+
+        if self.quote or self.depth:
+            kind = QUOTED if self.quote else FLOW
+            _, self.quote, self.depth, _ = scan_line(line, self.quote, self.depth)
+            return kind
+
+        if not stripped:
+            return BLANK
+
+        if stripped in ('---', '...') or DOCUMENT_MARKER_RE.match(line):
+            self.reset()
+            if stripped.startswith('---'):
+                self._check_block_start(stripped[3:], -1)
+            return DOCUMENT
+
+        if stripped.startswith('#'):
+            self.plain_parent = None
+            return COMMENT
+
+        content = line[indent:]
+        code, quote, depth, mapping_pos = scan_line(content)
+
+        if self.plain_parent is not None:
+            # Lines holding a mapping or starting a sequence item are taken
+            # as mis-indented structure rather than scalar continuation
+            if indent > self.plain_parent and mapping_pos < 0 and not SEQUENCE_PREFIX_RE.match(content).end():
+                return PLAIN
+            self.plain_parent = None
+
+        self.quote, self.depth = quote, depth
+        self.opens_node = False
+        self.sequence_item = False
+        self.child_col = None
+        if self.quote or self.depth:
+            return STRUCTURAL
+
+        # Column of the node on this line, after any sequence indicators
+        dashes = SEQUENCE_PREFIX_RE.match(content).end()
+        self.sequence_item = bool(dashes)
+        node_col = indent + dashes
+        if mapping_pos >= 0:
+            value = code[mapping_pos + 1:].strip()
         else:
-            fixed_lines.append(line)
-    
-    return '\n'.join(fixed_lines)
+            value = code[dashes:].strip()
+            # A scalar sequence item belongs to the column of its last dash
+            node_col = indent + content.rstrip()[:dashes].rstrip().rfind('-') if dashes else None
+
+        if self._check_block_start(code, node_col if node_col is not None else indent):
+            return STRUCTURAL
+
+        if node_col is None or not value or dashes and mapping_pos < 0 and value[0] in '&!':
+            self.opens_node = True
+        elif mapping_pos >= 0 and value[0] in '&!' and ' ' not in value:
+            self.opens_node = True
+        elif dashes and mapping_pos >= 0:
+            # "- key: value" still owns the rest of the item's mapping
+            self.opens_node = True
+            self.child_col = node_col
+
+        if node_col is not None and value and value[0] not in '"\'[{&!*|>':
+            self.plain_parent = node_col
+        return STRUCTURAL
+
+    def _check_block_start(self, code, parent_col):
+        match = BLOCK_INDICATOR_RE.search(code.rstrip())
+        if not match:
+            return False
+
+        prefix = code[:match.start()].strip()
+        if prefix and not prefix.endswith(':') and SEQUENCE_PREFIX_RE.match(prefix).end() != len(prefix):
+            return False
+
+        self.block_parent = parent_col
+        digits = match.group('digits') or match.group('trailing_digits')
+        self.block_indent = parent_col + int(digits) if digits else None
+        self.plain_parent = None
+        return True
+
+
+class YamlFixer:
+    """Applies structural fixes to a stream of YAML lines"""
+
+    def __init__(self):
+        self.tokenizer = YamlLineTokenizer()
+        # [original indent, fixed indent, opens node, child column,
+        # has children] of the enclosing structural lines
+        self.indent_stack = []
+
+    def fix_line(self, line, next_line=None):
+        """Fix a single line; next_line is the raw line that follows"""
+        kind = self.tokenizer.classify(line)
+
+        if kind == BLANK:
+            return ''
+        if kind == DOCUMENT:
+            self.indent_stack = []
+            return line.strip()
+        if kind == BLOCK_SCALAR:
+            # Block scalar content is kept verbatim, trailing spaces included
+            return line
+        if kind not in (STRUCTURAL, COMMENT):
+            # Flow and multi-line scalar content is never re-indented
+            return line.rstrip()
+
+        indent = _indent_of(line)
+        content = line.lstrip().rstrip()
+
+        if kind == COMMENT:
+            return ' ' * (indent - indent % 2) + content
+
+        # Fix missing colons after keys followed by a more indented line
+        if next_line and next_line.strip() and BARE_KEY_RE.match(line):
+            if _indent_of(next_line) > indent:
+                content += ':'
+
+        return ' ' * self._fixed_indent(indent) + content
+
+    def _fixed_indent(self, indent):
+        """Round odd indentation down unless that would change nesting"""
+        stack = self.indent_stack
+        while stack and stack[-1][0] > indent:
+            stack.pop()
+
+        tokenizer = self.tokenizer
+        entry = [indent, indent, tokenizer.opens_node, tokenizer.child_col, False]
+
+        if stack and stack[-1][0] == indent:
+            entry[1] = stack[-1][1]
+            stack[-1] = entry
+            return entry[1]
+
+        fixed = indent
+        if stack:
+            parent = stack[-1]
+            owns = parent[2] and not parent[4] and parent[3] in (None, indent)
+            if indent % 2 != 0 and tokenizer.sequence_item and indent - 1 == parent[1] and parent[2]:
+                # Sequences may sit at the same indent as their parent key
+                fixed = indent - 1
+            elif indent % 2 != 0 and indent - 1 <= parent[1]:
+                # Only an open node without children elsewhere can own this
+                # line; otherwise it is a mis-indented sibling
+                fixed = indent if owns else parent[1]
+            elif indent % 2 != 0:
+                fixed = indent - 1
+            parent[4] = True
+        elif indent % 2 != 0:
+            fixed = indent - 1
+        entry[1] = fixed
+        stack.append(entry)
+        return fixed
+
 
-def fix_yaml_file(filepath):
-    """Fix a single YAML file"""
+def fix_lines(lines):
+    """Fix an iterable of YAML lines in a single streaming pass"""
+    fixer = YamlFixer()
+    lines = iter(lines)
+    line = next(lines, None)
+    while line is not None:
+        next_line = next(lines, None)
+        yield fixer.fix_line(line, next_line)
+        line = next_line
+
+
+def fix_content(content):
+    """Fix YAML content in one pass over its lines"""
+    content = '\n'.join(fix_lines(content.split('\n')))
+
+    # Ensure file ends with newline
+    if content and not content.endswith('\n'):
+        content += '\n'
+
+    return content
+
+
+def fix_yaml_file(filepath, check=False):
+    """Fix a single YAML file
+
+    Returns a (filepath, status, clean_hash, error) tuple where status is one
+    of 'fixed', 'drift', 'clean' or 'error'. clean_hash is the hash of the
+    file content once it is known to be clean, or None.
+    """
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        original_content = content
-        
-        # Apply fixes
-        content = fix_syntax_errors(content)
-        content = fix_indentation(content)
-        content = fix_line_length(content)
-        
-        # Remove trailing whitespace
-        lines = content.split('\n')
-        lines = [line.rstrip() for line in lines]
-        content = '\n'.join(lines)
-        
-        # Ensure file ends with newline
-        if content and not content.endswith('\n'):
-            content += '\n'
-        
-        # Only write if changed
-        if content != original_content:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            print(f"Fixed: {filepath}")
-            return True
-        else:
-            print(f"No changes: {filepath}")
-            return False
-            
+            original_content = f.read()
+
+        content = fix_content(original_content)
+
+        if content == original_content:
+            return filepath, 'clean', content_hash(content), None
+
+        if check:
+            return filepath, 'drift', None, None
+
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return filepath, 'fixed', content_hash(content), None
+
     except Exception as e:
-        print(f"Error processing {filepath}: {e}")
-        return False
+        return filepath, 'error', None, str(e)
+
+
+def verify_golden(golden_dir):
+    """Check the fixer against *.input / *.expected pairs
+
+    Each input must fix to its expected file, and expected files must be left
+    unchanged. Returns the number of failing cases.
+    """
+    failures = 0
+    inputs = sorted(Path(golden_dir).glob('*.input'))
+    for input_path in inputs:
+        expected_path = input_path.with_suffix('.expected')
+        source = input_path.read_text(encoding='utf-8')
+        expected = expected_path.read_text(encoding='utf-8')
+
+        for label, actual in (('fix', fix_content(source)), ('idempotence', fix_content(expected))):
+            if actual == expected:
+                continue
+            failures += 1
+            print(f"FAIL ({label}): {input_path.stem}")
+            sys.stdout.writelines(difflib.unified_diff(
+                expected.splitlines(keepends=True), actual.splitlines(keepends=True),
+                fromfile=str(expected_path), tofile=f"{label}({input_path.name})"))
+            break
+        else:
+            print(f"ok: {input_path.stem}")
+
+    print(f"\nGolden corpus: {len(inputs) - failures} of {len(inputs)} cases passed")
+    return failures
+
+
+def _fix_yaml_file_worker(args):
+    return fix_yaml_file(*args)
+
+
+def load_cache(path):
+    """Load the clean-file cache, ignoring it if unreadable or outdated"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if data.get('version') != FIXER_VERSION:
+        return {}
+    return data.get('files', {})
 
-def main():
+
+def save_cache(path, files):
+    """Persist the clean-file cache"""
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': FIXER_VERSION, 'files': files}, f, indent=0, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Warning: could not write cache {path}: {e}", file=sys.stderr)
+
+
+def find_yaml_files(roots):
+    """Collect YAML files under the given directories"""
+    yaml_files = set()
+    for root in roots:
+        root = Path(root)
+        if root.is_file():
+            yaml_files.add(root)
+            continue
+        yaml_files.update(root.glob('**/*.yaml'))
+        yaml_files.update(root.glob('**/*.yml'))
+    return sorted(yaml_files)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fix common YAML lint issues')
+    parser.add_argument('paths', nargs='*', default=['apps'],
+                        help='Directories or files to process (default: apps)')
+    parser.add_argument('--check', action='store_true',
+                        help='Do not modify files; exit non-zero if any file needs fixing')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of worker processes (default: CPU count)')
+    parser.add_argument('--cache', default=CACHE_FILE,
+                        help=f'Clean-file cache location (default: {CACHE_FILE})')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Process every file, ignoring the clean-file cache')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Only report files that changed or failed')
+    parser.add_argument('--golden', metavar='DIR',
+                        help='Verify the fixer against a golden corpus and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """Main function"""
-    apps_dir = Path('apps')
-    if not apps_dir.exists():
-        print("Error: apps/ directory not found")
+    args = parse_args(argv)
+
+    if args.golden:
+        sys.exit(1 if verify_golden(args.golden) else 0)
+
+    missing = [p for p in args.paths if not Path(p).exists()]
+    if missing:
+        print(f"Error: {', '.join(missing)} not found")
         sys.exit(1)
-    
+
     print("Comprehensive YAML Fixer")
     print("========================")
-    
-    yaml_files = list(apps_dir.glob('**/*.yaml')) + list(apps_dir.glob('**/*.yml'))
-    
+
+    yaml_files = find_yaml_files(args.paths)
+
     if not yaml_files:
-        print("No YAML files found in apps/ directory")
+        print(f"No YAML files found in {', '.join(args.paths)}")
         sys.exit(1)
-    
+
     print(f"Found {len(yaml_files)} YAML files")
-    
-    fixed_count = 0
-    for yaml_file in sorted(yaml_files):
-        if fix_yaml_file(yaml_file):
-            fixed_count += 1
-    
-    print(f"\nSummary: Fixed {fixed_count} out of {len(yaml_files)} files")
+
+    cache = {} if args.no_cache else load_cache(args.cache)
+
+    # Skip files whose content is unchanged since they were last seen clean
+    pending = []
+    skipped = 0
+    for yaml_file in yaml_files:
+        key = str(yaml_file)
+        cached_hash = cache.get(key)
+        if cached_hash is not None:
+            try:
+                if content_hash(yaml_file.read_text(encoding='utf-8')) == cached_hash:
+                    skipped += 1
+                    continue
+            except (OSError, UnicodeDecodeError):
+                pass
+        pending.append((key, args.check))
+
+    jobs = max(1, args.jobs)
+    if jobs > 1 and len(pending) >= PARALLEL_THRESHOLD:
+        chunksize = max(1, len(pending) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(_fix_yaml_file_worker, pending, chunksize=chunksize))
+    else:
+        results = [fix_yaml_file(*item) for item in pending]
+
+    counts = {'fixed': 0, 'drift': 0, 'clean': 0, 'error': 0}
+    for filepath, status, clean_hash, error in results:
+        counts[status] += 1
+        if clean_hash is not None:
+            cache[filepath] = clean_hash
+        else:
+            cache.pop(filepath, None)
+
+        if status == 'fixed':
+            print(f"Fixed: {filepath}")
+        elif status == 'drift':
+            print(f"Needs fixing: {filepath}")
+        elif status == 'error':
+            print(f"Error processing {filepath}: {error}")
+        elif not args.quiet:
+            print(f"No changes: {filepath}")
+
+    # --check only reads the cache; it never leaves files behind
+    if not args.no_cache and not args.check:
+        # Drop entries for files that no longer exist
+        cache = {k: v for k, v in cache.items() if os.path.exists(k)}
+        save_cache(args.cache, cache)
+
+    if skipped:
+        print(f"\nSkipped {skipped} unchanged files (cached clean)")
+
+    if args.check:
+        print(f"\nSummary: {counts['drift']} out of {len(yaml_files)} files need fixing")
+        if counts['drift'] or counts['error']:
+            sys.exit(1)
+    else:
+        print(f"\nSummary: Fixed {counts['fixed']} out of {len(yaml_files)} files")
+
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
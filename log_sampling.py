@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Stratified reservoir sampling for the standalone data loaders
+Keeps a fixed-size display sample per severity and service without sorting every log
+"""
+
+import os
+import sys
+import heapq
+import random
+from collections import Counter
+
+# allocate() and window_seed() are shared with the dashboard loaders; sample_budget.py needs only the standard library
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'apps', 'observable', 'src', 'data'))
+
+from sample_budget import allocate, window_seed
+
+
+class StratifiedReservoir:
+    """Single-pass reservoir per stratum with exact counts
+    
+    Each log gets a random key and every stratum keeps the size logs with the
+    smallest keys in a bounded heap. Priority strata (errors) fill the sample
+    first, the rest share what is left proportionally.
+    """
+    
+    def __init__(self, size=50, seed=None):
+        self.size = size
+        self.rng = random.Random(seed)
+        self.counts = Counter()
+        self.reservoirs = {}
+        self._sequence = 0
+    
+    def add(self, log, stratum, priority=False):
+        """Offer one log to the reservoir of its stratum"""
+        key = (bool(priority), stratum)
+        self.counts[key] += 1
+        self._sequence += 1
+        
+        # Max-heap on the random key via negation; the sequence number breaks ties
+        entry = (-self.rng.random(), self._sequence, log)
+        heap = self.reservoirs.setdefault(key, [])
+        if len(heap) < self.size:
+            heapq.heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heapq.heapreplace(heap, entry)
+    
+    def sample(self, sort_key=None):
+        """Fixed-size sample, newest first when sort_key is given"""
+        keys = sorted(self.reservoirs, key=repr)
+        priority = [k for k in keys if k[0]]
+        regular = [k for k in keys if not k[0]]
+        
+        priority_alloc = allocate([len(self.reservoirs[k]) for k in priority], self.size)
+        regular_alloc = allocate([len(self.reservoirs[k]) for k in regular], self.size - sum(priority_alloc))
+        
+        sample = []
+        for key, n in zip(priority + regular, priority_alloc + regular_alloc):
+            sample.extend(log for _, _, log in heapq.nlargest(n, self.reservoirs[key]))
+        
+        if sort_key is not None:
+            sample.sort(key=sort_key, reverse=True)
+        return sample
+
+
+def newest(logs, n, key):
+    """The n newest logs without sorting all of them"""
+    return heapq.nlargest(n, logs, key=key)
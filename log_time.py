@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Timestamp bucketing for the standalone data loaders
+Keeps integer nanosecond timestamps and derives hour/date buckets with integer arithmetic in an explicit timezone
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_HOUR = 3600 * NS_PER_SECOND
+NS_PER_DAY = 24 * NS_PER_HOUR
+
+# UTC offsets only change on quarter-hour boundaries
+NS_PER_QUARTER = 900 * NS_PER_SECOND
+
+# IANA zone for buckets and display strings, the host's local time when unset
+LOG_TIMEZONE = os.getenv('LOG_TIMEZONE', '')
+
+HOUR_LABELS = tuple(f"{hour:02d}:00" for hour in range(24))
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TimeBuckets:
+    """Local hour and day buckets for nanosecond timestamps
+    
+    The UTC offset is looked up once per quarter hour and cached, so
+    bucketing a log line is an integer addition and division. Strings are
+    only formatted by display_fields() for the rows that are shown.
+    """
+    
+    def __init__(self, tz_name=LOG_TIMEZONE):
+        self.tz = ZoneInfo(tz_name) if tz_name else None
+        self._offsets = {}
+        self._dates = {}
+    
+    def offset_ns(self, timestamp_ns):
+        """UTC offset in effect at a timestamp"""
+        quarter = timestamp_ns // NS_PER_QUARTER
+        offset = self._offsets.get(quarter)
+        if offset is None:
+            moment = datetime.fromtimestamp(quarter * 900, self.tz or timezone.utc)
+            if self.tz is None:
+                moment = moment.astimezone()
+            offset = self._offsets[quarter] = int(moment.utcoffset().total_seconds()) * NS_PER_SECOND
+        return offset
+    
+    def local_ns(self, timestamp_ns):
+        """Nanoseconds since the epoch on the local wall clock"""
+        return timestamp_ns + self.offset_ns(timestamp_ns)
+    
+    def hour(self, timestamp_ns):
+        """Local hour of day, 0-23"""
+        return self.local_ns(timestamp_ns) // NS_PER_HOUR % 24
+    
+    def day(self, timestamp_ns):
+        """Local days since the epoch"""
+        return self.local_ns(timestamp_ns) // NS_PER_DAY
+    
+    def date_label(self, day):
+        """YYYY-MM-DD for a local day number"""
+        label = self._dates.get(day)
+        if label is None:
+            label = self._dates[day] = (EPOCH + timedelta(days=day)).strftime('%Y-%m-%d')
+        return label
+    
+    def isoformat(self, timestamp_ns):
+        """Local wall-clock ISO timestamp without offset, as the dashboards expect"""
+        return (EPOCH + timedelta(microseconds=self.local_ns(timestamp_ns) // 1000)).isoformat()
+    
+    def display_fields(self, log):
+        """Add the formatted timestamp, time, hour and date fields to a display row"""
+        timestamp_ns = log['timestamp_ns']
+        timestamp = self.isoformat(timestamp_ns)
+        log.update({
+            'timestamp': timestamp,
+            'time': timestamp,
+            'hour': HOUR_LABELS[self.hour(timestamp_ns)],
+            'date': self.date_label(self.day(timestamp_ns))
+        })
+        return log
@@ -4,12 +4,43 @@ Loki Data Loader for Observable Framework
 Fetches operational logs from Loki API and outputs JSON for dashboards
 """
 
+import heapq
 import json
 import urllib.request
 import urllib.parse
 from datetime import datetime, timedelta
 import sys
 
+import log_sampling
+import log_time
+import loki_plan
+
+def decode_json_lines(lines):
+    """Decoded objects of JSON log lines, None for the other lines
+    
+    Lines that look like JSON objects are decoded together by one json.loads
+    call over a JSON array; a batch with an invalid line falls back to
+    decoding line by line.
+    """
+    candidates = [i for i, line in enumerate(lines) if line.lstrip()[:1] == '{']
+    try:
+        values = json.loads('[' + ','.join(lines[i] for i in candidates) + ']')
+        if len(values) != len(candidates):
+            raise ValueError('line count changed')
+    except ValueError:
+        values = []
+        for i in candidates:
+            try:
+                values.append(json.loads(lines[i]))
+            except ValueError:
+                values.append(None)
+    
+    decoded = [None] * len(lines)
+    for i, value in zip(candidates, values):
+        if isinstance(value, dict):
+            decoded[i] = value
+    return decoded
+
 def fetch_loki_logs():
     """Fetch operational logs from Loki API"""
     loki_endpoint = "http://192.168.122.27:3100"
@@ -18,60 +49,69 @@ def fetch_loki_logs():
     end_time = datetime.now()
     start_time = end_time - timedelta(hours=2)
     
-    params = {
-        'query': '{job=~".+"}',
-        'start': str(int(start_time.timestamp() * 1e9)),
-        'end': str(int(end_time.timestamp() * 1e9)),
-        'limit': '100'
-    }
+    start_ns = int(start_time.timestamp() * 1e9)
+    end_ns = int(end_time.timestamp() * 1e9)
+    limit = 100
     
-    url = f"{loki_endpoint}/loki/api/v1/query_range?{urllib.parse.urlencode(params)}"
+    def get(path, params):
+        url = f"{loki_endpoint}{path}?{urllib.parse.urlencode(params)}"
+        with urllib.request.urlopen(url) as response:
+            return json.loads(response.read().decode())
     
     try:
-        with urllib.request.urlopen(url) as response:
-            data = json.loads(response.read().decode())
+        # Narrow per-service selectors from the streams active in the window
+        streams = get('/loki/api/v1/series', {'match[]': loki_plan.STREAM_SELECTOR, 'start': start_ns, 'end': end_ns})
+        queries = loki_plan.plan(streams.get('data') or [])
+    except Exception as e:
+        print(f"Loki series lookup failed, querying all streams: {e}", file=sys.stderr)
+        queries = [loki_plan.STREAM_SELECTOR]
+    
+    data = {'data': {'result': []}}
+    try:
+        for query in queries:
+            params = {'query': query, 'start': str(start_ns), 'end': str(end_ns), 'limit': str(limit)}
+            data['data']['result'].extend(get('/loki/api/v1/query_range', params).get('data', {}).get('result', []))
     except Exception as e:
         print(f"Error fetching from Loki: {e}", file=sys.stderr)
         return []
     
+    # Each query returns its newest lines; keep the newest overall
+    results = data['data']['result']
+    newest = heapq.nlargest(limit, ((int(value[0]), i, j) for i, stream in enumerate(results)
+                                    for j, value in enumerate(stream.get('values', []))))
+    kept = {(i, j) for _, i, j in newest}
+    for i, stream in enumerate(results):
+        stream['values'] = [value for j, value in enumerate(stream.get('values', [])) if (i, j) in kept]
+    
     # Process logs for Observable Framework
     logs = []
+    buckets = log_time.TimeBuckets()
+    # Display sample per level and service; errors are always kept
+    reservoir = log_sampling.StratifiedReservoir(size=50, seed=log_sampling.window_seed(start_ns, end_ns))
     if 'data' in data and 'result' in data['data']:
         for stream in data['data']['result']:
             stream_labels = stream.get('stream', {})
             service_name = stream_labels.get('service_name', 'unknown')
             
-            for entry in stream.get('values', []):
-                timestamp_ns, log_line = entry
-                timestamp = datetime.fromtimestamp(int(timestamp_ns) / 1e9)
-                
-                # Parse JSON log if possible
-                try:
-                    log_data = json.loads(log_line)
-                    if isinstance(log_data, dict):
-                        log_entry = log_data.copy()
-                    else:
-                        log_entry = {'message': str(log_data)}
-                except:
-                    log_entry = {'message': log_line}
+            values = stream.get('values', [])
+            
+            # JSON lines of the stream are decoded in one pass; other lines stay text
+            bodies = decode_json_lines([log_line for _, log_line in values])
+            for (timestamp_ns, log_line), body in zip(values, bodies):
+                log_entry = body if body is not None else {'message': log_line}
                 
-                # Add metadata
+                # Add metadata; display strings are formatted only for the sampled rows
                 log_entry.update({
-                    'timestamp': timestamp.isoformat(),
-                    'time': timestamp.isoformat(),
-                    'service_name': service_name,
-                    'hour': timestamp.strftime('%H:00'),
-                    'date': timestamp.strftime('%Y-%m-%d'),
-                    'level': log_entry.get('severity', 'INFO').upper(),
+                    'timestamp_ns': int(timestamp_ns),
+                    'service_name': service_name if 'service_name' in stream_labels else log_entry.get('service_name') or service_name,
+                    'level': str(log_entry.get('severity') or log_entry.get('level') or 'INFO').upper(),
                     'category': log_entry.get('attributes', {}).get('category', 'general'),
                     'log_type': log_entry.get('attributes', {}).get('log_type', 'operational'),
                     'is_demo': '[DEMO]' in log_entry.get('message', '') or log_entry.get('attributes', {}).get('demo_data') == 'true'
                 })
                 
                 logs.append(log_entry)
-    
-    # Sort by timestamp (newest first)
-    logs.sort(key=lambda x: x['timestamp'], reverse=True)
+                reservoir.add(log_entry, (log_entry['level'], log_entry['service_name']), log_entry['level'] in ('ERROR', 'CRITICAL'))
     
     # Create summary metrics
     summary = {
@@ -87,7 +127,7 @@ def fetch_loki_logs():
     for log in logs:
         level = log['level']
         service = log['service_name']
-        hour = log['hour']
+        hour = log_time.HOUR_LABELS[buckets.hour(log['timestamp_ns'])]
         category = log['category']
         
         summary['by_level'][level] = summary['by_level'].get(level, 0) + 1
@@ -96,7 +136,7 @@ def fetch_loki_logs():
         summary['by_category'][category] = summary['by_category'].get(category, 0) + 1
     
     return {
-        'logs': logs[:50],  # Limit to 50 most recent for display
+        'logs': [buckets.display_fields(log) for log in reservoir.sample(sort_key=lambda x: x['timestamp_ns'])],
         'summary': summary,
         'last_updated': datetime.now().isoformat()
     }
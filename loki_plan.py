@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Stream-aware Loki query planning for the standalone data loaders
+Asks /loki/api/v1/series for the streams active in the window and splits the fetch into narrow per-service selectors instead of one query over every stream
+"""
+
+import re
+import json
+
+# Streams the loaders read; planned queries narrow it and never widen it
+STREAM_SELECTOR = '{job=~".+"}'
+
+GROUP_LABEL = 'service_name'
+
+# Each label value gets its own query up to this many; more values share queries
+MAX_GROUPS = 4
+
+
+def group_selector(values, base=STREAM_SELECTOR, label=GROUP_LABEL):
+    """Base selector narrowed to the given label values"""
+    if len(values) == 1:
+        matcher = f"{label}={json.dumps(values[0])}"
+    else:
+        matcher = f"{label}=~{json.dumps('|'.join(re.escape(value) for value in sorted(values)))}"
+    return f"{base[:-1]}, {matcher}}}"
+
+
+def plan(streams, line_filter=None, base=STREAM_SELECTOR, label=GROUP_LABEL):
+    """LogQL queries covering the given /series label sets, balanced by stream count"""
+    counts = {}
+    unlabeled = 0
+    for stream in streams:
+        value = stream.get(label)
+        if value:
+            counts[value] = counts.get(value, 0) + 1
+        else:
+            unlabeled += 1
+    
+    # Largest groups first, each into the currently lightest query
+    groups = max(1, min(MAX_GROUPS, len(counts)))
+    bins = [[0, []] for _ in range(groups)]
+    for value in sorted(counts, key=lambda value: (-counts[value], value)):
+        lightest = min(bins, key=lambda item: item[0])
+        lightest[0] += counts[value]
+        lightest[1].append(value)
+    
+    selectors = [group_selector(values, base, label) for _, values in bins if values]
+    if unlabeled:
+        # Streams without the label match it as an empty string
+        selectors.append(f"{base[:-1]}, {label}=\"\"}}")
+    
+    pipeline = f" |= {json.dumps(line_filter)}" if line_filter else ''
+    return [selector + pipeline for selector in selectors]
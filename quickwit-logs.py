@@ -5,10 +5,30 @@ Fetches security logs from Quickwit API and outputs JSON for dashboards
 """
 
 import json
+import re
 import urllib.request
 from datetime import datetime, timedelta
 import sys
 
+import log_sampling
+import log_time
+
+# Fallbacks for events that only name the address and user in the body text
+_IPV4 = r'(?<![\d.])((?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(?:\.(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3})(?!\.?\d)'
+SOURCE_IP_RE = re.compile(r'(?i)\b(?:from|src|source|client|remote)(?:[_ ]?ip)?\s*[=:]?\s*' + _IPV4)
+ANY_IP_RE = re.compile(_IPV4)
+USERNAME_RE = re.compile(
+    r'(?i)\b(?:user(?:name)?\s*[=:]\s*|(?:for|by|as)\s+(?:(?:invalid|illegal)\s+)?user\s+)["\']?([\w][\w.@-]{0,63})'
+)
+
+def from_message(message, *patterns):
+    """First capture of the first pattern found in the message"""
+    for pattern in patterns:
+        match = pattern.search(message)
+        if match:
+            return match.group(1)
+    return ''
+
 def fetch_quickwit_logs():
     """Fetch security logs from Quickwit API"""
     quickwit_endpoint = "http://192.168.122.27:7280"
@@ -42,31 +62,30 @@ def fetch_quickwit_logs():
     
     # Process logs for Observable Framework
     logs = []
+    buckets = log_time.TimeBuckets()
+    # Display sample per severity and service; errors are always kept
+    reservoir = log_sampling.StratifiedReservoir(size=50, seed=log_sampling.window_seed(start_time, end_time))
     if 'hits' in data:
         for hit in data['hits']:
-            timestamp = datetime.fromtimestamp(hit['timestamp_nanos'] / 1e9)
-            
             # Extract attributes safely
             attributes = hit.get('attributes', {})
             body = hit.get('body', {})
             message = body.get('message', '') if isinstance(body, dict) else str(body)
             
+            # Display strings are formatted only for the rows that are output
             log_entry = {
-                'timestamp': timestamp.isoformat(),
-                'time': timestamp.isoformat(),
+                'timestamp_ns': int(hit['timestamp_nanos']),
                 'message': message,
                 'severity': hit.get('severity_text', 'INFO'),
                 'service_name': hit.get('service_name', 'unknown'),
                 'category': attributes.get('category', 'general'),
                 'log_type': attributes.get('log_type', 'security'),
-                'source_ip': attributes.get('source_ip', ''),
+                'source_ip': attributes.get('source_ip', '') or from_message(message, SOURCE_IP_RE, ANY_IP_RE),
                 'event_type': attributes.get('event_type', ''),
                 'attack_type': attributes.get('attack_type', ''),
                 'threat_level': attributes.get('threat_level', ''),
-                'username': attributes.get('username', ''),
+                'username': attributes.get('username', '') or from_message(message, USERNAME_RE),
                 'action': attributes.get('action', ''),
-                'hour': timestamp.strftime('%H:00'),
-                'date': timestamp.strftime('%Y-%m-%d'),
                 'is_demo': '[DEMO]' in message or attributes.get('demo_data') == 'true'
             }
             
@@ -85,9 +104,7 @@ def fetch_quickwit_logs():
             log_entry['severity_level'] = severity_map.get(log_entry['severity'], 1)
             
             logs.append(log_entry)
-    
-    # Sort by timestamp (newest first)
-    logs.sort(key=lambda x: x['timestamp'], reverse=True)
+            reservoir.add(log_entry, (log_entry['severity'], log_entry['service_name']), log_entry['severity_level'] >= 3)
     
     # Create security analytics summary
     summary = {
@@ -106,7 +123,7 @@ def fetch_quickwit_logs():
         severity = log['severity']
         category = log['event_category']
         event_type = log['event_type']
-        hour = log['hour']
+        hour = log_time.HOUR_LABELS[buckets.hour(log['timestamp_ns'])]
         source_ip = log['source_ip']
         attack_type = log['attack_type']
         
@@ -128,12 +145,14 @@ def fetch_quickwit_logs():
     failed_logins = [log for log in logs if 'failed' in log['message'].lower() and 'login' in log['message'].lower()]
     attacks = [log for log in logs if log['event_category'] == 'attack']
     
+    by_time = lambda x: x['timestamp_ns']
+    display = lambda rows: [buckets.display_fields(log) for log in rows]
     return {
-        'logs': logs[:50],  # Limit to 50 most recent for display
+        'logs': display(reservoir.sample(sort_key=by_time)),  # Newest first
         'summary': summary,
-        'critical_events': critical_events[:10],
-        'failed_logins': failed_logins[:10],
-        'recent_attacks': attacks[:10],
+        'critical_events': display(log_sampling.newest(critical_events, 10, by_time)),
+        'failed_logins': display(log_sampling.newest(failed_logins, 10, by_time)),
+        'recent_attacks': display(log_sampling.newest(attacks, 10, by_time)),
         'last_updated': datetime.now().isoformat()
     }
 
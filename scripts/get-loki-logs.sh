@@ -18,9 +18,30 @@ echo "----------------------------------------"
 END_TIME=$(date +%s)000000000  # nanoseconds
 START_TIME=$((END_TIME - 86400000000000))  # 24 hours ago in nanoseconds
 
-# Query Loki for all recent logs
+# Narrow the selector to the services with streams in the window; the series
+# lookup only reads the index, so Loki does not open every stream in the tenant
+SELECTOR=$(curl -s -G "http://${CLUSTER_IP}:3100/loki/api/v1/series" \
+    --data-urlencode "match[]={job=~\".+\"}" \
+    --data-urlencode "start=$START_TIME" \
+    --data-urlencode "end=$END_TIME" | \
+jq -r '
+if (.data | length) > 0 and all(.data[]; .service_name) then
+    "{job=~\".+\", service_name=~\"" + ([.data[].service_name] | unique | map(gsub("(?<c>[.*+?()|\\[\\]{}^$\\\\])"; "\\\\\(.c)")) | join("|")) + "\"}"
+else
+    "{job=~\".+\"}"
+end' 2>/dev/null)
+SELECTOR=${SELECTOR:-'{job=~".+"}'}
+
+# Optional line filter pushed down into LogQL, e.g. LINE_FILTER=error
+QUERY="$SELECTOR"
+if [ -n "$LINE_FILTER" ]; then
+    QUERY="$QUERY |= \"$LINE_FILTER\""
+fi
+echo "Query: $QUERY"
+
+# Query Loki for recent logs
 curl -s -G "$LOKI_QUERY_URL" \
-    --data-urlencode "query={job=~\".+\"}" \
+    --data-urlencode "query=$QUERY" \
     --data-urlencode "start=$START_TIME" \
     --data-urlencode "end=$END_TIME" \
     --data-urlencode "limit=10" \
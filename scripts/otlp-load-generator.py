@@ -0,0 +1,628 @@
+#!/usr/bin/env python3
+"""
+OTLP/HTTP Log Load Generator
+Sends synthetic operational and security log records to an OpenTelemetry
+Collector and reports the achieved throughput and request latency
+
+Records mimic the payloads of the former test-operational-logs.sh and
+test-security-logs.sh scripts (log_type, category, user, source IP and HTTP
+attributes) with configurable mix and cardinalities. Senders are threads that
+each keep one keep-alive connection; --processes adds worker processes when a
+single interpreter cannot generate records fast enough. Batches are encoded as
+OTLP protobuf (hand-encoded, no dependencies) or OTLP JSON, gzip-compressed.
+
+Run with --local-sink to send to an in-process stand-in for the collector and
+check that every record arrived, or with --sink PORT to run only the stand-in.
+"""
+
+import argparse
+import gzip
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ENDPOINT = os.getenv('OTEL_HTTP_ENDPOINT', f"http://{os.getenv('CLUSTER_IP', '192.168.122.27')}:4318")
+LOGS_PATH = '/v1/logs'
+
+# deployment.environment resource attribute of every record
+ENVIRONMENT = os.getenv('LOADGEN_ENVIRONMENT', 'load-test')
+
+# Fast compression keeps the generator from becoming the bottleneck
+GZIP_LEVEL = 1
+
+# OTLP severity numbers
+SEVERITY_NUMBERS = {'DEBUG': 5, 'INFO': 9, 'WARN': 13, 'ERROR': 17, 'FATAL': 21}
+
+SERVICE_BASES = {
+    'operational': ['web-server', 'api-gateway', 'payment-service', 'user-service', 'inventory', 'scheduler'],
+    'security': ['ssh-server', 'audit-daemon', 'firewall', 'auth-service', 'vpn-gateway', 'ids'],
+}
+USER_BASES = ['admin', 'root', 'john', 'alice', 'svc-backup', 'deploy', 'guest', 'oracle']
+HTTP_PATHS = ['/api/users', '/api/orders', '/api/payments', '/login', '/admin', '/health', '/static/app.js']
+HTTP_METHODS = ['GET', 'GET', 'GET', 'POST', 'PUT', 'DELETE']
+
+
+class RecordFactory:
+    """Builds random log records with bounded label and attribute cardinality"""
+
+    def __init__(self, mix, services, users, source_ips, seed=None):
+        self.rng = random.Random(seed)
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.services = {
+            kind: [bases[i % len(bases)] + (f"-{i // len(bases)}" if i >= len(bases) else '') for i in range(services)]
+            for kind, bases in SERVICE_BASES.items()
+        }
+        self.users = [f"{USER_BASES[i % len(USER_BASES)]}{i // len(USER_BASES) or ''}" for i in range(users)]
+        self.source_ips = [f"203.0.{i // 250 % 256}.{i % 250 + 1}" for i in range(source_ips)]
+        self.sequence = 0
+
+    def record(self, time_ns):
+        """(service, time_ns, severity, body, attributes) of one random record"""
+        rng = self.rng
+        kind = rng.choices(self.kinds, self.weights)[0]
+        service = rng.choice(self.services[kind])
+        self.sequence += 1
+        if kind == 'security':
+            severity, body, attributes = self._security(rng)
+        else:
+            severity, body, attributes = self._operational(rng)
+        attributes.append(('log_type', kind))
+        attributes.append(('session_id', f"sess-{rng.randrange(10 * len(self.users)):x}"))
+        return service, time_ns, severity, body, attributes
+
+    def _operational(self, rng):
+        """An HTTP, database or health record for Loki"""
+        roll = rng.random()
+        if roll < 0.6:
+            method, path = rng.choice(HTTP_METHODS), rng.choice(HTTP_PATHS)
+            status = rng.choices([200, 201, 304, 404, 500, 503], [70, 5, 10, 8, 5, 2])[0]
+            latency = round(rng.lognormvariate(3.5, 0.8), 1)
+            severity = 'ERROR' if status >= 500 else 'WARN' if status >= 400 else 'INFO'
+            return severity, f"Processed HTTP request {method} {path} status={status} in {latency}ms", [
+                ('category', 'application'), ('http.method', method), ('http.url', path),
+                ('http.status_code', status), ('response_time_ms', latency),
+                ('request_id', f"req-{self.sequence:x}"), ('user_id', rng.choice(self.users)),
+            ]
+        if roll < 0.85:
+            duration = round(rng.expovariate(1 / 40), 1)
+            severity = 'WARN' if duration > 200 else 'INFO'
+            return severity, f"Database query completed in {duration}ms", [
+                ('category', 'database'), ('db.system', 'postgresql'), ('duration_ms', duration),
+                ('rows_returned', rng.randrange(500)),
+            ]
+        if roll < 0.95:
+            return 'INFO', "Health check passed", [('category', 'health'), ('probe', 'readiness')]
+        return 'ERROR', f"Connection pool exhausted after {rng.randrange(5, 60)}s", [
+            ('category', 'database'), ('pool_size', 20), ('waiting_requests', rng.randrange(1, 200)),
+        ]
+
+    def _security(self, rng):
+        """An authentication, audit, firewall or access record for Quickwit"""
+        user, ip = rng.choice(self.users), rng.choice(self.source_ips)
+        roll = rng.random()
+        if roll < 0.35:
+            return 'WARN', f"Failed SSH login attempt for user {user} from {ip}", [
+                ('category', 'auth'), ('event_type', 'authentication_failure'), ('protocol', 'SSH'),
+                ('username', user), ('source_ip', ip), ('source_port', rng.randrange(1024, 65536)),
+                ('failed_attempts_count', rng.randrange(1, 20)), ('blocked_by_policy', rng.random() < 0.2),
+            ]
+        if roll < 0.6:
+            return 'INFO', f"Accepted publickey for {user} from {ip} port {rng.randrange(1024, 65536)} ssh2", [
+                ('category', 'auth'), ('event_type', 'authentication_success'), ('protocol', 'SSH'),
+                ('username', user), ('source_ip', ip), ('auth_method', 'publickey'),
+            ]
+        if roll < 0.75:
+            return 'INFO', f"Privilege escalation: user {user} executed sudo command", [
+                ('category', 'audit'), ('event_type', 'privilege_escalation'), ('username', user),
+                ('command', 'sudo systemctl restart nginx'), ('effective_uid', 0), ('risk_score', rng.randrange(1, 10)),
+            ]
+        if roll < 0.9:
+            return 'ERROR', f"Firewall blocked suspicious connection attempt from {ip} - potential port scan detected", [
+                ('category', 'security'), ('event_type', 'blocked_connection'), ('attack_type', 'port_scan'),
+                ('source_ip', ip), ('destination_port', rng.choice([22, 445, 3389, 5432])), ('protocol', 'TCP'),
+                ('rule_action', 'DENY'), ('confidence_score', round(rng.random(), 2)),
+            ]
+        path = rng.choice(HTTP_PATHS)
+        return 'WARN', f"Unauthorized access to {path} denied for user {user}", [
+            ('category', 'access'), ('event_type', 'access_denied'), ('username', user), ('source_ip', ip),
+            ('http.url', path), ('http.status_code', 403),
+        ]
+
+
+def group_by_service(records):
+    """Records of a batch grouped under their resource"""
+    services = {}
+    for record in records:
+        services.setdefault(record[0], []).append(record)
+    return services
+
+
+# OTLP JSON encoding
+
+def _json_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': value}
+
+
+def encode_json(records):
+    """ExportLogsServiceRequest in the OTLP/HTTP JSON encoding"""
+    resource_logs = []
+    for service, entries in group_by_service(records).items():
+        resource_logs.append({
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': {'stringValue': service}},
+                {'key': 'deployment.environment', 'value': {'stringValue': ENVIRONMENT}},
+            ]},
+            'scopeLogs': [{
+                'scope': {'name': 'otlp-load-generator'},
+                'logRecords': [{
+                    'timeUnixNano': str(time_ns),
+                    'severityNumber': SEVERITY_NUMBERS[severity],
+                    'severityText': severity,
+                    'body': {'stringValue': body},
+                    'attributes': [{'key': key, 'value': _json_value(value)} for key, value in attributes],
+                } for _, time_ns, severity, body, attributes in entries],
+            }],
+        })
+    return json.dumps({'resourceLogs': resource_logs}, separators=(',', ':')).encode('utf-8')
+
+
+# OTLP protobuf encoding, field numbers from opentelemetry/proto/logs/v1/logs.proto
+
+_SMALL_VARINTS = [bytes([value]) for value in range(0x80)]
+
+
+def _varint(value):
+    if value < 0x80:
+        return _SMALL_VARINTS[value]
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _field(number, payload):
+    """Length-delimited field"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _string(number, value):
+    return _field(number, value.encode('utf-8'))
+
+
+def _any_value(value):
+    if isinstance(value, bool):
+        return _varint(2 << 3) + _varint(int(value))
+    if isinstance(value, int):
+        return _varint(3 << 3) + _varint(value & 0xFFFFFFFFFFFFFFFF)
+    if isinstance(value, float):
+        return _varint(4 << 3 | 1) + struct.pack('<d', value)
+    return _string(1, value)
+
+
+def _key_value(key, value):
+    return _string(1, key) + _field(2, _any_value(value))
+
+
+_ATTRIBUTES = {}
+
+
+def _attribute(key, value):
+    """LogRecord attributes field, memoized since most attribute values repeat"""
+    encoded = _ATTRIBUTES.get((key, value, type(value)))
+    if encoded is None:
+        encoded = _field(6, _key_value(key, value))
+        if len(_ATTRIBUTES) < 100_000:
+            _ATTRIBUTES[(key, value, type(value))] = encoded
+    return encoded
+
+
+def encode_protobuf(records):
+    """ExportLogsServiceRequest in the OTLP/HTTP protobuf encoding"""
+    request = bytearray()
+    scope = _field(1, _string(1, 'otlp-load-generator'))
+    for service, entries in group_by_service(records).items():
+        log_records = bytearray()
+        for _, time_ns, severity, body, attributes in entries:
+            log_record = (
+                _varint(1 << 3 | 1) + struct.pack('<Q', time_ns)
+                + _varint(2 << 3) + _varint(SEVERITY_NUMBERS[severity])
+                + _string(3, severity)
+                + _field(5, _string(1, body))
+                + b''.join([_attribute(key, value) for key, value in attributes])
+            )
+            log_records += _field(2, log_record)
+        resource = _field(1, _field(1, _key_value('service.name', service))
+                          + _field(1, _key_value('deployment.environment', ENVIRONMENT)))
+        request += _field(1, resource + _field(2, scope + log_records))
+    return bytes(request)
+
+
+ENCODINGS = {
+    'protobuf': ('application/x-protobuf', encode_protobuf),
+    'json': ('application/json', encode_json),
+}
+
+
+def _read_field(data, position):
+    """(field number, wire type, value or (start, end), next position) of a protobuf field"""
+    key, position = _read_varint(data, position)
+    number, wire_type = key >> 3, key & 7
+    if wire_type == 0:
+        value, position = _read_varint(data, position)
+        return number, wire_type, value, position
+    if wire_type == 1:
+        return number, wire_type, None, position + 8
+    if wire_type == 5:
+        return number, wire_type, None, position + 4
+    if wire_type == 2:
+        length, position = _read_varint(data, position)
+        return number, wire_type, (position, position + length), position + length
+    raise ValueError(f"Unsupported wire type {wire_type}")
+
+
+def _read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, position
+
+
+def _children(data, span, number):
+    """Spans of the length-delimited fields with a given number inside a message"""
+    position, end = span
+    while position < end:
+        field, wire_type, value, position = _read_field(data, position)
+        if field == number and wire_type == 2:
+            yield value
+
+
+def count_records(body, content_type):
+    """Log records in an ExportLogsServiceRequest of either encoding"""
+    if 'json' in content_type:
+        request = json.loads(body)
+        return sum(len(scope.get('logRecords', [])) for resource in request.get('resourceLogs', [])
+                   for scope in resource.get('scopeLogs', []))
+    return sum(1 for resource in _children(body, (0, len(body)), 1)
+               for scope in _children(body, resource, 2)
+               for _ in _children(body, scope, 2))
+
+
+# Local stand-in for the collector's OTLP/HTTP receiver
+
+class SinkStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = 0
+        self.requests = 0
+        self.bytes = 0
+
+
+def make_sink(port, delay_ms=0.0, host='127.0.0.1'):
+    """HTTP server accepting OTLP/HTTP log exports and counting their records"""
+    stats = SinkStats()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            content_type = self.headers.get('Content-Type', '')
+            try:
+                raw = gzip.decompress(body) if self.headers.get('Content-Encoding') == 'gzip' else body
+                records = count_records(raw, content_type)
+            except (OSError, ValueError, IndexError) as e:
+                self._reply(400, f"bad request: {e}".encode('utf-8'), 'text/plain')
+                return
+            if delay_ms:
+                time.sleep(delay_ms / 1000)
+            with stats.lock:
+                stats.records += records
+                stats.requests += 1
+                stats.bytes += len(body)
+            # Empty ExportLogsServiceResponse means full success
+            self._reply(200, b'{}' if 'json' in content_type else b'', content_type or 'application/x-protobuf')
+
+        def _reply(self, status, payload, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server, stats
+
+
+def run_sink(port, delay_ms):
+    """Serve the stand-in and print received records per second until interrupted"""
+    server, stats = make_sink(port, delay_ms, host='0.0.0.0')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"OTLP sink listening on :{server.server_address[1]}{LOGS_PATH}")
+    last = 0
+    try:
+        while True:
+            time.sleep(1)
+            with stats.lock:
+                records = stats.records
+            print(f"{records - last:>10,} records/s  {records:>14,} total")
+            last = records
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+# Senders
+
+def sender(endpoint, args, duration, records_budget, rate, phase, seed, results):
+    """One sender thread: build, encode and post batches over a single keep-alive connection"""
+    url = urllib.parse.urlsplit(endpoint)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    path = url.path.rstrip('/') + LOGS_PATH
+    content_type, encode = ENCODINGS[args.encoding]
+    headers = {'Content-Type': content_type}
+    if args.compression == 'gzip':
+        headers['Content-Encoding'] = 'gzip'
+
+    factory = RecordFactory(args.mix, args.services, args.users, args.source_ips, seed)
+    connection = None
+    interval = args.batch_size / rate if rate else 0
+    deadline = time.perf_counter() + duration
+    # Senders start spread over one interval so a rate-limited run does not send in bursts
+    next_send = time.perf_counter() + interval * phase
+    result = {'latencies': [], 'statuses': {}, 'attempted': 0, 'delivered': 0,
+              'raw_bytes': 0, 'wire_bytes': 0, 'encode_seconds': 0.0}
+
+    while time.perf_counter() < deadline and (records_budget is None or result['attempted'] < records_budget):
+        if interval:
+            # Open-loop schedule: a slow response delays later batches but never lowers the offered rate
+            if next_send >= deadline:
+                break
+            wait = next_send - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            next_send += interval
+
+        size = args.batch_size if records_budget is None else min(args.batch_size, records_budget - result['attempted'])
+        started = time.perf_counter()
+        now_ns = time.time_ns()
+        payload = encode([factory.record(now_ns + i) for i in range(size)])
+        result['raw_bytes'] += len(payload)
+        if args.compression == 'gzip':
+            payload = gzip.compress(payload, compresslevel=GZIP_LEVEL)
+        result['wire_bytes'] += len(payload)
+        result['encode_seconds'] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = connection_class(url.hostname, url.port, timeout=args.timeout)
+            connection.request('POST', path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+            if response.will_close:
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as e:
+            status = type(e).__name__
+            if connection is not None:
+                connection.close()
+            connection = None
+        result['latencies'].append(time.perf_counter() - started)
+        result['statuses'][status] = result['statuses'].get(status, 0) + 1
+        result['attempted'] += size
+        if status == 200:
+            result['delivered'] += size
+
+    if connection is not None:
+        connection.close()
+    results.append(result)
+
+
+def run_senders(endpoint, args, senders, budgets, offset, seed):
+    """Run a group of sender threads to completion; returns their results"""
+    total = args.processes * args.concurrency
+    rate = args.rate / total if args.rate else 0
+    duration = args.duration if args.duration else float('inf')
+    results = []
+    threads = [
+        threading.Thread(target=sender, args=(endpoint, args, duration, budgets[i], rate, (offset + i) / total, seed + i, results))
+        for i in range(senders)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def _run_senders(payload):
+    return run_senders(*payload)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(results, elapsed):
+    """Merged counters, throughput and latency percentiles of all senders"""
+    latencies = sorted(latency for result in results for latency in result['latencies'])
+    statuses = {}
+    for result in results:
+        for status, count in result['statuses'].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    delivered = sum(result['delivered'] for result in results)
+    raw_bytes = sum(result['raw_bytes'] for result in results)
+    wire_bytes = sum(result['wire_bytes'] for result in results)
+    return {
+        'elapsed_seconds': round(elapsed, 3),
+        'requests': len(latencies),
+        'records_attempted': sum(result['attempted'] for result in results),
+        'records_delivered': delivered,
+        'records_per_second': round(delivered / elapsed, 1) if elapsed else 0.0,
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'raw_megabytes': round(raw_bytes / 1e6, 3),
+        'wire_megabytes': round(wire_bytes / 1e6, 3),
+        'encode_ms_per_request': round(sum(r['encode_seconds'] for r in results) * 1e3 / max(1, len(latencies)), 3),
+        'latency_ms': {name: round(percentile(latencies, fraction) * 1e3, 3)
+                       for name, fraction in [('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)]},
+        'statuses': statuses,
+    }
+
+
+def print_report(summary, endpoint, args):
+    latency = summary['latency_ms']
+    print(f"Endpoint:   {endpoint}{LOGS_PATH} ({args.encoding}, {args.compression}, "
+          f"{args.processes}x{args.concurrency} senders, batches of {args.batch_size})")
+    print(f"Records:    {summary['records_delivered']:,} delivered of {summary['records_attempted']:,} "
+          f"in {summary['elapsed_seconds']:.2f} s")
+    print(f"Throughput: {summary['records_per_second']:,.0f} records/s, "
+          f"{summary['requests_per_second']:,.1f} requests/s, "
+          f"{summary['wire_megabytes'] / max(summary['elapsed_seconds'], 1e-9):.2f} MB/s on the wire "
+          f"({summary['raw_megabytes']:.1f} MB raw, {summary['wire_megabytes']:.1f} MB sent)")
+    print(f"Latency:    p50 {latency['p50']:.2f} ms  p90 {latency['p90']:.2f} ms  "
+          f"p99 {latency['p99']:.2f} ms  max {latency['max']:.2f} ms")
+    print(f"Encoding:   {summary['encode_ms_per_request']:.2f} ms per request")
+    print(f"Responses:  {', '.join(f'{status}={count:,}' for status, count in sorted(summary['statuses'].items()))}")
+
+
+def parse_mix(value):
+    """{'security': 0.3, 'operational': 0.7} from 'security=0.3,operational=0.7'"""
+    mix = {}
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in SERVICE_BASES:
+            raise argparse.ArgumentTypeError(f"unknown record kind {kind!r}, expected {', '.join(SERVICE_BASES)}")
+        try:
+            mix[kind] = float(weight) if weight else 1.0
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight {weight!r} for {kind}")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("at least one record kind needs a positive weight")
+    return mix
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Send synthetic operational and security logs to an OTLP/HTTP endpoint and report throughput',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  %(prog)s --records 5 --mix security                     # A few security logs, like test-security-logs.sh
+  %(prog)s --duration 60 --rate 20000 --concurrency 16    # One minute at 20k records/s
+  %(prog)s --local-sink --duration 10                     # Self-test against an in-process sink
+  %(prog)s --sink 4318                                    # Run only the sink, for another generator
+        """
+    )
+    parser.add_argument('--endpoint', default=DEFAULT_ENDPOINT,
+                        help='OTLP/HTTP base URL (default: $OTEL_HTTP_ENDPOINT or http://$CLUSTER_IP:4318)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('operational=0.7,security=0.3'),
+                        help='record kinds and weights (default: operational=0.7,security=0.3)')
+    parser.add_argument('--services', type=int, default=6, help='distinct service.name values per kind (default: 6)')
+    parser.add_argument('--users', type=int, default=50, help='distinct user names (default: 50)')
+    parser.add_argument('--source-ips', type=int, default=500, help='distinct source IPs (default: 500)')
+    parser.add_argument('--records', type=int, help='stop after this many records')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds (default: 10 without --records)')
+    parser.add_argument('--rate', type=float, default=0, help='target records/s across all senders, 0 for as fast as possible')
+    parser.add_argument('--batch-size', type=int, default=500, help='records per request (default: 500)')
+    parser.add_argument('--concurrency', type=int, default=8, help='sender threads per process, one connection each (default: 8)')
+    parser.add_argument('--processes', type=int, default=1, help='generator processes (default: 1)')
+    parser.add_argument('--encoding', choices=sorted(ENCODINGS), default='protobuf', help='OTLP encoding (default: protobuf)')
+    parser.add_argument('--compression', choices=['gzip', 'none'], default='gzip', help='request compression (default: gzip)')
+    parser.add_argument('--timeout', type=float, default=10.0, help='request timeout in seconds (default: 10)')
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: 0)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('--local-sink', action='store_true', help='send to an in-process OTLP sink and verify the record count')
+    parser.add_argument('--sink', type=int, metavar='PORT', help='only run the OTLP sink on PORT')
+    parser.add_argument('--sink-delay-ms', type=float, default=0.0, help='sink processing delay per request (default: 0)')
+
+    args = parser.parse_args(argv)
+    if args.records is None and args.duration is None:
+        args.duration = 10.0
+    if min(args.batch_size, args.concurrency, args.processes, args.services, args.users, args.source_ips) < 1:
+        parser.error('--batch-size, --concurrency, --processes and cardinalities must be positive')
+    return args
+
+
+def main(argv=None):
+    """Main entry point"""
+    args = parse_args(argv)
+
+    if args.sink is not None:
+        run_sink(args.sink, args.sink_delay_ms)
+        return 0
+
+    endpoint = args.endpoint.rstrip('/')
+    sink = stats = None
+    if args.local_sink:
+        sink, stats = make_sink(0, args.sink_delay_ms)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        endpoint = f"http://127.0.0.1:{sink.server_address[1]}"
+
+    senders = args.processes * args.concurrency
+    if args.records is None:
+        budgets = [None] * senders
+    else:
+        budgets = [args.records // senders + (i < args.records % senders) for i in range(senders)]
+
+    started = time.perf_counter()
+    if args.processes == 1:
+        results = run_senders(endpoint, args, senders, budgets, 0, args.seed * 1000)
+    else:
+        payloads = [
+            (endpoint, args, args.concurrency, budgets[p * args.concurrency:(p + 1) * args.concurrency],
+             p * args.concurrency, (args.seed * 1000 + p) * 1000)
+            for p in range(args.processes)
+        ]
+        with multiprocessing.Pool(args.processes) as pool:
+            results = [result for group in pool.map(_run_senders, payloads) for result in group]
+    summary = summarize(results, time.perf_counter() - started)
+
+    if sink is not None:
+        sink.shutdown()
+        summary['sink_records'] = stats.records
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_report(summary, endpoint, args)
+        if sink is not None:
+            print(f"Sink:       {stats.records:,} records in {stats.requests:,} requests")
+
+    failed = summary['records_delivered'] < summary['records_attempted']
+    if sink is not None and stats.records != summary['records_delivered']:
+        print(f"Sink received {stats.records:,} records, expected {summary['records_delivered']:,}", file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())